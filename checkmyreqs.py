@@ -6,154 +6,4153 @@ checkmyreqs
 
 Parses a requirements file to check what libraries are listed as supported with a given Python version
 
-Uses xmlrpc pypi methods as defined here: http://wiki.python.org/moin/PyPIXmlRpc
+Looks packages up with the pypi JSON API (https://warehouse.pypa.io/api-reference/json.html), or with the
+xmlrpc pypi methods as defined here: http://wiki.python.org/moin/PyPIXmlRpc
 """
 
 from __future__ import print_function
 
-import argparse
+import importlib
 import os
 import re
 import sys
 import errno
+import fnmatch
+import threading
+import time
+import types
+import zlib
 
-from blessings import Terminal
+from collections import OrderedDict, namedtuple
+from functools import partial
+from itertools import groupby, product
 
-TERMINAL = Terminal()
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class LazyModule(object):
+    """
+    Stands in for a module that is only imported when one of its attributes is first used,
+    so that `import checkmyreqs` and --help don't pay for the network, database and terminal modules
+
+    Names are tried in turn for each attribute, as modules moved between Python 2 and 3
+    """
+
+    def __init__(self, *names):
+        self._names = names
+        self._modules = None
+
+    def __getattr__(self, attribute):
+        if self._modules is None:
+            modules = []
+            for name in self._names:
+                try:
+                    modules.append(importlib.import_module(name))
+                except ImportError:
+                    pass
+            if not modules:
+                raise ImportError('No module named {}'.format(' or '.join(self._names)))
+            self._modules = modules
+
+        for module in self._modules:
+            if hasattr(module, attribute):
+                return getattr(module, attribute)
+
+        raise AttributeError('{} has no attribute {}'.format(self._names[0], attribute))
+
+
+argparse = LazyModule('argparse')
+blessings = LazyModule('blessings')
+email_utils = LazyModule('email.utils')
+http_client = LazyModule('http.client', 'httplib')
+json = LazyModule('json')
+multiprocessing_pool = LazyModule('multiprocessing.pool')
+random = LazyModule('random')
+socket = LazyModule('socket')
+socketserver = LazyModule('socketserver', 'SocketServer')
+sqlite3 = LazyModule('sqlite3')
+urllib_error = LazyModule('urllib.error', 'urllib2')
+urllib_parse = LazyModule('urllib.parse', 'urlparse', 'urllib')
+xmlrpc_client = LazyModule('xmlrpc.client', 'xmlrpclib')
+
+_TERMINAL = None
+
+
+def get_terminal():
+    """
+    Creates the terminal on first use, as probing the tty and terminfo is slow
+    :return: blessings Terminal
+    """
+    global _TERMINAL
+
+    if _TERMINAL is None:
+        _TERMINAL = blessings.Terminal()
+
+    return _TERMINAL
+
+
+def lookup_errors():
+    """
+    :return: errors that fail the lookup of a batch of packages, once retries have run out, instead of the whole run
+    """
+    return (
+        xmlrpc_client.Fault, xmlrpc_client.ProtocolError, urllib_error.HTTPError, http_client.HTTPException,
+        socket.error, ValueError
+    )
+
+
+# Names that used to be created or imported at import time, and are now made on first use
+_LAZY_ATTRIBUTES = {
+    'TERMINAL': get_terminal,
+    'LOOKUP_ERRORS': lookup_errors,
+    'Fault': lambda: xmlrpc_client.Fault,
+    'ProtocolError': lambda: xmlrpc_client.ProtocolError,
+    'HTTPError': lambda: urllib_error.HTTPError,
+    'HTTPException': lambda: http_client.HTTPException,
+}
+
+
+def __getattr__(name):
+    """
+    Module attribute fallback (Python 3.7+), keeping checkmyreqs.TERMINAL and friends working for library users
+    """
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+class LazyAttributesModule(types.ModuleType):
+    """
+    Stands in for this module in sys.modules before Python 3.7, which doesn't call a module's __getattr__
+    Attributes are read from, set on and deleted from the module itself, falling back to its __getattr__
+    """
+
+    def __init__(self, module):
+        super(LazyAttributesModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(
+            (name, value) for name, value in vars(module).items() if name.startswith('__') and name != '__getattr__'
+        )
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        try:
+            return getattr(self.__dict__['_module'], name)
+        except AttributeError:
+            return __getattr__(name)
+
+    def __setattr__(self, name, value):
+        setattr(self.__dict__['_module'], name, value)
+
+    def __delattr__(self, name):
+        delattr(self.__dict__['_module'], name)
+
+    def __dir__(self):
+        return dir(self.__dict__['_module'])
+
+
+if sys.version_info < (3, 7):
+    sys.modules[__name__] = LazyAttributesModule(sys.modules[__name__])
+
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+PYPI_URL = 'https://pypi.python.org/pypi'
+PYPI_JSON_URL = 'https://pypi.org/pypi'
+USER_AGENT = 'checkmyreqs'
+
+# Number of packages looked up on pypi at the same time
+DEFAULT_JOBS = 8
+
+# Number of packages whose lookups are sent to pypi in a single multicall request
+DEFAULT_BATCH_SIZE = 50
+
+# Release lists change when a package is published, so they are only cached for a day
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'checkmyreqs'
+)
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# Metadata snapshot answering lookups in --offline mode, built by `checkmyreqs snapshot build`
+DEFAULT_SNAPSHOT = os.path.join(DEFAULT_CACHE_DIR, 'snapshot.json')
+
+# Unix socket `checkmyreqs serve` listens on, and number of responses it keeps for repeated requests
+DEFAULT_SOCKET = os.path.join(DEFAULT_CACHE_DIR, 'serve.sock')
+RESPONSE_CACHE_SIZE = 256
+# Hosts a TCP server may listen on, as it has no authentication
+LOOPBACK_PATTERN = re.compile(r'^(?:localhost|127(?:\.[0-9]{1,3}){3})$')
+
+DEFAULT_BACKEND = 'json'
+
+# Persistent connections kept open to each host, and seconds an unused one is kept before closing it
+DEFAULT_POOL_SIZE = DEFAULT_JOBS
+DEFAULT_POOL_IDLE_TIMEOUT = 30
+
+# Seconds to wait for the index to answer, and how often to retry a request that failed or was throttled.
+# Retries wait about DEFAULT_BACKOFF * 2 ** attempt seconds, up to DEFAULT_MAX_BACKOFF or as long as
+# the index asks with Retry-After, up to MAX_RETRY_AFTER
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30
+MAX_RETRY_AFTER = 120
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# JSON API redirects followed, e.g. pypi's 301 from a package name to its canonical case, and how many in a row
+REDIRECT_STATUSES = frozenset([301, 302, 307, 308])
+MAX_REDIRECTS = 5
+
+# Requests per second allowed by the client side rate limit, 0 for no limit
+DEFAULT_RATE = 0
+
+# Number of packages whose release list and latest release are kept in memory
+RELEASE_MEMO_SIZE = 4096
+
+# Shared by all worker threads, set up by main()
+METADATA_BACKEND = None
+
+IGNORED_PREFIXES = ['#', 'git+', 'hg+', 'svn+', 'bzr+', '\n', '\r\n']
+
+# Requirements file grammar, see https://pip.pypa.io/en/stable/reference/requirements-file-format/ and PEP 508
+REQUIREMENT_PATTERN = re.compile(r'''
+    ^(?P<name>[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*
+    (?:\[(?P<extras>[^\]]*)\]\s*)?
+    (?:@\s*(?P<url>\S+)\s*|(?P<specifiers>[(~=!<>][^;]*?)\s*)?
+    (?:;\s*(?P<marker>.*?)\s*)?$
+''', re.VERBOSE)
+SPECIFIER_PATTERN = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*([A-Za-z0-9_.*+!-]+)\s*$')
+EXTRA_PATTERN = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?$')
+# Comments start a line or follow whitespace, and options follow the requirement they apply to
+COMMENT_PATTERN = re.compile(r'(?:^|\s+)#.*$')
+OPTIONS_PATTERN = re.compile(r'\s+(?=--?[A-Za-z])')
+# Lines pointing at a url or local path rather than a package on the index
+URL_PATTERN = re.compile(r'^(?:[A-Za-z][A-Za-z0-9+.-]*://|file:|\.{0,2}[/\\])')
+
+# Options of a requirements file that don't change which packages are checked
+IGNORED_OPTIONS = frozenset([
+    '-i', '--index-url', '--extra-index-url', '--no-index', '-f', '--find-links', '--trusted-host', '--pre',
+    '--prefer-binary', '--only-binary', '--no-binary', '--require-hashes', '--use-feature', '-e', '--editable',
+])
+INCLUDE_OPTIONS = frozenset(['-r', '--requirement', '-c', '--constraint'])
+INCLUDE_PATTERN = re.compile(r'^(?P<option>-r|--requirement|-c|--constraint)(?:\s*=\s*|\s*)(?P<path>\S+)$')
+# Options that can follow a requirement on its line
+REQUIREMENT_OPTIONS = frozenset(['--hash', '--global-option', '--install-option', '--config-settings'])
+
+# PEP 440 versions, see https://www.python.org/dev/peps/pep-0440/#appendix-b-parsing-version-strings-with-regular-expressions
+VERSION_PATTERN = re.compile(
+    r'^v?(?:(?P<epoch>[0-9]+)!)?(?P<release>[0-9]+(?:\.[0-9]+)*)'
+    r'(?:[-_.]?(?P<pre>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_n>[0-9]+)?)?'
+    r'(?:-(?P<post_implicit>[0-9]+)|[-_.]?(?P<post>post|rev|r)[-_.]?(?P<post_n>[0-9]+)?)?'
+    r'(?:[-_.]?(?P<dev>dev)[-_.]?(?P<dev_n>[0-9]+)?)?'
+    r'(?:\+[a-z0-9]+(?:[-_.][a-z0-9]+)*)?$',
+    re.IGNORECASE
+)
+# Versions given to -p/--python, either X.Y or a range of minor versions X.Y-X.Z
+PYTHON_VERSION_PATTERN = re.compile(r'^([2-3])\.([0-9]+)$')
+
+# Results of checking a package against a Python version
+COMPATIBLE = 'compatible'
+INCOMPATIBLE = 'incompatible'
+UNSPECIFIED = 'unspecified'
+UNAVAILABLE = 'unavailable'
+ERROR = 'error'
+INVALID = 'invalid'
+# Results of checking the files of a release against a Python version and platform, see WheelIndex
+WHEEL_AVAILABLE = 'wheel-available'
+SDIST_ONLY = 'sdist-only'
+# Results that aren't a problem
+OK_STATUSES = frozenset([COMPATIBLE, WHEEL_AVAILABLE])
+
+# Wheel file names, see https://packaging.python.org/en/latest/specifications/binary-distribution-format/
+WHEEL_FILENAME_PATTERN = re.compile(
+    r'^(?P<name>[^-]+)-(?P<version>[^-]+)(?:-(?P<build>[0-9][^-]*))?-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$',
+    re.IGNORECASE
+)
+SDIST_EXTENSIONS = ('.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar', '.zip')
+# Platform tags given to --platform, e.g. manylinux_2_28_x86_64, musllinux_1_2_aarch64 or macosx_11_0_arm64
+PLATFORM_PATTERN = re.compile(
+    r'^(?:(?P<libc>manylinux|musllinux)_(?P<libc_major>[0-9]+)_(?P<libc_minor>[0-9]+)_|'
+    r'(?P<legacy>manylinux1|manylinux2010|manylinux2014)_|macosx_(?P<macos_major>[0-9]+)_(?P<macos_minor>[0-9]+)_)'
+    r'(?P<arch>\w+)$'
+)
+# glibc versions of the manylinux tags that came before PEP 600
+LEGACY_MANYLINUX = OrderedDict([('manylinux2014', (2, 17)), ('manylinux2010', (2, 12)), ('manylinux1', (2, 5))])
+MACOS_ARCHITECTURES = {
+    'x86_64': ['x86_64', 'intel', 'fat64', 'fat32', 'universal2', 'universal'],
+    'arm64': ['arm64', 'universal2'],
+}
+SUPPORTED_TAGS_CACHE_SIZE = 256
+
+# Python versions and implementations listed in trove classifiers
+PYTHON_CLASSIFIER_PATTERN = re.compile(
+    r'^Programming Language :: Python :: (?:(?P<major>[0-9]+)(?:\.(?P<minor>[0-9]+))?(?: :: Only)?|'
+    r'Implementation :: (?P<implementation>.+))$'
+)
+
+# Number of distinct classifier lists whose PythonSupport is kept in memory
+PYTHON_SUPPORT_CACHE_SIZE = 4096
+
+# Clauses of a requires_python specifier, e.g. >=3.6, !=3.0.*
+REQUIRES_PYTHON_CLAUSE_PATTERN = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*([0-9][A-Za-z0-9_.+!-]*?)(\.\*)?\s*$')
+
+# A token of an environment marker: a parenthesis, `and` or `or`, a comparison operator, a quoted string or
+# a variable, e.g. python_version
+MARKER_TOKEN_PATTERN = re.compile(
+    r'''\s*(?:(?P<paren>[()])|(?P<boolean>and|or)\b|(?P<operator>~=|===|==|!=|<=|>=|<|>|not\s+in\b|in\b)|'''
+    r'''(?P<quote>['"])(?P<string>.*?)(?P=quote)|(?P<variable>[A-Za-z_][A-Za-z0-9_.]*))'''
+)
+# Operator a comparison is turned around with, when the variable is on its right, e.g. `"3" > python_version`
+MARKER_REVERSED_OPERATORS = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!=', '===': '==='}
+# Number of distinct markers whose parse is kept in memory
+MARKER_CACHE_SIZE = 4096
+VERSION_SPECIFIER_CACHE_SIZE = 4096
+# Version a dependency without specifiers is reported with, when no release of it can be found
+ANY_VERSION = '*'
+
+PRE_RELEASE_ORDER = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1, 'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
+
+def get_backend():
+    """
+    Returns the metadata backend shared by all lookups
+    :return: MetadataBackend set up by main(), or the pypi JSON API by default
+    """
+    global METADATA_BACKEND
+
+    if METADATA_BACKEND is None:
+        METADATA_BACKEND = BACKENDS[DEFAULT_BACKEND]()
+
+    return METADATA_BACKEND
+
+
+def version_key(version):
+    """
+    Returns a sort key ordering version strings as pip does
+    Versions that aren't PEP 440 compliant sort before all others
+
+    :param version: version string
+    :return: tuple to compare versions with
+    """
+    match = VERSION_PATTERN.match(version.strip())
+
+    if match is None:
+        return 0, version
+
+    release = [int(part) for part in match.group('release').split('.')]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    if match.group('pre'):
+        pre = (0, PRE_RELEASE_ORDER[match.group('pre').lower()], int(match.group('pre_n') or 0))
+    elif match.group('dev') and not (match.group('post') or match.group('post_implicit')):
+        # 1.0.dev1 comes before 1.0a1
+        pre = (-1, 0, 0)
+    else:
+        pre = (1, 0, 0)
+
+    if match.group('post') or match.group('post_implicit'):
+        post = int(match.group('post_n') or match.group('post_implicit') or 0)
+    else:
+        post = -1
+
+    dev = (0, int(match.group('dev_n') or 0)) if match.group('dev') else (1, 0)
+
+    return 1, int(match.group('epoch') or 0), tuple(release), pre, post, dev
+
+
+def is_prerelease(version):
+    """
+    :param version: version string
+    :return: True for alpha, beta, release candidate and development versions
+    """
+    match = VERSION_PATTERN.match(version.strip())
+
+    return match is not None and bool(match.group('pre') or match.group('dev'))
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping that keeps the `maxsize` most recently used entries
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# (index url, package name) to (release list, latest release info or None if it hasn't been fetched yet)
+RELEASE_MEMO = LRUCache(RELEASE_MEMO_SIZE)
+
+
+class RetryPolicy(object):
+    """
+    How often to retry a failed or throttled request, and how long to wait before each retry
+
+    Waits grow exponentially, with full jitter so concurrent workers don't retry in lockstep,
+    unless the index says how long to wait with Retry-After.
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        """
+        :param attempt: number of the attempt that failed, starting at 0
+        :param retry_after: value of the Retry-After header of the failed response, if any
+        :return: seconds to wait before the next attempt
+        """
+        seconds = parse_retry_after(retry_after)
+
+        if seconds is not None:
+            return min(seconds, MAX_RETRY_AFTER)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header, either seconds or an HTTP date
+    :return: seconds to wait, or None if value is missing or invalid
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        date = email_utils.parsedate_tz(value)
+        return max(0.0, email_utils.mktime_tz(date) - time.time()) if date else None
+
+
+class TokenBucket(object):
+    """
+    Client side rate limit shared by all worker threads
+    Allows `rate` requests per second on average, in bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request is allowed
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class ConnectionPool(object):
+    """
+    Pool of persistent HTTP(S) connections, shared by all worker threads
+
+    Connections are kept alive and reused for later requests to the same host, which saves a TCP and
+    TLS handshake per request. At most `size` connections are open to a host at a time, and connections
+    unused for more than `idle_timeout` seconds are closed instead of being reused.
+
+    Requests time out after `timeout` seconds. Timeouts, connection errors and throttled or failed
+    responses (RETRY_STATUSES) are retried following `retry`, and when a `rate_limit` TokenBucket is
+    given every attempt waits for it.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_POOL_IDLE_TIMEOUT, timeout=DEFAULT_TIMEOUT,
+                 retry=None, rate_limit=None):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.rate_limit = rate_limit
+        # (scheme, host) to a list of (connection, time it was last used), and to a semaphore of open connections
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key):
+        """
+        :return: tuple of an idle connection to the host, or a new one, and whether it was reused
+        """
+        now = time.time()
+
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used <= self.idle_timeout:
+                    return connection, True
+                connection.close()
+
+        return self._connect(key), False
+
+    def _connect(self, key):
+        scheme, host = key
+        connection_class = http_client.HTTPSConnection if scheme == 'https' else http_client.HTTPConnection
+        return connection_class(host, timeout=self.timeout)
+
+    def _checkin(self, key, connection):
+        with self._lock:
+            self._idle.setdefault(key, []).append((connection, time.time()))
+
+    @staticmethod
+    def _send(connection, method, path, body, headers):
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        data = response.read()
+        response_headers = dict((name.lower(), value) for name, value in response.getheaders())
+
+        return response.status, response.reason, response_headers, data, response.will_close
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Makes a request over a pooled connection, blocking while `size` requests to the host are in progress
+        Failed attempts are retried, the last response is returned or the last error raised once retries run out
+
+        :param method: HTTP method
+        :param url: absolute url
+        :param body: request body
+        :param headers: dict of request headers
+        :return: tuple of response status, reason, headers (with lowercase names) and decompressed body
+        """
+        parts = urllib_parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', USER_AGENT)
+        headers['Accept-Encoding'] = 'gzip'
+
+        attempt = 0
+        while True:
+            if self.rate_limit is not None:
+                self.rate_limit.acquire()
+
+            try:
+                response = self._request_once(key, method, path, body, headers)
+            except (http_client.HTTPException, socket.error):
+                if attempt >= self.retry.retries:
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                status, _, response_headers, _ = response
+                if status not in RETRY_STATUSES or attempt >= self.retry.retries:
+                    return response
+                delay = self.retry.delay(attempt, response_headers.get('retry-after'))
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _request_once(self, key, method, path, body, headers):
+        with self._lock:
+            slot = self._slots.setdefault(key, threading.BoundedSemaphore(self.size))
+
+        with slot:
+            connection, reused = self._checkout(key)
+            try:
+                try:
+                    response = self._send(connection, method, path, body, headers)
+                except (http_client.HTTPException, socket.error):
+                    if not reused:
+                        raise
+                    # The server may have closed the connection while it was idle, so try once more on a new one
+                    connection.close()
+                    connection = self._connect(key)
+                    response = self._send(connection, method, path, body, headers)
+            except Exception:
+                connection.close()
+                raise
+
+            status, reason, response_headers, data, will_close = response
+            if will_close:
+                connection.close()
+            else:
+                self._checkin(key, connection)
+
+        if response_headers.get('content-encoding') == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+        return status, reason, response_headers, data
+
+    def close(self):
+        """
+        Closes all idle connections
+        """
+        with self._lock:
+            for idle in self._idle.values():
+                for connection, _ in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+# Shared by all backends that aren't given a pool of their own
+HTTP_POOL = ConnectionPool()
+
+
+class PooledTransport(object):
+    """
+    xmlrpc transport that sends requests through a ConnectionPool, so one ServerProxy can be shared by all
+    worker threads and connections are kept alive between calls
+    Responses are parsed by a standard Transport, which is only created with the backend so xmlrpc is imported lazily
+    """
+
+    def __init__(self, pool, scheme='https'):
+        self.pool = pool
+        self.scheme = scheme
+        self.transport = xmlrpc_client.Transport()
+
+    def request(self, host, handler, request_body, verbose=False):
+        url = '{}://{}{}'.format(self.scheme, host, handler)
+        status, reason, headers, data = self.pool.request(
+            'POST', url, request_body, {'Content-Type': 'text/xml', 'User-Agent': self.transport.user_agent}
+        )
+
+        if status != 200:
+            raise xmlrpc_client.ProtocolError(url, status, reason, headers)
+
+        parser, unmarshaller = self.transport.getparser()
+        parser.feed(data)
+        parser.close()
+
+        return unmarshaller.close()
+
+    def close(self):
+        # Connections belong to the pool, which outlives the ServerProxy
+        pass
+
+
+class MetadataBackend(object):
+    """
+    Source of package metadata that check_packages looks packages up with
+
+    release_data returns a dictionary of metadata for a single release, including its classifiers,
+    or an empty dictionary if the release doesn't exist. package_releases returns the released
+    versions of a package, newest first, or an empty list if the package doesn't exist. release_files
+    returns the names of the files uploaded for a release, or an empty list if the release doesn't exist.
+    """
+
+    # Backends that can answer many calls in one request set this, so lookups are sent in batches
+    batched = False
+
+    def __init__(self, index_url):
+        self.index_url = index_url
+
+    def release_data(self, package_name, version):
+        raise NotImplementedError
+
+    def package_releases(self, package_name):
+        raise NotImplementedError
+
+    def release_files(self, package_name, version):
+        raise NotImplementedError
+
+    def call_many(self, calls):
+        """
+        Makes a list of release_data, package_releases and release_files calls
+        :param calls: list of (method name, args) tuples
+        :return: list of results, in the same order as calls
+        """
+        return [getattr(self, method)(*args) for method, args in calls]
+
+    def fetch_package_releases(self, package_name, validators=None):
+        """
+        Fetches the release list of a package, unless it has not changed since it was fetched with `validators`
+        Backends that support conditional requests override this
+
+        :param validators: dict of the etag and last_modified of the cached release list, or None
+        :return: tuple of the release list, or None if it has not changed, and its validators
+        """
+        return self.package_releases(package_name), None
+
+
+class XmlRpcBackend(MetadataBackend):
+    """
+    Looks packages up with the pypi xmlrpc methods, sending batches of calls as a single multicall request
+    """
+
+    batched = True
+
+    def __init__(self, index_url=PYPI_URL, pool=None):
+        super(XmlRpcBackend, self).__init__(index_url)
+        self.pool = pool or HTTP_POOL
+        self.client = xmlrpc_client.ServerProxy(
+            index_url, transport=PooledTransport(self.pool, urllib_parse.urlsplit(index_url).scheme)
+        )
+
+    def _call(self, function, *args):
+        """
+        Makes an xmlrpc call, retrying it while pypi answers that there are too many requests
+        pypi throttles xmlrpc with a Fault rather than an HTTP 429, so the pool can't retry it
+        """
+        attempt = 0
+        while True:
+            try:
+                return function(*args)
+            except xmlrpc_client.Fault as e:
+                if 'TooManyRequests' not in e.faultString or attempt >= self.pool.retry.retries:
+                    raise
+            time.sleep(self.pool.retry.delay(attempt))
+            attempt += 1
+
+    def release_data(self, package_name, version):
+        return self._call(self.client.release_data, package_name, version)
+
+    def package_releases(self, package_name):
+        return self._call(self.client.package_releases, package_name)
+
+    def release_files(self, package_name, version):
+        return [url['filename'] for url in self._call(self.client.release_urls, package_name, version)]
+
+    def call_many(self, calls):
+        if not calls:
+            return []
+
+        multicall = xmlrpc_client.MultiCall(self.client)
+        for method, args in calls:
+            getattr(multicall, 'release_urls' if method == 'release_files' else method)(*args)
+
+        results = self._call(lambda: list(multicall()))
+
+        return [
+            [url['filename'] for url in result] if method == 'release_files' else result
+            for (method, _), result in zip(calls, results)
+        ]
+
+
+class JsonBackend(MetadataBackend):
+    """
+    Looks packages up with the pypi JSON API
+
+    The response listing a package's releases also holds the metadata of its latest release,
+    which is kept so looking up the latest release afterwards doesn't need another request.
+    Responses for a release list its files too, which are kept for release_files in the same way.
+    Redirects within the index are followed, as pypi redirects names that differ from a package's own.
+    """
+
+    def __init__(self, index_url=PYPI_JSON_URL, pool=None):
+        super(JsonBackend, self).__init__(index_url)
+        self.pool = pool or HTTP_POOL
+        self._latest = LRUCache(RELEASE_MEMO_SIZE)
+        self._files = LRUCache(RELEASE_MEMO_SIZE)
+
+    def _request(self, path, headers=None):
+        """
+        :param path: path of the resource, relative to the index url
+        :param headers: dict of extra request headers
+        :return: tuple of the response status, headers and decoded JSON, which is None unless the status is 200
+        """
+        url = '{}/{}/json'.format(self.index_url.rstrip('/'), path)
+        request_headers = {'Accept': 'application/json'}
+        request_headers.update(headers or {})
+        status, reason, response_headers, data = self.pool.request('GET', url, headers=request_headers)
+
+        redirects = 0
+        while status in REDIRECT_STATUSES and response_headers.get('location') and redirects < MAX_REDIRECTS:
+            location = urllib_parse.urljoin(url, response_headers['location'])
+            # Only redirects within the index are followed, the pool's connections and limits are per host
+            if urllib_parse.urlsplit(location)[:2] != urllib_parse.urlsplit(url)[:2]:
+                break
+            url = location
+            status, reason, response_headers, data = self.pool.request('GET', url, headers=request_headers)
+            redirects += 1
+
+        if status not in (200, 304, 404):
+            raise urllib_error.HTTPError(url, status, reason, response_headers, None)
+
+        return status, response_headers, json.loads(data.decode('utf-8')) if status == 200 else None
+
+    def _get(self, path):
+        """
+        :param path: path of the resource, relative to the index url
+        :return: decoded JSON response, or None if the resource doesn't exist
+        """
+        return self._request(path)[2]
+
+    def release_data(self, package_name, version):
+        info = self._latest.get((package_name.lower(), version))
+
+        if info is None:
+            info = self._release(package_name, version)[0]
+
+        return info
+
+    def release_files(self, package_name, version):
+        files = self._files.get((package_name.lower(), version))
+
+        if files is None:
+            files = self._release(package_name, version)[1]
+
+        return files
+
+    def _release(self, package_name, version):
+        """
+        :return: tuple of the metadata and file names of a release, empty if it doesn't exist
+        """
+        data = self._get('{}/{}'.format(urllib_parse.quote(package_name), urllib_parse.quote(version)))
+        if not data:
+            return {}, []
+
+        files = [url['filename'] for url in data.get('urls') or ()]
+        self._files.set((package_name.lower(), version), files)
+
+        return data['info'], files
+
+    def package_releases(self, package_name):
+        return self.fetch_package_releases(package_name)[0]
+
+    def fetch_package_releases(self, package_name, validators=None):
+        """
+        Fetches the release list of a package with a conditional request when validators are given
+        A 304 response has no body, so checking an unchanged release list costs next to no bandwidth
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        status, response_headers, data = self._request(urllib_parse.quote(package_name), headers)
+
+        if status == 304:
+            return None, validators
+        if not data:
+            return [], None
+
+        validators = {'etag': response_headers.get('etag'), 'last_modified': response_headers.get('last-modified')}
+
+        return self._releases(package_name, data), validators
+
+    def _releases(self, package_name, data):
+        """
+        :param data: decoded JSON response for a package
+        :return: release list of the package, newest first
+        """
+        info = data['info']
+        self._latest.set((package_name.lower(), info['version']), info)
+        self._files.set((package_name.lower(), info['version']), [url['filename'] for url in data.get('urls') or ()])
+
+        releases = list(data.get('releases', {}))
+        # Pre-releases are left out, unless the package hasn't made a final release yet
+        final_releases = [version for version in releases if not is_prerelease(version)]
+
+        return sorted(final_releases or releases, key=version_key, reverse=True)
+
+
+class SnapshotBackend(MetadataBackend):
+    """
+    Answers lookups from a local metadata snapshot, without using the network
+
+    A snapshot is a JSON file holding the release list, release metadata and release files of each package:
+    {"index_url": ..., "packages": {name: {"releases": [...], "release_data": {version: {...}},
+                                           "release_files": {version: [...]}}}}
+    A directory of such files, e.g. one per package, is read as a single snapshot.
+    """
+
+    batched = True
+
+    def __init__(self, path=DEFAULT_SNAPSHOT):
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json')]
+        else:
+            paths = [path]
+
+        self.packages = {}
+        index_url = None
+
+        for snapshot_path in paths:
+            with open(snapshot_path) as f:
+                snapshot = json.load(f)
+            index_url = index_url or snapshot.get('index_url')
+            for package_name, package in snapshot.get('packages', {}).items():
+                self.packages[package_name.lower()] = package
+
+        super(SnapshotBackend, self).__init__(index_url)
+
+    def release_data(self, package_name, version):
+        return self.packages.get(package_name.lower(), {}).get('release_data', {}).get(version, {})
+
+    def package_releases(self, package_name):
+        return self.packages.get(package_name.lower(), {}).get('releases', [])
+
+    def release_files(self, package_name, version):
+        return self.packages.get(package_name.lower(), {}).get('release_files', {}).get(version, [])
+
+
+def build_snapshot(packages, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetches everything needed to check a list of packages offline, against any Python version
+    :param packages: list of package name and version tuples
+    :param jobs: number of concurrent lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :return: snapshot dictionary, as read by SnapshotBackend
+    """
+    snapshot_packages = {}
+    lookups = fetch_packages(packages, None, jobs, batch_size)
+    release_files = fetch_release_files(packages, jobs, batch_size)
+
+    # The search for the oldest release adding support reads releases newer than the pin, which ones depending
+    # on the Python version, so all of them are kept
+    upgrade_calls = list(_unique(
+        ('release_data', (package_name, version))
+        for (package_name, package_version), lookup in zip(packages, lookups) if not isinstance(lookup, LookupFailure)
+        for version in upgrade_candidates(package_version, lookup[1])[:-1]
+    ))
+    upgrade_releases = zip(upgrade_calls, call_in_batches(upgrade_calls, jobs, batch_size))
+
+    for (package_name, package_version), lookup, files in zip(packages, lookups, release_files):
+        if isinstance(lookup, LookupFailure):
+            print(get_terminal().red('{}={} could not be looked up: {}'.format(package_name, package_version, lookup.error)))
+            continue
+
+        package_info, package_releases, latest_package_info, _ = lookup
+        package = snapshot_packages.setdefault(
+            package_name.lower(), {'releases': package_releases, 'release_data': {}, 'release_files': {}}
+        )
+
+        package['release_data'][package_version] = package_info
+        if package_releases:
+            package['release_data'][package_releases[0]] = latest_package_info
+        if not isinstance(files, LookupFailure):
+            package['release_files'][package_version] = files
+
+    for (_, (package_name, version)), package_info in upgrade_releases:
+        if not isinstance(package_info, LookupFailure):
+            snapshot_packages[package_name.lower()]['release_data'][version] = package_info
+
+    return {'index_url': get_backend().index_url, 'packages': snapshot_packages}
+
+
+def write_snapshot(snapshot, path):
+    """
+    Writes a snapshot to a JSON file, or to one JSON file per package if path is a directory
+    :param snapshot: snapshot dictionary, from build_snapshot
+    :param path: file or directory to write to
+    """
+    if os.path.isdir(path):
+        for package_name, package in snapshot['packages'].items():
+            package_snapshot = {'index_url': snapshot['index_url'], 'packages': {package_name: package}}
+            write_snapshot(package_snapshot, os.path.join(path, '{}.json'.format(package_name)))
+        return
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(path, 'w') as f:
+        json.dump(snapshot, f, indent=1, sort_keys=True)
+
+
+BACKENDS = OrderedDict([
+    ('json', JsonBackend),
+    ('xmlrpc', XmlRpcBackend),
+])
+
+
+class MetadataCache(object):
+    """
+    On-disk SQLite cache of pypi metadata, shared between runs
+
+    release_data for a pinned version never changes, so it is kept forever. Release lists, and
+    lookups of versions that don't exist yet, expire after `ttl` seconds. Release lists are kept with
+    their ETag and Last-Modified validators, so expired ones can be revalidated instead of downloaded again.
+    """
+
+    # Bumped when the tables change, older caches are dropped and filled again
+    SCHEMA_VERSION = 2
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS release_data ('
+        ' index_url TEXT, package TEXT, version TEXT, data TEXT, fetched_at REAL,'
+        ' PRIMARY KEY (index_url, package, version))',
+        'CREATE TABLE IF NOT EXISTS package_releases ('
+        ' index_url TEXT, package TEXT, releases TEXT, fetched_at REAL, etag TEXT, last_modified TEXT,'
+        ' PRIMARY KEY (index_url, package))',
+    )
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL):
+        """
+        :param path: path of the SQLite database, parent directories are created if needed
+        :param ttl: seconds before release lists are fetched again
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._db:
+            if self._db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS release_data')
+                self._db.execute('DROP TABLE IF EXISTS package_releases')
+                self._db.execute('PRAGMA user_version = {:d}'.format(self.SCHEMA_VERSION))
+            for statement in self.SCHEMA:
+                self._db.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _expired(self, fetched_at):
+        return time.time() - fetched_at > self.ttl
+
+    def get_release_data(self, index_url, package_name, version):
+        """
+        :return: cached release data, or None if it has not been cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT data, fetched_at FROM release_data WHERE index_url = ? AND package = ? AND version = ?',
+                (index_url, package_name.lower(), version)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        data = json.loads(row[0])
+        # An empty result means the version was not on pypi, it may have been published since
+        if not data and self._expired(row[1]):
+            return None
+
+        return data
+
+    def set_release_data(self, index_url, package_name, version, data):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO release_data VALUES (?, ?, ?, ?, ?)',
+                (index_url, package_name.lower(), version, json.dumps(data), time.time())
+            )
+
+    def get_package_releases(self, index_url, package_name):
+        """
+        :return: cached list of releases, or None if it has not been cached or has expired
+        """
+        entry = self.get_release_list(index_url, package_name)
+
+        if entry is None or entry[2]:
+            return None
+
+        return entry[0]
+
+    def get_release_list(self, index_url, package_name):
+        """
+        :return: tuple of cached list of releases, its validators and whether it has expired, or None if it
+            has not been cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT releases, fetched_at, etag, last_modified FROM package_releases'
+                ' WHERE index_url = ? AND package = ?',
+                (index_url, package_name.lower())
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        validators = {'etag': row[2], 'last_modified': row[3]} if row[2] or row[3] else None
+
+        return json.loads(row[0]), validators, self._expired(row[1])
+
+    def set_package_releases(self, index_url, package_name, releases, validators=None):
+        validators = validators or {}
+
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO package_releases VALUES (?, ?, ?, ?, ?, ?)',
+                (index_url, package_name.lower(), json.dumps(releases), time.time(),
+                 validators.get('etag'), validators.get('last_modified'))
+            )
+
+    def touch_package_releases(self, index_url, package_name):
+        """
+        Restarts the ttl of a release list, after the index confirmed it has not changed
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE package_releases SET fetched_at = ? WHERE index_url = ? AND package = ?',
+                (time.time(), index_url, package_name.lower())
+            )
+
+
+class CachedBackend(MetadataBackend):
+    """
+    Wraps a metadata backend, answering release_data and package_releases from a MetadataCache
+    release_files is always sent to the wrapped backend, as wheels can be uploaded to a release long after it
+    is published, e.g. for a new Python version
+    """
+
+    def __init__(self, backend, cache):
+        super(CachedBackend, self).__init__(backend.index_url)
+        self.backend = backend
+        self.cache = cache
+
+    @property
+    def batched(self):
+        return self.backend.batched
+
+    def release_data(self, package_name, version):
+        data = self.cache.get_release_data(self.index_url, package_name, version)
+
+        if data is None:
+            data = self.backend.release_data(package_name, version)
+            self.cache.set_release_data(self.index_url, package_name, version, data)
+
+        return data
+
+    def package_releases(self, package_name):
+        entry = self.cache.get_release_list(self.index_url, package_name)
+
+        if entry is not None and not entry[2]:
+            return entry[0]
+
+        releases, validators = self.backend.fetch_package_releases(package_name, entry[1] if entry else None)
+
+        if releases is None:
+            # Not modified since it was cached
+            self.cache.touch_package_releases(self.index_url, package_name)
+            return entry[0]
+
+        self.cache.set_package_releases(self.index_url, package_name, releases, validators)
+
+        return releases
+
+    def release_files(self, package_name, version):
+        return self.backend.release_files(package_name, version)
+
+    def call_many(self, calls):
+        """
+        Answers what it can from the cache, and sends the rest to the wrapped backend in one batch
+        Backends that don't batch their calls get release lists one at a time, so they can be revalidated
+        """
+        results = []
+        misses = []
+
+        for index, (method, args) in enumerate(calls):
+            if method == 'release_data':
+                result = self.cache.get_release_data(self.index_url, *args)
+            elif method == 'package_releases':
+                result = self.cache.get_package_releases(self.index_url, *args)
+            else:
+                result = None
+            results.append(result)
+            if result is None and method == 'package_releases' and not self.backend.batched:
+                results[index] = self.package_releases(*args)
+            elif result is None:
+                misses.append(index)
+
+        for index, result in zip(misses, self.backend.call_many([calls[index] for index in misses])):
+            method, args = calls[index]
+            if method == 'release_data':
+                self.cache.set_release_data(self.index_url, args[0], args[1], result)
+            elif method == 'package_releases':
+                self.cache.set_package_releases(self.index_url, args[0], result)
+            results[index] = result
+
+        return results
+
+
+class MemoizedBackend(MetadataBackend):
+    """
+    Wraps a metadata backend, keeping release data, release lists and release files in memory for a long running
+    process. Release lists, release files, and lookups of versions that don't exist yet, are looked up again after
+    `ttl` seconds
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_CACHE_TTL, maxsize=RELEASE_MEMO_SIZE):
+        super(MemoizedBackend, self).__init__(backend.index_url)
+        self.backend = backend
+        self.ttl = ttl
+        # (method, args) to (result, time it was fetched)
+        self._results = LRUCache(maxsize)
+
+    @property
+    def batched(self):
+        return self.backend.batched
+
+    def _get(self, call):
+        entry = self._results.get(call)
+
+        if entry is None:
+            return None
+
+        result, fetched_at = entry
+        if (call[0] != 'release_data' or not result) and time.time() - fetched_at > self.ttl:
+            return None
+
+        return result
+
+    def release_data(self, package_name, version):
+        return self.call_many([('release_data', (package_name, version))])[0]
+
+    def package_releases(self, package_name):
+        return self.call_many([('package_releases', (package_name,))])[0]
+
+    def release_files(self, package_name, version):
+        return self.call_many([('release_files', (package_name, version))])[0]
+
+    def call_many(self, calls):
+        calls = [(method, tuple(args)) for method, args in calls]
+        results = [self._get(call) for call in calls]
+        misses = [index for index, result in enumerate(results) if result is None]
+
+        if not misses:
+            return results
+
+        for index, result in zip(misses, self.backend.call_many([calls[index] for index in misses])):
+            self._results.set(calls[index], (result, time.time()))
+            results[index] = result
+
+        return results
+
+
+def format_location(source, line):
+    """
+    :return: file and line number a requirement was read from, e.g. requirements.txt:3
+    """
+    return '{}:{}'.format(source, line) if source else 'line {}'.format(line)
+
+
+def format_problem(text, problem, source=None, line=None):
+    """
+    :return: message for a requirement line that can't be checked, with where it was read
+    """
+    location = '{}: '.format(format_location(source, line)) if line is not None else ''
+
+    return '{}{} {}'.format(location, text, problem)
+
+
+def canonical_name(name):
+    """
+    :return: package name normalized as in PEP 503, so differently written names of a package compare equal
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+class RequirementError(ValueError):
+    """
+    A requirement line that can't be checked, either because it isn't valid or because it doesn't pin a version
+    Yielded by iter_requirement_lines for the lines it rejects, and raised for them when stopping at errors
+    """
+
+    def __init__(self, problem, text, source=None, line=None):
+        super(RequirementError, self).__init__(format_problem(text, problem, source, line))
+        self.problem = problem
+        self.text = text
+        self.source = source
+        self.line = line
+
+
+class Requirement(namedtuple('Requirement', ['name', 'extras', 'specifiers', 'url', 'marker', 'hashes', 'text',
+                                             'source', 'line'])):
+    """
+    A requirement line of a requirements file, as parsed by parse_requirement
+
+    extras and hashes are tuples of strings, specifiers a tuple of (operator, version) tuples, url the url of a
+    `name @ url` requirement and marker its environment marker, or None. text is the requirement as written,
+    without comments and options, and source and line are the file and line number it was read from.
+    """
+
+    __slots__ = ()
+
+    @property
+    def version(self):
+        """
+        Version pinned with == or ===, which is the version checked, or None if the requirement doesn't pin one
+        """
+        pins = set(version for operator, version in self.specifiers if operator in ('==', '===') and '*' not in version)
+
+        return pins.pop() if len(pins) == 1 else None
+
+
+class Include(namedtuple('Include', ['constraint', 'path', 'text', 'source', 'line'])):
+    """
+    A -r or -c line of a requirements file, including another requirements file or a constraints file
+    path is as written, relative to the including file
+    """
+
+    __slots__ = ()
+
+
+def parse_requirement(text, source=None, line=None):
+    """
+    Parses a requirement line, without its comment
+    :param text: requirement and the options following it, e.g. `name[extra]>=1.0; python_version < "3" --hash=...`
+    :param source: name of the requirements file the line was read from
+    :param line: line number the requirement starts on
+    :return: Requirement
+    :raises RequirementError: if the line is not a valid requirement
+    """
+    parts = OPTIONS_PATTERN.split(text, 1)
+    requirement = parts[0]
+    hashes = []
+
+    if len(parts) > 1:
+        options = parts[1].split()
+        index = 0
+        while index < len(options):
+            option, _, value = options[index].partition('=')
+            if option not in REQUIREMENT_OPTIONS:
+                raise RequirementError('has an unknown option {}'.format(option), requirement, source, line)
+            if not value:
+                index += 1
+                value = options[index] if index < len(options) else ''
+            if option == '--hash':
+                if ':' not in value:
+                    raise RequirementError('has an invalid hash {}'.format(value or '(missing)'), requirement, source, line)
+                hashes.append(value)
+            index += 1
+
+    match = REQUIREMENT_PATTERN.match(requirement)
+    if not match:
+        raise RequirementError('is not a valid requirement', requirement, source, line)
+
+    extras = tuple(extra.strip() for extra in (match.group('extras') or '').split(',') if extra.strip())
+    if not all(EXTRA_PATTERN.match(extra) for extra in extras):
+        raise RequirementError('has an invalid extra', requirement, source, line)
+
+    specifiers = []
+    if match.group('specifiers'):
+        clauses = match.group('specifiers').strip()
+        if clauses.startswith('(') and clauses.endswith(')'):
+            clauses = clauses[1:-1]
+        for clause in clauses.split(','):
+            specifier = SPECIFIER_PATTERN.match(clause)
+            if not specifier:
+                raise RequirementError('has an invalid version specifier {}'.format(clause.strip() or '(empty)'),
+                                       requirement, source, line)
+            specifiers.append(specifier.groups())
+
+    return Requirement(
+        match.group('name'), extras, tuple(specifiers), match.group('url'), match.group('marker') or None,
+        tuple(hashes), requirement, source, line
+    )
+
+
+def iter_logical_lines(req_file):
+    """
+    Joins the lines of a requirements file continued with a backslash, and strips comments
+    :param req_file: requirements file to read, e.g. piped pip freeze output
+    :return: generator of (line number the logical line starts on, logical line) tuples, skipping empty lines
+    """
+    parts = []
+    start = None
+
+    # readline, unlike iterating the file, doesn't wait to fill a read-ahead buffer on Python 2
+    for line_number, line in enumerate(iter(req_file.readline, ''), 1):
+        line = COMMENT_PATTERN.sub('', line.rstrip('\r\n'))
+
+        if start is None:
+            start = line_number
+
+        if line.endswith('\\'):
+            parts.append(line[:-1])
+            continue
+
+        parts.append(line)
+        logical_line = ' '.join(part.strip() for part in parts).strip()
+        if logical_line:
+            yield start, logical_line
+
+        parts = []
+        start = None
+
+    logical_line = ' '.join(part.strip() for part in parts).strip()
+    if logical_line:
+        yield start, logical_line
+
+
+def iter_requirement_lines(req_file, source=None):
+    """
+    Parses a requirements file in a single pass, yielding each requirement as soon as its line is read
+    Lines for version control urls, urls, local paths and editable installs are skipped, as are options that
+    don't change which packages are checked
+
+    :param req_file: requirements file to parse, e.g. piped pip freeze output
+    :param source: name of the file, used in error messages, defaults to the file's name
+    :return generator of Requirement, Include for -r and -c lines, or RequirementError for each line that is
+        rejected, in the order they appear in the file
+    """
+    if source is None:
+        source = getattr(req_file, 'name', None)
+
+    for line_number, line in iter_logical_lines(req_file):
+        if any(line.startswith(prefix) for prefix in IGNORED_PREFIXES) or URL_PATTERN.match(line):
+            continue
+
+        if line.startswith('-'):
+            option = re.split(r'[\s=]', line, 1)[0]
+            include = INCLUDE_PATTERN.match(line)
+            if include:
+                yield Include(include.group('option') in ('-c', '--constraint'), include.group('path'), line, source,
+                              line_number)
+            elif option in INCLUDE_OPTIONS:
+                yield RequirementError('does not name a file to include', line, source, line_number)
+            elif option not in IGNORED_OPTIONS:
+                yield RequirementError('is not a known option', line, source, line_number)
+            continue
+
+        try:
+            requirement = parse_requirement(line, source, line_number)
+        except RequirementError as e:
+            yield e
+            continue
+
+        if requirement.url is None:
+            yield requirement
+
+
+def constrain(requirement, constraints):
+    """
+    Pins a requirement to the version of its constraint, as pip does for -c constraints files
+    :param requirement: Requirement
+    :param constraints: dict of canonical package names to constraint Requirements
+    :return: the requirement, pinned if its constraint pins a version, or RequirementError if it conflicts
+    """
+    constraint = constraints.get(canonical_name(requirement.name))
+
+    if constraint is None or constraint.version is None or requirement.version == constraint.version:
+        return requirement
+
+    if requirement.version is not None:
+        return RequirementError(
+            'conflicts with constraint {} at {}'.format(constraint.text, format_location(constraint.source, constraint.line)),
+            requirement.text, requirement.source, requirement.line
+        )
+
+    return requirement._replace(specifiers=requirement.specifiers + (('==', constraint.version),))
+
+
+class RequirementsResolver(object):
+    """
+    Follows the -r and -c includes of requirements files, for a run checking one or more of them
+
+    Included paths are resolved relative to the including file, and each file is parsed at most once per run,
+    however many files include it. Each entry file resolves to a single set of requirements, without duplicates
+    and pinned by its constraints, and an include cycle is reported instead of followed.
+
+    With `files`, a dict of paths to file contents, includes are only read from it and never from the disk,
+    as for a check sent to a server, and including any other file is reported as an error. Otherwise the
+    contents of the files read are kept in `contents`, keyed the same way, so a client can send them along.
+    """
+
+    def __init__(self, files=None):
+        self._files = files
+        self.contents = {}
+        # Absolute path to the iter_requirement_lines items of the file
+        self._parsed = {}
+
+    def parse(self, path):
+        """
+        :return: list of iter_requirement_lines items of the requirements file at path, parsed on first use
+        :raises IOError: if the file can't be read, or isn't one of `files`
+        """
+        key = os.path.abspath(path)
+
+        if key not in self._parsed:
+            if self._files is None:
+                with open(path) as req_file:
+                    self.contents[os.path.normpath(path)] = req_file.read()
+                self._parsed[key] = list(iter_requirement_lines(StringIO(self.contents[os.path.normpath(path)]), path))
+            elif os.path.normpath(path) in self._files:
+                self._parsed[key] = list(iter_requirement_lines(StringIO(self._files[os.path.normpath(path)]), path))
+            else:
+                raise IOError(errno.ENOENT, 'not sent with the check', path)
+
+        return self._parsed[key]
+
+    def resolve(self, items, source=None, constraints=None):
+        """
+        Follows includes, pins requirements to their constraints and drops duplicate requirements
+        Requirements are yielded as soon as they are read, so they are pinned by constraints read before them.
+        Callers that can wait for the whole file apply the rest with constrain afterwards.
+
+        :param items: iterable of iter_requirement_lines items of an entry file
+        :param source: path of the entry file, for resolving its includes and detecting cycles through it
+        :param constraints: dict filled in with the constraints read, by canonical package name
+        :return: generator of Requirement and RequirementError
+        """
+        if constraints is None:
+            constraints = {}
+
+        stack = [os.path.abspath(source)] if source and (self._files is not None or os.path.isfile(source)) else []
+
+        return self._resolve(items, stack, set(), constraints, {}, False)
+
+    def _resolve(self, items, stack, included, constraints, seen, as_constraints):
+        for item in items:
+            if isinstance(item, Include):
+                for resolved in self._include(item, stack, included, constraints, seen,
+                                              as_constraints or item.constraint):
+                    yield resolved
+            elif isinstance(item, RequirementError):
+                yield item
+            elif as_constraints:
+                constraints.setdefault(canonical_name(item.name), item)
+            else:
+                resolved = self._deduplicate(constrain(item, constraints), seen)
+                if resolved is not None:
+                    yield resolved
+
+    def _include(self, include, stack, included, constraints, seen, as_constraints):
+        if URL_PATTERN.match(include.path) and not include.path.startswith(('.', '/', '\\')):
+            yield RequirementError('includes a url, which is not followed', include.text, include.source, include.line)
+            return
+
+        path = include.path
+        if include.source and not include.source.startswith('<'):
+            path = os.path.join(os.path.dirname(include.source), path)
+        key = os.path.abspath(path)
+
+        if key in stack:
+            cycle = ' -> '.join(os.path.relpath(included_path) for included_path in stack[stack.index(key):] + [key])
+            yield RequirementError('is an include cycle: {}'.format(cycle), include.text, include.source, include.line)
+            return
+
+        # A file included twice, e.g. a shared base, only adds duplicates the second time
+        if (key, as_constraints) in included:
+            return
+        included.add((key, as_constraints))
+
+        try:
+            items = self.parse(path)
+        except (IOError, OSError) as e:
+            yield RequirementError('includes a file that can\'t be read: {}'.format(e.strerror or e), include.text,
+                                   include.source, include.line)
+            return
+
+        for resolved in self._resolve(items, stack + [key], included, constraints, seen, as_constraints):
+            yield resolved
+
+    def _deduplicate(self, item, seen):
+        """
+        :return: item, or None if its package was already required with the same pin or without one, or a
+            RequirementError if another version was pinned
+        """
+        if isinstance(item, RequirementError):
+            return item
+
+        key = canonical_name(item.name)
+        previous = seen.setdefault(key, item)
+
+        if previous is item:
+            return item
+
+        if previous.version is None and item.version is not None:
+            seen[key] = item
+            return item
+
+        if item.version is not None and item.version != previous.version:
+            return RequirementError(
+                'conflicts with {} at {}'.format(previous.text, format_location(previous.source, previous.line)),
+                item.text, item.source, item.line
+            )
+
+        return None
+
+
+def pinned_requirement_error(item):
+    """
+    :param item: Requirement or RequirementError, from iter_requirement_lines
+    :return: RequirementError if item can't be checked, as only pinned versions can be looked up, else None
+    """
+    if isinstance(item, RequirementError):
+        return item
+
+    if item.version is None:
+        return RequirementError('does not have a valid version number', item.text, item.source, item.line)
+
+    return None
+
+
+def iter_requirements(req_file, stop_at_error=False, resolver=None):
+    """
+    Parses a requirements file line by line, yielding each package as soon as its line is read
+    :param req_file: requirements file to parse, e.g. piped pip freeze output
+    :param stop_at_error: raise RequirementError for lines without a valid version number, instead of warning
+    :param resolver: RequirementsResolver following the file's includes, shared by the files of a run
+
+    :return generator of package name and version tuples, in the order they appear in the file
+    """
+    resolver = resolver or RequirementsResolver()
+    source = getattr(req_file, 'name', None)
+
+    for item in resolver.resolve(iter_requirement_lines(req_file, source), source):
+        error = pinned_requirement_error(item)
+
+        if error is None:
+            yield item.name, item.version
+        elif stop_at_error:
+            raise error
+        else:
+            print(get_terminal().yellow(str(error)))
+
+
+def parse_requirements_file(req_file, stop_at_error=False):
+    """
+    Parse a requirements file, returning packages with versions in a dictionary
+    :param req_file: requirements file to parse
+
+    :return dict of package names and versions, in the order they appear in the file
+    """
+    try:
+        return OrderedDict(iter_requirements(req_file, stop_at_error))
+    except RequirementError as e:
+        sys.exit(str(e))
+
+
+def is_supported(python_version, supported_pythons):
+    """
+    Checks if a Python version is in a release's supported versions
+    :param python_version: python version to be checked for support
+    :param supported_pythons: PythonSupport from get_supported_pythons
+    :return: True if the version, or its major revision, is supported
+    """
+    # Some entries list support of Programming Language :: Python :: 3
+    # So we also want to check the major revision number of the version
+    # against the list of supported versions
+    major_python_version = python_version.split('.')[0]
+
+    return python_version in supported_pythons or major_python_version in supported_pythons
+
+
+def fetch_batch(packages, python_versions):
+    """
+    Fetches the pypi metadata needed to check a batch of packages
+    With a batched backend this takes two requests, however many packages are in the batch
+    The latest release is only fetched for packages whose pinned version is not supported by every version,
+    and when it is supported, the oldest supporting release newer than the pin is searched for with find_upgrades
+    Each distinct lookup is only made once, however many packages in the batch need it, and release lists
+    and latest releases already fetched in this process are taken from RELEASE_MEMO
+
+    :param packages: list of package name and version tuples
+    :param python_versions: list of python versions to be checked for support, or None to fetch the latest
+        release of every package
+    :return: list of (package info, package releases, latest package info or None, dict of python versions
+        to the oldest release newer than the pin that supports them) tuples
+    """
+    backend = get_backend()
+
+    memo = {}
+    calls = OrderedDict()
+    for package_name, package_version in packages:
+        memo_key = (backend.index_url, package_name.lower())
+        memo[memo_key] = RELEASE_MEMO.get(memo_key)
+
+        calls[('release_data', (package_name, package_version))] = None
+        if memo[memo_key] is None:
+            calls[('package_releases', (package_name,))] = None
+    results = dict(zip(calls, backend.call_many(list(calls))))
+
+    lookups = []
+    latest_calls = OrderedDict()
+    for package_name, package_version in packages:
+        memo_key = (backend.index_url, package_name.lower())
+        if memo[memo_key] is None:
+            memo[memo_key] = (results[('package_releases', (package_name,))], None)
+            RELEASE_MEMO.set(memo_key, memo[memo_key])
+
+        package_info = results[('release_data', (package_name, package_version))]
+        package_releases, latest_package_info = memo[memo_key]
+        latest_call = None
+
+        if package_releases and (python_versions is None or
+                                 not all(release_support(package_info, version) == COMPATIBLE
+                                         for version in python_versions)):
+            latest_call = ('release_data', (package_name, package_releases[0]))
+            if latest_package_info is not None:
+                results[latest_call] = latest_package_info
+            elif latest_call not in results:
+                latest_calls[latest_call] = None
+
+        lookups.append((memo_key, package_name, package_version, package_info, package_releases, latest_call))
+
+    if latest_calls:
+        results.update(zip(latest_calls, backend.call_many(list(latest_calls))))
+
+    searches = OrderedDict()
+    for _, package_name, package_version, package_info, package_releases, latest_call in lookups:
+        if not latest_call or python_versions is None:
+            continue
+
+        candidates = upgrade_candidates(package_version, package_releases)
+        for python_version in python_versions:
+            if (candidates and release_support(package_info, python_version) != COMPATIBLE and
+                    release_support(results[latest_call], python_version) == COMPATIBLE):
+                searches[(package_name, package_version, python_version)] = candidates
+
+    upgrades = dict(zip(searches, find_upgrades(
+        backend, [(package_name, candidates, python_version)
+                  for (package_name, _, python_version), candidates in searches.items()], results
+    )))
+
+    batch_lookups = []
+    for memo_key, package_name, package_version, package_info, package_releases, latest_call in lookups:
+        latest_package_info = None
+        package_upgrades = {}
+
+        if latest_call:
+            latest_package_info = results[latest_call]
+            RELEASE_MEMO.set(memo_key, (package_releases, latest_package_info))
+            package_upgrades = dict(
+                (python_version, upgrades[(package_name, package_version, python_version)])
+                for python_version in python_versions or [] if (package_name, package_version, python_version) in upgrades
+            )
+
+        batch_lookups.append((package_info, package_releases, latest_package_info, package_upgrades))
+
+    return batch_lookups
+
+
+def upgrade_candidates(package_version, package_releases):
+    """
+    :param package_version: pinned version of a package
+    :param package_releases: release list of the package, newest first
+    :return: list of the releases newer than the pinned version, oldest first, ending with the latest release.
+        Pre-releases are left out, other than the latest release.
+    """
+    pinned_key = version_key(package_version)
+    if not package_releases or version_key(package_releases[0]) <= pinned_key:
+        return []
+
+    candidates = [
+        version for version in package_releases[1:]
+        if not is_prerelease(version) and version_key(version) > pinned_key
+    ]
+
+    return sorted(candidates, key=version_key) + [package_releases[0]]
+
+
+def find_upgrades(backend, searches, results):
+    """
+    Finds the oldest release that supports a Python version, for each of a list of searches
+    Support is assumed to carry on in later releases once a release adds it, so each search bisects its candidates
+    and looks up about log2(n) of n releases. Searches advance together, one batch of lookups per step, and a
+    release looked up by one search is not looked up again by another.
+
+    :param backend: MetadataBackend to look releases up with
+    :param searches: list of (package name, candidate versions oldest first, python version) tuples, whose last
+        candidate is known to support the Python version
+    :param results: dict of (method name, args) calls already made to their results, which the calls made are added to
+    :return: list of the oldest supporting version of each search
+    """
+    bounds = [[0, len(candidates) - 1] for _, candidates, _ in searches]
+
+    while True:
+        pending = [(search, bound) for search, bound in zip(searches, bounds) if bound[0] < bound[1]]
+        if not pending:
+            break
+
+        calls = OrderedDict()
+        for (package_name, candidates, _), (low, high) in pending:
+            call = ('release_data', (package_name, candidates[(low + high) // 2]))
+            if call not in results:
+                calls[call] = None
+        results.update(zip(calls, backend.call_many(list(calls))))
+
+        for (package_name, candidates, python_version), bound in pending:
+            middle = (bound[0] + bound[1]) // 2
+            if release_support(results[('release_data', (package_name, candidates[middle]))], python_version) == COMPATIBLE:
+                bound[1] = middle
+            else:
+                bound[0] = middle + 1
+
+    return [candidates[high] for (_, candidates, _), (_, high) in zip(searches, bounds)]
+
+
+def fetch_packages(packages, python_versions, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetches pypi metadata for a list of packages
+    Packages are split into batches of `batch_size` for backends that batch their lookups, with up to
+    `jobs` batches fetched concurrently. All versions of a package go in the same batch, so its
+    release list is only fetched once.
+
+    :param packages: list of package name and version tuples
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :return: list of fetch_batch results, or LookupFailures, in the same order as packages
+    """
+    if not get_backend().batched:
+        batch_size = 1
+
+    groups = OrderedDict()
+    for index, (package_name, _) in enumerate(packages):
+        groups.setdefault(package_name.lower(), []).append(index)
+
+    batches = [[]]
+    for indexes in groups.values():
+        if len(batches[-1]) >= batch_size:
+            batches.append([])
+        batches[-1].extend(indexes)
+
+    fetch = partial(fetch_batch_safely, python_versions=python_versions)
+    batch_packages = [[packages[index] for index in batch] for batch in batches if batch]
+    batch_lookups = map_concurrently(fetch, batch_packages, jobs)
+
+    lookups = [None] * len(packages)
+    for batch, batch_lookup in zip(batches, batch_lookups):
+        for index, lookup in zip(batch, batch_lookup):
+            lookups[index] = lookup
+
+    return lookups
+
+
+def map_concurrently(function, items, jobs=DEFAULT_JOBS):
+    """
+    :param function: function to call with each item
+    :param items: list of items
+    :param jobs: number of calls made concurrently
+    :return: list of the results, in the order of items
+    """
+    jobs = min(jobs, len(items))
+
+    if jobs <= 1:
+        return [function(item) for item in items]
+
+    pool = multiprocessing_pool.ThreadPool(jobs)
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def fetch_release_lists(package_names, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetches the release lists of packages, in batches as fetch_packages does
+    Release lists already fetched in this process are taken from RELEASE_MEMO, and the ones fetched here are added
+
+    :param package_names: list of package names
+    :param jobs: number of concurrent lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :return: dict of lowercase package names to their release list, newest first, or a LookupFailure
+    """
+    backend = get_backend()
+    release_lists = {}
+    missing = []
+
+    for package_name in _unique(name.lower() for name in package_names):
+        memo = RELEASE_MEMO.get((backend.index_url, package_name))
+        if memo is None:
+            missing.append(package_name)
+        else:
+            release_lists[package_name] = memo[0]
+
+    if not backend.batched:
+        batch_size = 1
+
+    batches = [missing[index:index + batch_size] for index in range(0, len(missing), batch_size)]
+    calls = [[('package_releases', (package_name,)) for package_name in batch] for batch in batches]
+
+    for batch, batch_releases in zip(batches, map_concurrently(call_batch_safely, calls, jobs)):
+        for package_name, package_releases in zip(batch, batch_releases):
+            if not isinstance(package_releases, LookupFailure):
+                RELEASE_MEMO.set((backend.index_url, package_name), (package_releases, None))
+            release_lists[package_name] = package_releases
+
+    return release_lists
+
+
+def fetch_release_files(packages, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetches the file names of pinned releases, in batches as fetch_packages does
+    :param packages: list of package name and version tuples
+    :param jobs: number of concurrent lookups
+    :param batch_size: number of releases fetched in each multicall request
+    :return: list of the file names of each release, or a LookupFailure, in the same order as packages
+    """
+    unique_packages = list(_unique(packages))
+    calls = [('release_files', package) for package in unique_packages]
+    files = dict(zip(unique_packages, call_in_batches(calls, jobs, batch_size)))
+
+    return [files[package] for package in packages]
+
+
+def call_in_batches(calls, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Makes backend calls in batches of `batch_size`, for backends that batch their lookups, with up to `jobs`
+    batches made concurrently
+    :param calls: list of (method name, args) tuples
+    :return: list of results, or LookupFailures for the calls of batches that failed, in the same order as calls
+    """
+    if not get_backend().batched:
+        batch_size = 1
+
+    batches = [calls[index:index + batch_size] for index in range(0, len(calls), batch_size)]
+
+    return [result for batch_results in map_concurrently(call_batch_safely, batches, jobs) for result in batch_results]
+
+
+def call_batch_safely(calls):
+    """
+    Makes a batch of calls with the backend, so that a batch whose lookups fail doesn't stop the whole run
+    :param calls: list of (method name, args) tuples
+    :return: list of results, or a LookupFailure for each call if the lookups failed
+    """
+    try:
+        return get_backend().call_many(calls)
+    except lookup_errors() as e:
+        return [LookupFailure(e)] * len(calls)
+
+
+class LookupFailure(object):
+    """
+    Stands in for the fetch_batch result of a package whose lookups failed, once retries ran out
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+    def __repr__(self):
+        return 'LookupFailure({!r})'.format(self.error)
+
+
+def fetch_batch_safely(packages, python_versions):
+    """
+    Runs fetch_batch, so that a batch whose lookups fail doesn't stop the whole run
+    :return: list of fetch_batch results, or a LookupFailure for each package if the lookups failed
+    """
+    try:
+        return fetch_batch(packages, python_versions)
+    except lookup_errors() as e:
+        return [LookupFailure(e)] * len(packages)
+
+
+def fetch_package(package, python_versions):
+    """
+    Fetches the pypi metadata needed to check a single package
+    :param package: package name and version tuple, or a RequirementError, which is returned without a lookup
+    :param python_versions: list of python versions to be checked for support
+    :return: tuple of package and its fetch_batch result, or a LookupFailure, or None for a RequirementError
+    """
+    if isinstance(package, RequirementError):
+        return package, None
+
+    return package, fetch_batch_safely([package], python_versions)[0]
+
+
+def stream_packages(packages, python_versions, jobs=DEFAULT_JOBS):
+    """
+    Fetches pypi metadata for packages as they arrive, e.g. while pip freeze output is still being read
+    Up to `jobs` packages are fetched concurrently, and each result is yielded as soon as it and the
+    results before it are complete, so the first result doesn't wait for the end of the input
+
+    :param packages: iterable of package name and version tuples, and RequirementErrors of lines that can't be
+        checked, which are passed through in order
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent lookups
+    :return: generator of (package, fetch_batch result) tuples, in the order of packages
+    """
+    fetch = partial(fetch_package, python_versions=python_versions)
+    unique_packages = _unique(packages)
+
+    if jobs <= 1:
+        # map reads every package before fetching any on Python 2
+        for package in unique_packages:
+            yield fetch(package)
+        return
+
+    pool = multiprocessing_pool.ThreadPool(jobs)
+    try:
+        for result in pool.imap(fetch, unique_packages):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _unique(items):
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def plan_lookups(package_lists):
+    """
+    Merges the packages of several requirements files, so each package version is only looked up once per run
+    :param package_lists: list of dicts of package names and versions
+    :return: list of unique package name and version tuples, in the order they are first seen
+    """
+    return list(OrderedDict.fromkeys(package for packages in package_lists for package in packages.items()))
+
+
+def check_package(lookup, python_version):
+    """
+    Decides whether a package version is compatible with the given Python version
+    :param lookup: (package info, package releases, latest package info, upgrades) tuple, from fetch_batch
+    :param python_version: python version to be checked for support
+    :return: tuple of COMPATIBLE, INCOMPATIBLE, UNSPECIFIED, UNAVAILABLE or ERROR and the oldest version that
+        gives explicit support, if upgrading to the latest version does, else None
+    """
+    if isinstance(lookup, LookupFailure):
+        return ERROR, None
+
+    package_info, package_releases, latest_package_info, upgrades = lookup
+
+    if not package_releases:
+        return UNAVAILABLE, None
+
+    status = release_support(package_info, python_version)
+
+    if status == COMPATIBLE:
+        return COMPATIBLE, None
+
+    upgrade_version = None
+    if latest_package_info and release_support(latest_package_info, python_version) == COMPATIBLE:
+        upgrade_version = upgrades.get(python_version, package_releases[0])
+
+    return status, upgrade_version
+
+
+class Result(namedtuple('Result', ['status', 'package', 'version', 'python', 'upgrade', 'source', 'line', 'error'])):
+    """
+    Outcome of checking a pinned package version against a Python version, as returned by check
+
+    status is COMPATIBLE, INCOMPATIBLE, UNSPECIFIED, UNAVAILABLE or ERROR, or INVALID for a requirement line that
+    can't be checked, whose package is the whole line, whose error is why and whose version and python are None.
+    upgrade is the oldest version newer than the pin that gives explicit support, source and line are the
+    requirements file and line number the package was read from, and error is why its lookup failed.
+    Checked for a platform, status is WHEEL_AVAILABLE, SDIST_ONLY, UNAVAILABLE or ERROR instead, and the error of
+    an UNAVAILABLE release with files is why none of them can be installed.
+    """
+
+    __slots__ = ()
+
+
+def package_results(package_name, package_version, lookup, python_versions, source=None, line=None):
+    """
+    :param lookup: fetch_batch result for the package, or a LookupFailure
+    :param python_versions: list of python versions to be checked for support
+    :param source: name of the requirements file the package was read from
+    :param line: line number the package was read from
+    :return: list of Result of the package for each Python version
+    """
+    results = []
+
+    for python_version in python_versions:
+        status, upgrade_version = check_package(lookup, python_version)
+        error = str(lookup.error) if status == ERROR else None
+        results.append(Result(status, package_name, package_version, python_version, upgrade_version, source, line, error))
+
+    return results
+
+
+def check_packages(packages, python_version, stop_at_error, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE,
+                   lookups=None):
+    """
+    Checks a list of packages for compatibility with the given Python version
+    Prints warning line if the package is not supported for the given Python version
+    If upgrading the package will allow compatibility, the version to upgrade is printed
+    If the package is not listed on pypi.python.org, error line is printed
+
+    Metadata for all packages is fetched concurrently first, results are then printed in the
+    order of packages so the output stays deterministic
+
+    :param packages: dict of packages names and versions
+    :param python_version: python version to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :param lookups: dict of package name and version tuples to fetch_batch results, fetched for
+        every package in a run up front. Packages are fetched here when not given.
+    """
+    packages = list(packages.items())
+    if lookups is None:
+        lookups = dict(zip(packages, fetch_packages(packages, [python_version], jobs, batch_size)))
+
+    results = [
+        result for package_name, package_version in packages
+        for result in package_results(package_name, package_version, lookups[(package_name, package_version)],
+                                      [python_version])
+    ]
+    report_results(results, [python_version], stop_at_error)
+
+
+def report_result(result, stop_at_error):
+    """
+    Prints a warning or error line for a Result that is not compatible with its Python version
+    """
+    upgrade_version = result.upgrade
+
+    if result.status == INCOMPATIBLE:
+        upgrade_available = ' - update to v{} for support'.format(upgrade_version) if upgrade_version else ''
+        message = '{}={} not compatible with Python {}{}'.format(result.package, result.version, result.python, upgrade_available)
+        color = get_terminal().red
+    elif result.status == UNSPECIFIED:
+        upgrade_available = ' - update to v{} for explicit support'.format(upgrade_version) if upgrade_version else ''
+        message = '{}={} version not specified{}'.format(result.package, result.version, upgrade_available)
+        color = get_terminal().yellow
+    elif result.status == SDIST_ONLY:
+        message = '{}={} has no wheel for Python {}, only an sdist'.format(result.package, result.version, result.python)
+        color = get_terminal().yellow
+    elif result.status == UNAVAILABLE and result.error:
+        message = '{}={} not available for Python {}: {}'.format(result.package, result.version, result.python, result.error)
+        color = get_terminal().red
+    elif result.status == UNAVAILABLE:
+        message = '{}={} not available on pip'.format(result.package, result.version)
+        color = get_terminal().red
+    elif result.status == ERROR:
+        message = '{}={} could not be looked up: {}'.format(result.package, result.version, result.error)
+        color = get_terminal().red
+    elif result.status == INVALID:
+        message = format_problem(result.package, result.error, result.source, result.line)
+        color = get_terminal().yellow
+    else:
+        return
+
+    if getattr(result, 'required_by', None):
+        message += ' - required by {}'.format(', '.join(result.required_by))
+
+    if stop_at_error:
+        sys.exit(message)
+    else:
+        print(color(message))
+
+
+# How each status is shown in a compatibility matrix
+MATRIX_CELLS = OrderedDict([
+    (COMPATIBLE, ('yes', 'green')),
+    (INCOMPATIBLE, ('no', 'red')),
+    (UNSPECIFIED, ('?', 'yellow')),
+    (UNAVAILABLE, ('-', 'red')),
+    (ERROR, ('!', 'red')),
+])
+# How each status is shown in a matrix of wheel availability
+WHEEL_MATRIX_CELLS = OrderedDict([
+    (WHEEL_AVAILABLE, ('whl', 'green')),
+    (SDIST_ONLY, ('src', 'yellow')),
+    (UNAVAILABLE, ('-', 'red')),
+    (ERROR, ('!', 'red')),
+])
+
+
+# Width of the package column of a matrix streamed before all packages are known
+STREAM_LABEL_WIDTH = 40
+
+# Requirements files found by `checkmyreqs scan`, besides any .txt file in a requirements directory
+SCAN_PATTERNS = ['requirements*.txt']
+SCAN_SKIPPED_DIRS = ['node_modules', 'site-packages', '__pycache__']
+DEFAULT_SCAN_OUTPUT = 'checkmyreqs-reports'
+
+# Output formats of a check: coloured text for people, or JSON records for dashboards and pipelines
+OUTPUT_FORMATS = ['text', 'json', 'jsonl']
+
+
+def check_matrix(packages, python_versions, stop_at_error, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE,
+                 lookups=None):
+    """
+    Checks a list of packages against several Python versions, printing a compatibility matrix
+    Each package's metadata is fetched once and checked against every version
+
+    :param packages: dict of packages names and versions
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :param lookups: dict of package name and version tuples to fetch_batch results, fetched here when not given
+    """
+    packages = list(packages.items())
+    if lookups is None:
+        lookups = dict(zip(packages, fetch_packages(packages, python_versions, jobs, batch_size)))
+
+    results = [
+        result for package_name, package_version in packages
+        for result in package_results(package_name, package_version, lookups[(package_name, package_version)],
+                                      python_versions)
+    ]
+    report_results(results, python_versions, stop_at_error)
+
+
+def report_results(results, python_versions, stop_at_error):
+    """
+    Prints the results of a requirements file, as problem lines for a single Python version or as a matrix
+    whose cells are left blank for the Python versions a pin's marker excludes
+    :param results: list of Result, with the results of a requirement for every version next to each other
+    :param python_versions: list of python versions the results are for
+    """
+    if len(python_versions) == 1:
+        for result in results:
+            report_result(result, stop_at_error)
+        return
+
+    rows = []
+    for _, row in groupby(results, key=lambda result: (result.source, result.line, result.package)):
+        row_results = dict((result.python, result) for result in row)
+        if None in row_results:
+            rows.append([row_results[None]])
+        else:
+            rows.append([row_results.get(python_version) for python_version in python_versions])
+    label_width = max(
+        [len('{}={}'.format(result.package, result.version)) for result in results if result.status != INVALID] +
+        [len('package')]
+    ) + 2
+
+    print_matrix_header(python_versions, label_width)
+    problems = sum(not report_matrix_row(row, python_versions, label_width) for row in rows)
+    wheels = any(result.status in (WHEEL_AVAILABLE, SDIST_ONLY) for result in results)
+    print_matrix_footer(problems, stop_at_error, WHEEL_MATRIX_CELLS if wheels else MATRIX_CELLS)
+
+
+def report_dependency_results(results, python_versions, stop_at_error):
+    """
+    Prints the DependencyResults of a run, as problem lines for a single Python version or as a matrix
+    whose cells are left blank for the Python versions a release isn't needed on
+    :param results: list of DependencyResult, from dependency_results
+    :param python_versions: list of python versions the results are for
+    """
+    if len(python_versions) == 1:
+        for result in results:
+            report_result(result, stop_at_error)
+        return
+
+    rows = []
+    for _, row in groupby(results, key=lambda result: (result.package, result.version)):
+        row_results = dict((result.python, result) for result in row)
+        rows.append([row_results.get(python_version) for python_version in python_versions])
+
+    label_width = max(
+        [len('{}={}'.format(result.package, result.version)) for result in results] + [len('package')]
+    ) + 2
+
+    print_matrix_header(python_versions, label_width)
+    problems = sum(not report_matrix_row(row, python_versions, label_width) for row in rows)
+    print_matrix_footer(problems, stop_at_error)
+
+
+def print_matrix_header(python_versions, label_width):
+    print('package'.ljust(label_width) + ''.join(version.ljust(_cell_width(python_versions)) for version in python_versions))
+
+
+def _cell_width(python_versions):
+    return max(len(version) for version in python_versions) + 2
+
+
+def report_matrix_row(results, python_versions, label_width):
+    """
+    Prints a package's row of a compatibility matrix
+    :param results: list of Result of the package for each of python_versions, or None for a blank cell
+    :param python_versions: list of python versions to be checked for support
+    :param label_width: width of the package column
+    :return: True if the package is compatible with every version
+    """
+    first = next(result for result in results if result is not None)
+    if first.status == INVALID:
+        report_result(first, False)
+        return True
+
+    cell_width = _cell_width(python_versions)
+    cells = []
+    upgrades = OrderedDict()
+    required_by = []
+
+    for result in results:
+        if result is None:
+            cells.append(''.ljust(cell_width))
+            continue
+        required_by.extend(getattr(result, 'required_by', None) or ())
+        text, color = MATRIX_CELLS.get(result.status) or WHEEL_MATRIX_CELLS[result.status]
+        cells.append(getattr(get_terminal(), color)(text.ljust(cell_width)))
+        if result.upgrade:
+            upgrades.setdefault(result.upgrade, []).append(result.python)
+
+    notes = ''.join(
+        ' - update to v{} for {}'.format(upgrade_version, ', '.join(versions))
+        for upgrade_version, versions in upgrades.items()
+    )
+    if required_by:
+        notes += ' - required by {}'.format(', '.join(_unique(required_by)))
+    print('{}={}'.format(first.package, first.version).ljust(label_width) + ''.join(cells) + notes)
+
+    return all(result is None or result.status in OK_STATUSES for result in results)
+
+
+def print_matrix_footer(problems, stop_at_error, cells=MATRIX_CELLS):
+    """
+    Prints the legend of a compatibility matrix
+    :param problems: number of packages not compatible with every version
+    :param cells: MATRIX_CELLS, or WHEEL_MATRIX_CELLS for a matrix of wheel availability
+    """
+    print('\n' + ', '.join('{}: {}'.format(text, status) for status, (text, _) in cells.items()))
+
+    if stop_at_error and problems:
+        sys.exit('{} package(s) not compatible with every Python version checked'.format(problems))
+
+
+def check_stream(req_file, python_versions, stop_at_error, jobs=DEFAULT_JOBS):
+    """
+    Checks packages while their requirements file is still being read, e.g. pip freeze piped to stdin
+    Parsing, lookups and reporting run as a pipeline, each package is reported as soon as it is checked
+
+    :param req_file: requirements file to check
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    """
+    source = getattr(req_file, 'name', None)
+    # Lines that can't be checked go through the pipeline too, so their warnings are printed in order
+    items = (
+        pinned_requirement_error(item) or (item.name, item.version)
+        for item in RequirementsResolver().resolve(iter_requirement_lines(req_file, source), source)
+    )
+    results = stream_packages(items, python_versions, jobs)
+    matrix = len(python_versions) > 1
+    problems = 0
+
+    if matrix:
+        print_matrix_header(python_versions, STREAM_LABEL_WIDTH)
+
+    try:
+        for package, lookup in results:
+            if isinstance(package, RequirementError):
+                if stop_at_error:
+                    raise package
+                print(get_terminal().yellow(str(package)))
+                continue
+
+            package_name, package_version = package
+            row = package_results(package_name, package_version, lookup, python_versions, source)
+            if matrix:
+                problems += not report_matrix_row(row, python_versions, STREAM_LABEL_WIDTH)
+            else:
+                report_result(row[0], stop_at_error)
+            sys.stdout.flush()
+    except RequirementError as e:
+        sys.exit(str(e))
+    finally:
+        results.close()
+
+    if matrix:
+        print_matrix_footer(problems, stop_at_error)
+
+
+def parse_python_versions(value):
+    """
+    Parses the -p/--python argument into a list of Python versions
+    :param value: comma separated X.Y versions or X.Y-X.Z ranges, e.g. 3.8,3.10,3.12 or 3.8-3.13
+    :return: list of X.Y versions in the order given, or None if value is invalid
+    """
+    python_versions = []
+
+    for part in value.split(','):
+        bounds = [PYTHON_VERSION_PATTERN.match(bound.strip()) for bound in part.split('-')]
+        if len(bounds) > 2 or not all(bounds):
+            return None
+
+        (major, first), (last_major, last) = bounds[0].groups(), bounds[-1].groups()
+        if major != last_major or int(first) > int(last):
+            return None
+
+        for minor in range(int(first), int(last) + 1):
+            version = '{}.{}'.format(major, minor)
+            if version not in python_versions:
+                python_versions.append(version)
+
+    return python_versions
+
+
+def read_requirements(requirements, strict=False, resolver=None):
+    """
+    Reads the requirements of a requirements file, following its includes
+    :param requirements: path or open requirements file
+    :param strict: raise RequirementError for lines that can't be checked, instead of returning them
+    :param resolver: RequirementsResolver shared by the files of a run
+    :return: tuple of the file's name and a list of Requirement and RequirementError
+    """
+    resolver = resolver or RequirementsResolver()
+
+    if hasattr(requirements, 'readline'):
+        source = getattr(requirements, 'name', None)
+        lines = iter_requirement_lines(requirements, source)
+    else:
+        source = requirements
+        lines = resolver.parse(requirements)
+
+    # Constraints apply to the whole file, including requirements read before them
+    constraints = {}
+    items = list(resolver.resolve(lines, source, constraints))
+    items = [constrain(item, constraints) if isinstance(item, Requirement) else item for item in items]
+
+    if strict:
+        for item in items:
+            error = pinned_requirement_error(item)
+            if error is not None:
+                raise error
+
+    return source, items
+
+
+def invalid_result(error):
+    """
+    :param error: RequirementError of a line that can't be checked
+    :return: INVALID Result for the line
+    """
+    return Result(INVALID, error.text, None, None, None, error.source, error.line, error.problem)
+
+
+# Marker string to its parse tree, see _parse_marker, or False if it is invalid
+_MARKER_CACHE = LRUCache(MARKER_CACHE_SIZE)
+
+
+def _marker_tokens(marker):
+    """
+    :param marker: environment marker
+    :return: list of (kind, value) tokens of the marker, kind being a MARKER_TOKEN_PATTERN group name
+    :raises ValueError: if the marker has something else in it
+    """
+    tokens = []
+    position = 0
+    marker = marker.rstrip()
+
+    while position < len(marker):
+        match = MARKER_TOKEN_PATTERN.match(marker, position)
+        if match is None:
+            raise ValueError('Invalid marker {!r}'.format(marker))
+
+        for kind in ('paren', 'boolean', 'operator', 'string', 'variable'):
+            if match.group(kind) is not None:
+                # `not  in` is written with any whitespace in between
+                tokens.append((kind, ' '.join(match.group(kind).split()) if kind == 'operator' else match.group(kind)))
+                break
+        position = match.end()
+
+    return tokens
+
+
+def _parse_marker(marker):
+    """
+    Parses an environment marker by recursive descent, following PEP 508: `and` binds tighter than `or`,
+    and parentheses group expressions
+
+    :param marker: environment marker
+    :return: parse tree, whose nodes are ('or', [nodes]), ('and', [nodes]) and ('clause', variable, operator,
+        value) comparisons of a variable with a string, turned around if the variable was on the right.
+        Comparisons of two strings or two variables have None as their variable.
+    :raises ValueError: if the marker is invalid
+    """
+    tokens = _marker_tokens(marker)
+    position = [0]
+
+    def peek():
+        return tokens[position[0]] if position[0] < len(tokens) else (None, None)
+
+    def take(kind, value=None):
+        token = peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise ValueError('Invalid marker {!r}'.format(marker))
+        position[0] += 1
+        return token[1]
+
+    def boolean(operator, operand):
+        nodes = [operand()]
+        while peek() == ('boolean', operator):
+            take('boolean')
+            nodes.append(operand())
+        return nodes[0] if len(nodes) == 1 else (operator, nodes)
+
+    def expression():
+        return boolean('or', conjunction)
+
+    def conjunction():
+        return boolean('and', comparison)
+
+    def comparison():
+        if peek() == ('paren', '('):
+            take('paren')
+            node = expression()
+            take('paren', ')')
+            return node
+
+        left_kind = peek()[0]
+        left = take('variable') if left_kind == 'variable' else take('string')
+        operator = take('operator')
+        right_kind = peek()[0]
+        right = take('variable') if right_kind == 'variable' else take('string')
+
+        if left_kind == 'variable' and right_kind == 'string':
+            return ('clause', left, operator, right)
+        if left_kind == 'string' and right_kind == 'variable' and operator in MARKER_REVERSED_OPERATORS:
+            return ('clause', right, MARKER_REVERSED_OPERATORS[operator], left)
+
+        return ('clause', None, operator, None)
+
+    tree = expression()
+    if position[0] != len(tokens):
+        raise ValueError('Invalid marker {!r}'.format(marker))
+
+    return tree
+
+
+def evaluate_marker(marker, extras=None, python_version=None):
+    """
+    Evaluates the environment marker of a dependency, e.g. `python_version < "3" and extra == "socks"`
+    Only extra, python_version and python_full_version comparisons are evaluated, any other comparison is taken to
+    hold, as is a marker that can't be parsed. `and` binds tighter than `or`, and parentheses group expressions.
+
+    :param marker: environment marker, or None
+    :param extras: extras requested of the package declaring the dependency, or None to take extra clauses to hold
+    :param python_version: X.Y python version, or None to take python version clauses to hold
+    :return: False if the marker excludes the dependency
+    """
+    if not marker:
+        return True
+
+    tree = _MARKER_CACHE.get(marker)
+    if tree is None:
+        try:
+            tree = _parse_marker(marker)
+        except ValueError:
+            tree = False
+        _MARKER_CACHE.set(marker, tree)
+
+    if tree is False:
+        return True
+
+    extras = None if extras is None else set(canonical_name(extra) for extra in extras)
+
+    def holds(node):
+        if node[0] == 'or':
+            return any(holds(child) for child in node[1])
+        if node[0] == 'and':
+            return all(holds(child) for child in node[1])
+
+        _, variable, operator, value = node
+
+        if variable == 'extra' and extras is not None and operator in ('==', '!='):
+            return (canonical_name(value) in extras) == (operator == '==')
+
+        # python_version is the X.Y version itself, while any X.Y.Z release can match python_full_version
+        if variable == 'python_version' and python_version is not None and operator not in ('in', 'not in'):
+            specifier = compile_version_specifier(operator + value)
+            return specifier is None or specifier.matches(python_version)
+
+        if variable == 'python_full_version' and python_version is not None and operator not in ('in', 'not in'):
+            requires_python = compile_requires_python(operator + value)
+            return requires_python is None or python_version in requires_python
+
+        return True
+
+    return holds(tree)
+
+
+def marker_targets(requirement, python_versions):
+    """
+    :param requirement: Requirement, whose marker may exclude some Python versions
+    :param python_versions: list of python versions to be checked for support
+    :return: list of the python versions the requirement's marker doesn't exclude
+    """
+    return [
+        python_version for python_version in python_versions
+        if evaluate_marker(requirement.marker, python_version=python_version)
+    ]
+
+
+def get_dependencies(package_info, extras=()):
+    """
+    :param package_info: package info dictionary, retrieved from pypi.python.org
+    :param extras: extras requested of the release
+    :return: list of Requirement of the release's requires_dist that can be looked up on the index, leaving out
+        those only needed for extras that weren't requested
+    """
+    dependencies = []
+
+    for text in (package_info or {}).get('requires_dist') or ():
+        try:
+            requirement = parse_requirement(text.strip())
+        except RequirementError:
+            continue
+
+        if requirement.url is None and evaluate_marker(requirement.marker, extras):
+            dependencies.append(requirement)
+
+    return dependencies
+
+
+# Specifier string to VersionSpecifier, or False if it is invalid
+_VERSION_SPECIFIER_CACHE = LRUCache(VERSION_SPECIFIER_CACHE_SIZE)
+
+
+def compile_version_specifier(specifier):
+    """
+    :param specifier: version specifier, e.g. `>=1.4,<2`
+    :return: compiled VersionSpecifier, or None if the specifier is empty or invalid
+    """
+    if not specifier:
+        return None
+
+    compiled = _VERSION_SPECIFIER_CACHE.get(specifier)
+
+    if compiled is None:
+        try:
+            compiled = VersionSpecifier(specifier)
+        except ValueError:
+            compiled = False
+        _VERSION_SPECIFIER_CACHE.set(specifier, compiled)
+
+    return compiled or None
+
+
+def select_release(specifiers, package_releases, python_version=None, release_infos=None):
+    """
+    Picks the release pip would install for a dependency, i.e. the newest one its specifiers allow
+    Pre-releases are only picked if no final release is allowed, and with a Python version, releases whose
+    requires_python excludes it are skipped
+
+    :param specifiers: tuple of (operator, version) tuples of a Requirement
+    :param package_releases: release list of the package, newest first
+    :param python_version: X.Y python version the release is installed on, or None to pick one for any
+    :param release_infos: dict of versions to their package info, releases missing from it are taken to allow
+        the Python version
+    :return: version of the release, or None if no release is allowed
+    """
+    compiled = compile_version_specifier(','.join(operator + version for operator, version in specifiers))
+    release_infos = release_infos or {}
+
+    def installable(version):
+        requires_python = get_requires_python(release_infos.get(version))
+        return python_version is None or requires_python is None or python_version in requires_python
+
+    allowed = [
+        version for version in package_releases if (not compiled or compiled.matches(version)) and installable(version)
+    ]
+    final_releases = [version for version in allowed if not is_prerelease(version)]
+
+    return (final_releases or allowed or [None])[0]
+
+
+def resolve_dependencies(requests, release_lists, python_versions, lookups, jobs=DEFAULT_JOBS,
+                         batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Picks the release pip would install for each of a list of dependencies on a Python version, see select_release
+    The newest release each dependency allows is looked up with fetch_packages, as it is reported on anyway. Only
+    when its requires_python excludes the Python version is the metadata of older releases fetched, newest first,
+    one batch for all the dependencies at a time, until a release allows it.
+
+    :param requests: list of (Requirement, python version) tuples, whose release list is in release_lists
+    :param release_lists: dict of canonical package names to their release list, from fetch_release_lists
+    :param python_versions: list of python versions to be checked for support
+    :param lookups: dict of (canonical package name, version) tuples to their fetch_batch result or LookupFailure,
+        which the lookups made here are added to
+    :return: list of the version picked for each request, or None if no release allowed by its specifiers
+        can be installed on its Python version
+    """
+    infos = {}
+    for (name, version), lookup in lookups.items():
+        infos.setdefault(name, {})[version] = {} if isinstance(lookup, LookupFailure) else lookup[0]
+
+    selected = [None] * len(requests)
+    pending = list(range(len(requests)))
+    first_step = True
+
+    while pending:
+        missing = OrderedDict()
+        waiting = []
+        for index in pending:
+            dependency, python_version = requests[index]
+            name = canonical_name(dependency.name)
+            release_infos = infos.setdefault(name, {})
+            selected[index] = select_release(dependency.specifiers, release_lists[name], python_version, release_infos)
+            if selected[index] is not None and selected[index] not in release_infos:
+                missing[(name, selected[index])] = None
+                waiting.append(index)
+
+        if first_step:
+            fetched = fetch_packages(list(missing), python_versions, jobs, batch_size)
+            lookups.update(zip(missing, fetched))
+            infos_fetched = [None if isinstance(lookup, LookupFailure) else lookup[0] for lookup in fetched]
+        else:
+            infos_fetched = call_in_batches([('release_data', node) for node in missing], jobs, batch_size)
+
+        for (name, version), info in zip(missing, infos_fetched):
+            # A release that can't be looked up is taken to allow the Python version, and reported as an error
+            infos[name][version] = {} if info is None or isinstance(info, LookupFailure) else info
+
+        pending = waiting
+        first_step = False
+
+    return selected
+
+
+def unresolved_version(requirement):
+    """
+    :param requirement: Requirement of a dependency no release could be picked for
+    :return: version its node is reported with, its specifiers, e.g. `>=1.0,<2`, or ANY_VERSION if it has none
+    """
+    return ','.join(operator + version for operator, version in requirement.specifiers) or ANY_VERSION
+
+
+class DependencyGraph(object):
+    """
+    Releases pinned in a requirements set, and the releases their requires_dist pull in, on each Python version
+
+    Nodes are (canonical package name, version) tuples. roots maps each pinned node to the set of Python versions
+    its markers allow it on. lookups maps each node to its fetch_batch result, or a LookupFailure, and edges maps
+    each node to a list of (dependency node, list of Python versions) tuples, the versions the dependency's marker
+    allows and it resolves to that node on. A dependency no release of which satisfies its specifiers has a node
+    whose version is the specifiers, or ANY_VERSION without any, with an empty release list.
+    """
+
+    def __init__(self):
+        self.roots = OrderedDict()
+        self.lookups = OrderedDict()
+        self.edges = {}
+
+    def required_by(self, python_version):
+        """
+        :param python_version: python version to follow the roots and edges of
+        :return: dict of each node needed on that Python version to the list of roots that pull it in
+        """
+        required_by = OrderedDict()
+
+        for root, root_versions in self.roots.items():
+            if python_version not in root_versions:
+                continue
+            stack = [root]
+            seen = set(stack)
+            while stack:
+                node = stack.pop()
+                required_by.setdefault(node, []).append(root)
+                for dependency, python_versions in self.edges.get(node, ()):
+                    if dependency not in seen and python_version in python_versions:
+                        seen.add(dependency)
+                        stack.append(dependency)
+
+        return required_by
+
+
+def build_dependency_graph(roots, python_versions, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE, lookups=None):
+    """
+    Expands the requires_dist of pinned releases into a DependencyGraph, one level of dependencies at a time
+    Dependencies are resolved on each Python version: pins and dependencies are only followed on the versions
+    their markers allow, and each dependency gets the newest release whose requires_python allows the version,
+    see resolve_dependencies. Each level's release lists, then its releases, are fetched concurrently and in
+    batches, and each node is fetched once, however many releases depend on it.
+
+    :param roots: list of (package name, version, extras, marker) tuples of the pinned releases
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :param lookups: dict of package name and version tuples to fetch_batch results already fetched for the roots
+    :return: DependencyGraph
+    """
+    graph = DependencyGraph()
+
+    lookups = dict(lookups or {})
+    missing = list(_unique((name, version) for name, version, _, _ in roots if (name, version) not in lookups))
+    lookups.update(zip(missing, fetch_packages(missing, python_versions, jobs, batch_size)))
+
+    # Every node looked up, including releases skipped for their requires_python, and the Python versions
+    # each node has been expanded on
+    fetched = {}
+    expanded = {}
+
+    level = OrderedDict()
+    for name, version, extras, marker in roots:
+        node = (canonical_name(name), version)
+        fetched[node] = graph.lookups.setdefault(node, lookups[(name, version)])
+        root_versions = [python_version for python_version in python_versions
+                         if evaluate_marker(marker, python_version=python_version)]
+        graph.roots.setdefault(node, set()).update(root_versions)
+        if root_versions:
+            node_extras, node_versions = level.setdefault(node, (set(), set()))
+            node_extras.update(extras)
+            node_versions.update(root_versions)
+
+    while level:
+        dependencies = []
+        for node, (extras, node_versions) in level.items():
+            expanded.setdefault(node, set()).update(node_versions)
+            graph.edges.setdefault(node, [])
+            lookup = graph.lookups[node]
+            if isinstance(lookup, LookupFailure):
+                continue
+            for dependency in get_dependencies(lookup[0], extras):
+                dependency_versions = [
+                    python_version for python_version in python_versions
+                    if python_version in node_versions and evaluate_marker(dependency.marker, python_version=python_version)
+                ]
+                if dependency_versions:
+                    dependencies.append((node, dependency, dependency_versions))
+
+        release_lists = fetch_release_lists([canonical_name(dependency.name) for _, dependency, _ in dependencies],
+                                            jobs, batch_size)
+
+        requests = list(_unique(
+            (dependency, python_version) for _, dependency, dependency_versions in dependencies
+            for python_version in dependency_versions
+            if not isinstance(release_lists[canonical_name(dependency.name)], LookupFailure)
+        ))
+        selected = dict(zip(requests, resolve_dependencies(requests, release_lists, python_versions, fetched, jobs,
+                                                           batch_size)))
+
+        next_level = OrderedDict()
+        for parent, dependency, dependency_versions in dependencies:
+            name = canonical_name(dependency.name)
+            package_releases = release_lists[name]
+            nodes = OrderedDict()
+
+            for python_version in dependency_versions:
+                if isinstance(package_releases, LookupFailure):
+                    version = unresolved_version(dependency)
+                    fetched[(name, version)] = package_releases
+                else:
+                    # pip can't install the dependency when no release allows the Python version, so the newest
+                    # release is reported, as incompatible
+                    version = (selected[(dependency, python_version)] or
+                               select_release(dependency.specifiers, package_releases))
+                    if version is None:
+                        version = unresolved_version(dependency)
+                        fetched[(name, version)] = ({}, [], None, {})
+                nodes.setdefault((name, version), []).append(python_version)
+
+            for node, node_versions in nodes.items():
+                graph.edges[parent].append((node, node_versions))
+                new_versions = set(node_versions) - expanded.get(node, set())
+                if new_versions:
+                    node_extras, level_versions = next_level.setdefault(node, (set(), set()))
+                    node_extras.update(dependency.extras)
+                    level_versions.update(new_versions)
+
+        missing = [node for node in next_level if node not in fetched]
+        fetched.update(zip(missing, fetch_packages(missing, python_versions, jobs, batch_size)))
+        for node in next_level:
+            graph.lookups.setdefault(node, fetched[node])
+
+        level = next_level
+
+    return graph
+
+
+class DependencyResult(namedtuple('DependencyResult', Result._fields + ('required_by',))):
+    """
+    Result of a release pulled in by the requires_dist of pinned packages, as returned by check with transitive
+    Its source and line are None, and required_by is the list of pinned `name==version` that pull it in.
+    """
+
+    __slots__ = ()
+
+
+def dependency_results(graph, python_versions):
+    """
+    :param graph: DependencyGraph of the pinned packages of a run
+    :param python_versions: list of python versions to be checked for support
+    :return: list of DependencyResult of every node, for each Python version it is needed on and isn't pinned on,
+        with the results of a node next to each other
+    """
+    required_by = dict((python_version, graph.required_by(python_version)) for python_version in python_versions)
+    results = []
+
+    for node, lookup in graph.lookups.items():
+        name, version = node
+        for python_version in python_versions:
+            # Pins are reported with their files, on the versions their markers allow
+            if node not in required_by[python_version] or python_version in graph.roots.get(node, ()):
+                continue
+            result = package_results(name, version, lookup, [python_version])[0]
+            results.append(DependencyResult(*result, required_by=[
+                '{}=={}'.format(root_name, root_version) for root_name, root_version in required_by[python_version][node]
+            ]))
+
+    return results
+
+
+# (python version, platform) to the frozenset of wheel tags that install there
+_SUPPORTED_TAGS_CACHE = LRUCache(SUPPORTED_TAGS_CACHE_SIZE)
+
+
+def platform_tags(platform):
+    """
+    :param platform: platform tag, e.g. manylinux_2_28_x86_64, musllinux_1_2_aarch64, macosx_11_0_arm64 or win_amd64
+    :return: list of the platform tags of wheels that install on the platform, e.g. manylinux_2_17_x86_64 and
+        manylinux2014_x86_64 on manylinux_2_28_x86_64
+    """
+    match = PLATFORM_PATTERN.match(platform)
+
+    if match is None:
+        return [platform]
+
+    arch = match.group('arch')
+
+    if match.group('macos_major'):
+        major, minor = int(match.group('macos_major')), int(match.group('macos_minor'))
+        # Since macOS 11, minor releases are binary compatible and wheels are tagged with X_0
+        if major >= 11:
+            versions = [(version, 0) for version in range(major, 10, -1)] + [(10, version) for version in range(16, -1, -1)]
+        else:
+            versions = [(major, version) for version in range(minor, -1, -1)]
+        return [
+            'macosx_{}_{}_{}'.format(version_major, version_minor, binary_format)
+            for version_major, version_minor in versions for binary_format in MACOS_ARCHITECTURES.get(arch, [arch])
+        ]
+
+    if match.group('legacy'):
+        libc, (major, minor) = 'manylinux', LEGACY_MANYLINUX[match.group('legacy')]
+    else:
+        libc, major, minor = match.group('libc'), int(match.group('libc_major')), int(match.group('libc_minor'))
+
+    tags = ['{}_{}_{}_{}'.format(libc, major, version, arch) for version in range(minor, -1, -1)]
+    if libc == 'manylinux':
+        # manylinux2014 is the first of them with architectures other than x86
+        tags.extend(
+            '{}_{}'.format(legacy, arch) for legacy, glibc in LEGACY_MANYLINUX.items()
+            if glibc <= (major, minor) and (legacy == 'manylinux2014' or arch in ('x86_64', 'i686'))
+        )
+
+    return tags + ['linux_{}'.format(arch)]
+
+
+def supported_tags(python_version, platform):
+    """
+    Lists the wheel tags CPython installs on a platform, as pip does
+    :param python_version: X.Y python version
+    :param platform: platform tag, see platform_tags
+    :return: frozenset of (python tag, abi tag, platform tag) tuples
+    """
+    tags = _SUPPORTED_TAGS_CACHE.get((python_version, platform))
+
+    if tags is None:
+        major, minor = python_version.split('.')
+        interpreter = 'cp{}{}'.format(major, minor)
+        # Before 3.8, the ABI of a default build has the pymalloc flag, and 2.7 also comes with wide unicode
+        abis = [interpreter + ('m' if (int(major), int(minor)) < (3, 8) else '')] + ([interpreter + 'mu'] if major == '2' else [])
+        platforms = platform_tags(platform)
+
+        tags = set(product([interpreter], abis + ['none'], platforms))
+        if major == '3':
+            tags.update(product(['cp3{}'.format(version) for version in range(2, int(minor) + 1)], ['abi3'], platforms))
+
+        pythons = ['py{}'.format(major)] + ['py{}{}'.format(major, version) for version in range(int(minor), -1, -1)]
+        tags.update(product(pythons, ['none'], platforms + ['any']))
+        tags.add((interpreter, 'none', 'any'))
+
+        tags = frozenset(tags)
+        _SUPPORTED_TAGS_CACHE.set((python_version, platform), tags)
+
+    return tags
+
+
+class WheelIndex(object):
+    """
+    Wheel tags and source distributions among the files of a release
+    Compressed tag sets, as in `py2.py3-none-any`, are expanded, so `support` is a single set intersection.
+    """
+
+    __slots__ = ('tags', 'sdist')
+
+    def __init__(self, filenames):
+        tags = set()
+        self.sdist = False
+
+        for filename in filenames:
+            match = WHEEL_FILENAME_PATTERN.match(filename)
+            if match:
+                tags.update(product(*(match.group(part).lower().split('.') for part in ('python', 'abi', 'platform'))))
+            elif filename.lower().endswith(SDIST_EXTENSIONS):
+                self.sdist = True
+
+        self.tags = frozenset(tags)
+
+    def support(self, target_tags):
+        """
+        :param target_tags: set of the wheel tags of the target, from supported_tags
+        :return: WHEEL_AVAILABLE, SDIST_ONLY or UNAVAILABLE
+        """
+        if not self.tags.isdisjoint(target_tags):
+            return WHEEL_AVAILABLE
+
+        return SDIST_ONLY if self.sdist else UNAVAILABLE
+
+
+def wheel_results(package_name, package_version, files, python_versions, platform, source=None, line=None):
+    """
+    :param files: file names of the release, or a LookupFailure
+    :param python_versions: list of python versions to be checked for a wheel
+    :param platform: platform tag to be checked for a wheel, see platform_tags
+    :param source: name of the requirements file the package was read from
+    :param line: line number the package was read from
+    :return: list of Result of the package for each Python version, whose status is WHEEL_AVAILABLE, SDIST_ONLY,
+        UNAVAILABLE or ERROR
+    """
+    if isinstance(files, LookupFailure):
+        return [
+            Result(ERROR, package_name, package_version, python_version, None, source, line, str(files.error))
+            for python_version in python_versions
+        ]
+
+    index = WheelIndex(files)
+    results = []
+
+    for python_version in python_versions:
+        status = index.support(supported_tags(python_version, platform))
+        error = 'no sdist, and no wheel for {}'.format(platform) if status == UNAVAILABLE and files else None
+        results.append(Result(status, package_name, package_version, python_version, None, source, line, error))
+
+    return results
+
+
+def check_files(requirements, python_versions, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE, strict=False,
+                transitive=False, platform=None, resolver=None):
+    """
+    Checks requirements files against Python versions, looking each package version up once for all files
+    :param requirements: list of paths or open requirements files
+    :param python_versions: list of python versions to be checked for support
+    :param transitive: also check the releases the packages depend on, see build_dependency_graph
+    :param platform: check that the files of each release include a wheel for this platform, see wheel_results,
+        instead of checking classifiers
+    :param resolver: RequirementsResolver following the files' includes, defaults to one reading them from disk
+    :return: list with a list of Result for each file, see check, followed by a list of DependencyResult
+        with transitive
+    """
+    if transitive and platform:
+        raise ValueError('Dependencies are checked with classifiers, not for a platform')
+
+    resolver = resolver or RequirementsResolver()
+    files = [read_requirements(req_file, strict, resolver) for req_file in requirements]
+
+    pinned = [item for _, items in files for item in items if pinned_requirement_error(item) is None]
+    plan = list(OrderedDict.fromkeys((item.name, item.version) for item in pinned))
+    if platform:
+        lookups = dict(zip(plan, fetch_release_files(plan, jobs, batch_size)))
+    else:
+        lookups = dict(zip(plan, fetch_packages(plan, python_versions, jobs, batch_size)))
+
+    file_results = []
+    for _, items in files:
+        results = []
+        for item in items:
+            error = pinned_requirement_error(item)
+            if error is not None:
+                results.append(invalid_result(error))
+            elif platform:
+                results.extend(wheel_results(item.name, item.version, lookups[(item.name, item.version)],
+                                             marker_targets(item, python_versions), platform, item.source, item.line))
+            else:
+                results.extend(package_results(item.name, item.version, lookups[(item.name, item.version)],
+                                               marker_targets(item, python_versions), item.source, item.line))
+        file_results.append(results)
+
+    if transitive:
+        roots = [(item.name, item.version, item.extras, item.marker) for item in pinned]
+        graph = build_dependency_graph(roots, python_versions, jobs, batch_size, lookups)
+        file_results.append(dependency_results(graph, python_versions))
+
+    return file_results
+
+
+def check(requirements, targets, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE, strict=False, transitive=False,
+          platform=None):
+    """
+    Checks requirements files for compatibility with Python versions, returning results instead of printing them
+    Uses the backend set up by setup_backend, or looks packages up on pypi
+
+    :param requirements: path or open requirements file, or a list of them
+    :param targets: Python version(s), as a list or in -p/--python format, e.g. '3.4', ['2.7', '3.4'] or '3.8-3.13'
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :param strict: raise RequirementError for lines that can't be checked, instead of INVALID results
+    :param transitive: also check the releases the packages depend on
+    :param platform: platform tag, e.g. manylinux_2_28_x86_64, to check each release has a wheel for, instead of
+        checking classifiers. Results are then WHEEL_AVAILABLE, SDIST_ONLY, UNAVAILABLE or ERROR.
+    :return: list of Result, for each requirement line and Python version its marker doesn't exclude, in the order of
+        the files and their lines, followed with transitive by a DependencyResult for each release pulled in and Python version it is needed on
+    """
+    if isinstance(targets, (list, tuple)):
+        targets = ','.join(targets)
+
+    python_versions = parse_python_versions(targets)
+    if not python_versions:
+        raise ValueError('Invalid Python versions {!r}: must be X.Y versions or X.Y-X.Z ranges'.format(targets))
+
+    if not isinstance(requirements, (list, tuple)):
+        requirements = [requirements]
+
+    return [
+        result for results in check_files(requirements, python_versions, jobs, batch_size, strict, transitive, platform)
+        for result in results
+    ]
+
+
+def timed_lookup(item, python_versions, platform=None):
+    """
+    Fetches the pypi metadata of a requirement line, timing the lookup
+    :param item: Requirement or RequirementError, from iter_requirement_lines, or a RepeatedPin
+    :param python_versions: list of python versions to be checked for support
+    :param platform: platform tag, to fetch the release's files instead
+    :return: tuple of item, its fetch_batch result, file names or LookupFailure (None for lines that can't be
+        checked and repeated pins) and the seconds the lookup took
+    """
+    if isinstance(item, RepeatedPin):
+        return item.requirement, None, 0.0
+
+    if pinned_requirement_error(item) is not None:
+        return item, None, 0.0
+
+    started = time.time()
+    if platform:
+        lookup = fetch_release_files([(item.name, item.version)], jobs=1)[0]
+    else:
+        _, lookup = fetch_package((item.name, item.version), python_versions)
+
+    return item, lookup, time.time() - started
+
+
+class RepeatedPin(namedtuple('RepeatedPin', ['requirement'])):
+    """
+    Requirement pinning a package version already pinned earlier in a run, which isn't looked up again
+    """
+
+    __slots__ = ()
+
+
+def _mark_repeated_pins(items):
+    pinned = set()
+
+    for item in items:
+        if pinned_requirement_error(item) is None:
+            if (item.name, item.version) in pinned:
+                item = RepeatedPin(item)
+            else:
+                pinned.add((item.name, item.version))
+        yield item
+
+
+def iter_timed_results(requirements, python_versions, jobs=DEFAULT_JOBS, transitive=False, platform=None,
+                       resolver=None):
+    """
+    Checks requirements files like check, yielding each result as soon as it is known
+    Files are read, looked up and checked as a pipeline, with up to `jobs` lookups running concurrently,
+    and results are yielded in the order of the files and their lines. A package version pinned again, e.g.
+    in another file, shares the lookup of its first pin and is given 0 seconds.
+
+    :param requirements: list of paths or open requirements files
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    :param transitive: also check the releases the packages depend on, once every file is checked. Their
+        lookups are made together, and each DependencyResult is given the seconds they all took.
+    :param platform: platform tag to check each release has a wheel for, see wheel_results
+    :param resolver: RequirementsResolver following the files' includes, defaults to one reading them from disk
+    :return: generator of (Result, seconds its lookup took, seconds since the check started) tuples
+    """
+    if transitive and platform:
+        raise ValueError('Dependencies are checked with classifiers, not for a platform')
+
+    started = time.time()
+    roots = []
+    pin_lookups = {}
+    resolver = resolver or RequirementsResolver()
+    lines = (
+        item for source, req_file in _open_requirements(requirements)
+        for item in resolver.resolve(iter_requirement_lines(req_file, source), source)
+    )
+    lines = _mark_repeated_pins(lines)
+    lookup = partial(timed_lookup, python_versions=python_versions, platform=platform)
+
+    if jobs <= 1:
+        # Not map, which reads every line before looking any up on Python 2
+        lookups = (lookup(item) for item in lines)
+    else:
+        pool = multiprocessing_pool.ThreadPool(jobs)
+        lookups = pool.imap(lookup, lines)
+
+    try:
+        for item, package_lookup, seconds in lookups:
+            error = pinned_requirement_error(item)
+            if error is None:
+                # Results keep the order of the lines, so the first pin's lookup is already known
+                package_lookup = pin_lookups.setdefault((item.name, item.version), package_lookup)
+
+            if error is not None:
+                results = [invalid_result(error)]
+            elif platform:
+                results = wheel_results(item.name, item.version, package_lookup, marker_targets(item, python_versions),
+                                        platform, item.source, item.line)
+            else:
+                results = package_results(item.name, item.version, package_lookup,
+                                          marker_targets(item, python_versions), item.source, item.line)
+                roots.append((item.name, item.version, item.extras, item.marker))
+
+            for result in results:
+                yield result, seconds, time.time() - started
+    finally:
+        if jobs > 1:
+            pool.terminate()
+            pool.join()
+
+    if transitive:
+        graph_started = time.time()
+        graph = build_dependency_graph(roots, python_versions, jobs, lookups=pin_lookups)
+        seconds = time.time() - graph_started
+
+        for result in dependency_results(graph, python_versions):
+            yield result, seconds, time.time() - started
+
+
+def _open_requirements(requirements):
+    """
+    :param requirements: list of paths or open requirements files
+    :return: generator of file name and open file tuples, opening each path only when it is reached
+    """
+    for requirement_file in requirements:
+        if hasattr(requirement_file, 'readline'):
+            yield getattr(requirement_file, 'name', None), requirement_file
+        else:
+            with open(requirement_file) as req_file:
+                yield requirement_file, req_file
+
+
+class PythonSupport(object):
+    """
+    Python versions and implementations a release lists as supported in its classifiers
+
+    versions holds X.Y versions, majors holds X versions listed on their own, as in
+    `Programming Language :: Python :: 3`, and implementations holds names such as CPython.
+    `version in support` checks against both versions and majors, and a PythonSupport is only true when either
+    lists a version, as implementation classifiers don't tell which versions are supported.
+    """
+
+    __slots__ = ('versions', 'majors', 'implementations')
+
+    def __init__(self, versions=(), majors=(), implementations=()):
+        self.versions = frozenset(versions)
+        self.majors = frozenset(majors)
+        self.implementations = frozenset(implementations)
+
+    def __contains__(self, python_version):
+        return python_version in self.versions or python_version in self.majors
+
+    def __bool__(self):
+        return bool(self.versions or self.majors)
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        return isinstance(other, PythonSupport) and (
+            (self.versions, self.majors, self.implementations) == (other.versions, other.majors, other.implementations)
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.versions, self.majors, self.implementations))
+
+    def __repr__(self):
+        return 'PythonSupport(versions={}, majors={}, implementations={})'.format(
+            sorted(self.versions), sorted(self.majors), sorted(self.implementations)
+        )
+
+
+# Classifier tuple to PythonSupport, releases of a package mostly share the same classifiers
+_PYTHON_SUPPORT_CACHE = LRUCache(PYTHON_SUPPORT_CACHE_SIZE)
+
+
+def get_supported_pythons(package_info):
+    """
+    Returns the supported python versions for a specific package version
+    :param package_info: package info dictionary, retrieved from pypi.python.org
+    :return: PythonSupport of the Versions of Python supported, may be empty
+    """
+    classifiers = tuple((package_info or {}).get('classifiers') or ())
+    support = _PYTHON_SUPPORT_CACHE.get(classifiers)
+
+    if support is None:
+        versions, majors, implementations = set(), set(), set()
+
+        for c in classifiers:
+            match = PYTHON_CLASSIFIER_PATTERN.match(c.strip())
+            if match is None:
+                continue
+            if match.group('implementation'):
+                implementations.add(match.group('implementation').strip())
+            elif match.group('minor') is not None:
+                versions.add('{}.{}'.format(match.group('major'), match.group('minor')))
+            else:
+                majors.add(match.group('major'))
+
+        support = PythonSupport(versions, majors, implementations)
+        _PYTHON_SUPPORT_CACHE.set(classifiers, support)
+
+    return support
+
+
+class VersionSpecifier(object):
+    """
+    Compiled version specifier, e.g. `>=1.4, !=1.5.*, <2`
+    `matches(version)` checks a version string against every clause.
+    """
+
+    __slots__ = ('specifier', 'clauses')
+
+    def __init__(self, specifier):
+        self.specifier = specifier
+        self.clauses = []
+
+        for clause in specifier.split(','):
+            match = REQUIRES_PYTHON_CLAUSE_PATTERN.match(clause)
+            if not match or VERSION_PATTERN.match(match.group(2)) is None:
+                raise ValueError('Invalid version specifier {!r}'.format(specifier))
+
+            operator, version, wildcard = match.groups()
+            release = _release(version)
+            if wildcard and operator not in ('==', '!='):
+                raise ValueError('Invalid version specifier {!r}'.format(specifier))
+            if operator == '~=' and len(release) < 2:
+                raise ValueError('Invalid version specifier {!r}'.format(specifier))
+
+            self.clauses.append((operator, version, version_key(version), release, bool(wildcard)))
+
+    def matches(self, candidate):
+        if VERSION_PATTERN.match(candidate.strip()) is None:
+            return False
+
+        key = version_key(candidate)
+        release = _release(candidate)
+
+        for operator, version, clause_key, clause_release, wildcard in self.clauses:
+            padded = release + (0,) * (len(clause_release) - len(release))
+
+            if wildcard:
+                matched = padded[:len(clause_release)] == clause_release
+                if matched != (operator == '=='):
+                    return False
+            elif operator == '===':
+                if candidate != version:
+                    return False
+            elif operator == '~=':
+                if key < clause_key or padded[:len(clause_release) - 1] != clause_release[:-1]:
+                    return False
+            elif not {
+                '==': key == clause_key, '!=': key != clause_key, '<': key < clause_key,
+                '<=': key <= clause_key, '>': key > clause_key, '>=': key >= clause_key,
+            }[operator]:
+                return False
+
+        return True
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.specifier)
+
+
+def _release(version):
+    """
+    :param version: PEP 440 version string
+    :return: tuple of the numbers of the version's release segment, e.g. (1, 4) for 1.4rc1
+    """
+    return tuple(int(part) for part in VERSION_PATTERN.match(version.strip()).group('release').split('.'))
+
+
+class RequiresPython(VersionSpecifier):
+    """
+    Compiled requires_python specifier of a release, e.g. `>=3.6, !=3.7.*`
+
+    `version in requires_python` checks an X.Y Python version, which is allowed if any of its X.Y.Z releases
+    satisfies every clause. The versions tried are X.Y.0, X.Y.1 and the patch releases either side of each X.Y.Z
+    the clauses mention, which is enough to cover every interval the clauses can describe.
+    """
+
+    __slots__ = ('_results',)
+
+    def __init__(self, specifier):
+        super(RequiresPython, self).__init__(specifier)
+        self._results = {}
+
+    def __contains__(self, python_version):
+        result = self._results.get(python_version)
+
+        if result is None:
+            result = any(self.matches(candidate) for candidate in self._candidates(python_version))
+            self._results[python_version] = result
 
-try:
-    # Different location in Python 3
-    from xmlrpc.client import ServerProxy
-except ImportError:
-    from xmlrpclib import ServerProxy
+        return result
 
+    def _candidates(self, python_version):
+        major, minor = (int(part) for part in python_version.split('.'))
+        patches = set([0, 1])
 
-BASE_PATH = os.path.dirname(os.path.abspath(__file__))
-CLIENT = ServerProxy('https://pypi.python.org/pypi')
+        for _, _, _, release, _ in self.clauses:
+            if release[:2] == (major, minor) and len(release) > 2:
+                patches.update((max(release[2] - 1, 0), release[2], release[2] + 1))
 
-IGNORED_PREFIXES = ['#', 'git+', 'hg+', 'svn+', 'bzr+', '\n', '\r\n']
+        return ['{}.{}.{}'.format(major, minor, patch) for patch in sorted(patches)]
 
 
-def parse_requirements_file(req_file, stop_at_error):
+# requires_python string to RequiresPython, or False if it is invalid. Thousands of releases share a handful.
+_REQUIRES_PYTHON_CACHE = LRUCache(PYTHON_SUPPORT_CACHE_SIZE)
+
+
+def get_requires_python(package_info):
     """
-    Parse a requirements file, returning packages with versions in a dictionary
-    :param req_file: requirements file to parse
+    :param package_info: package info dictionary, retrieved from pypi.python.org
+    :return: compiled RequiresPython of the release, or None if it has none or it is invalid
+    """
+    return compile_requires_python((package_info or {}).get('requires_python'))
 
-    :return dict of package names and versions
+
+def compile_requires_python(specifier):
+    """
+    :param specifier: requires_python string, or a Python version specifier from an environment marker
+    :return: compiled RequiresPython, or None if the specifier is empty or invalid
     """
-    packages = {}
+    specifier = (specifier or '').strip()
 
-    for line in req_file:
-        line = line.strip()
-        for prefix in IGNORED_PREFIXES:
-            if not line or line.startswith(prefix):
-                line = None
-                break
-        if line:
-            line = line.strip()
+    if not specifier:
+        return None
 
-            if '==' in line:
-                package_name, version = line.split('==')
-                packages[package_name] = version
-            else:
-                if stop_at_error:
-                    sys.exit('{} does not have a valid version number'.format(line))
-                else:
-                    print(TERMINAL.yellow('{} does not have a valid version number'.format(line)))
+    requires_python = _REQUIRES_PYTHON_CACHE.get(specifier)
 
-    return packages
+    if requires_python is None:
+        try:
+            requires_python = RequiresPython(specifier)
+        except ValueError:
+            requires_python = False
+        _REQUIRES_PYTHON_CACHE.set(specifier, requires_python)
 
+    return requires_python or None
 
-def check_packages(packages, python_version, stop_at_error):
+
+def release_support(package_info, python_version):
     """
-    Checks a list of packages for compatibility with the given Python version
-    Prints warning line if the package is not supported for the given Python version
-    If upgrading the package will allow compatibility, the version to upgrade is printed
-    If the package is not listed on pypi.python.org, error line is printed
+    Decides whether a release supports a Python version, from its requires_python and its classifiers
+    A requires_python that excludes the version makes the release incompatible, as pip won't install it.
+    Otherwise classifiers decide, and a requires_python that allows the version stands in for missing classifiers.
 
-    :param packages: dict of packages names and versions
+    :param package_info: package info dictionary, retrieved from pypi.python.org
     :param python_version: python version to be checked for support
+    :return: COMPATIBLE, INCOMPATIBLE or UNSPECIFIED
     """
+    requires_python = get_requires_python(package_info)
 
-    for package_name, package_version in packages.items():
-        # print(TERMINAL.bold(package_name))
+    if requires_python is not None and python_version not in requires_python:
+        return INCOMPATIBLE
 
-        package_info = CLIENT.release_data(package_name, package_version)
-        package_releases = CLIENT.package_releases(package_name)
+    supported_pythons = get_supported_pythons(package_info)
 
-        if package_releases:
-            supported_pythons = get_supported_pythons(package_info)
+    if is_supported(python_version, supported_pythons):
+        return COMPATIBLE
 
+    # Classifiers without this version mean it isn't supported
+    if supported_pythons:
+        return INCOMPATIBLE
 
-            # Some entries list support of Programming Language :: Python :: 3
-            # So we also want to check the major revision number of the version
-            # against the list of supported versions
-            major_python_version = python_version.split('.')[0]
+    return COMPATIBLE if requires_python is not None else UNSPECIFIED
 
-            if python_version in supported_pythons:
-                pass
-                # print(TERMINAL.green('compatible'))
-            elif major_python_version in supported_pythons:
-                pass
-                # print(TERMINAL.green('compatible'))
-            else:
-                latest_version = package_releases[0]
-                latest_package_info = CLIENT.release_data(package_name, latest_version)
-                latest_supported_pythons = get_supported_pythons(latest_package_info)
 
-                upgrade_available = ''
+def add_lookup_arguments(parser):
+    """
+    Adds the arguments controlling how packages are looked up
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        '-j', '--jobs', required=False,
+        help='Number of packages to look up on pypi concurrently (default {})'.format(DEFAULT_JOBS),
+        type=int, default=DEFAULT_JOBS
+    )
+    parser.add_argument(
+        '-b', '--backend', required=False,
+        help='Where to look packages up (default {})'.format(DEFAULT_BACKEND),
+        choices=list(BACKENDS), default=DEFAULT_BACKEND
+    )
+    parser.add_argument(
+        '-i', '--index-url', required=False,
+        help='Base url of the package index (default {} for json, {} for xmlrpc)'.format(PYPI_JSON_URL, PYPI_URL)
+    )
+    parser.add_argument(
+        '--batch-size', required=False,
+        help='Number of packages to look up in each xmlrpc request (default {})'.format(DEFAULT_BATCH_SIZE),
+        type=int, default=DEFAULT_BATCH_SIZE
+    )
+    parser.add_argument(
+        '--pool-size', required=False,
+        help='Persistent connections to keep open to the index (default {})'.format(DEFAULT_POOL_SIZE),
+        type=int, default=DEFAULT_POOL_SIZE
+    )
+    parser.add_argument(
+        '--pool-idle-timeout', required=False,
+        help='Seconds an unused connection is kept open (default {})'.format(DEFAULT_POOL_IDLE_TIMEOUT),
+        type=float, default=DEFAULT_POOL_IDLE_TIMEOUT
+    )
+    parser.add_argument(
+        '--timeout', required=False,
+        help='Seconds to wait for the index to answer a request (default {})'.format(DEFAULT_TIMEOUT),
+        type=float, default=DEFAULT_TIMEOUT
+    )
+    parser.add_argument(
+        '--retries', required=False,
+        help='Times to retry a failed or throttled request, with backoff (default {})'.format(DEFAULT_RETRIES),
+        type=int, default=DEFAULT_RETRIES
+    )
+    parser.add_argument(
+        '--rate', required=False,
+        help='Most requests per second to send to the index, 0 for no limit (default {})'.format(DEFAULT_RATE),
+        type=float, default=DEFAULT_RATE
+    )
+    parser.add_argument(
+        '--cache-dir', required=False,
+        help='Directory to cache pypi metadata in (default {})'.format(DEFAULT_CACHE_DIR),
+        default=DEFAULT_CACHE_DIR
+    )
+    parser.add_argument(
+        '--cache-ttl', required=False,
+        help='Seconds before cached release lists are fetched again (default {})'.format(DEFAULT_CACHE_TTL),
+        type=int, default=DEFAULT_CACHE_TTL
+    )
+    parser.add_argument(
+        '--no-cache', required=False,
+        help='Always fetch metadata from pypi, without reading or writing the cache',
+        action='store_true'
+    )
+
 
+def setup_backend(args, offline=False):
+    """
+    Validates the lookup arguments and sets up the metadata backend they ask for
+    :param args: parsed arguments, see add_lookup_arguments
+    :param offline: answer lookups from the snapshot at args.snapshot instead of the network
+    """
+    global METADATA_BACKEND
 
-                if supported_pythons:
+    if args.jobs < 1:
+        sys.exit('Jobs argument invalid: Must be at least 1')
 
-                    if python_version in latest_supported_pythons:
-                        upgrade_available = ' - update to v{} for support'.format(latest_version)
-                    if stop_at_error:
-                        sys.exit('{}={} not compatible with Python {}{}'.format(package_name, package_version, python_version, upgrade_available))
-                    else:
-                        print(TERMINAL.red('{}={} not compatible with Python {}{}'.format(package_name, package_version, python_version, upgrade_available)))
-                else:
-                    # We get here if there was not compatability information for
-                    # the package version we requested
+    if args.batch_size < 1:
+        sys.exit('Batch size argument invalid: Must be at least 1')
 
-                    if python_version in latest_supported_pythons:
-                        upgrade_available = ' - update to v{} for explicit support'.format(latest_version)
-                    if stop_at_error:
-                        sys.exit('{}={} version not specified{}'.format(package_name, package_version, upgrade_available))
-                    else:
-                        print(TERMINAL.yellow('{}={} version not specified{}'.format(package_name, package_version, upgrade_available)))
+    if offline:
+        if not os.path.exists(args.snapshot):
+            sys.exit('Snapshot {} not found, build one with: checkmyreqs snapshot build'.format(args.snapshot))
+        METADATA_BACKEND = SnapshotBackend(args.snapshot)
+        return
 
+    if args.pool_size < 1:
+        sys.exit('Pool size argument invalid: Must be at least 1')
+
+    if args.timeout <= 0:
+        sys.exit('Timeout argument invalid: Must be more than 0')
+
+    if args.retries < 0:
+        sys.exit('Retries argument invalid: Must be at least 0')
+
+    if args.rate < 0:
+        sys.exit('Rate argument invalid: Must be at least 0')
+
+    pool = ConnectionPool(
+        args.pool_size, args.pool_idle_timeout, args.timeout, RetryPolicy(args.retries),
+        TokenBucket(args.rate) if args.rate else None
+    )
+    backend_class = BACKENDS[args.backend]
+    METADATA_BACKEND = backend_class(args.index_url, pool) if args.index_url else backend_class(pool=pool)
+    if not args.no_cache:
+        cache = MetadataCache(os.path.join(args.cache_dir, 'metadata.sqlite'), args.cache_ttl)
+        METADATA_BACKEND = CachedBackend(METADATA_BACKEND, cache)
+
+
+def get_requirements_files(args):
+    """
+    :param args: parsed arguments
+    :return: files passed in, or piped pip freeze output, or requirements.txt in the current directory
+    """
+    # If a file wasn't passed in, check if pip freeze has been piped, then try to read requirements.txt
+    if args.files is None:
+        if not sys.stdin.isatty():
+            return [sys.stdin]
         else:
-            if stop_at_error:
-                sys.exit('{}={} not available on pip'.format(package_name, package_version))
-            else:
-                print(TERMINAL.red('{}={} not available on pip'.format(package_name, package_version)))
+            try:
+                return [open('requirements.txt')]
+
+            except IOError:
+                sys.exit('Default file requirements.txt not found')
 
-        # print('-----')
+    return args.files
 
 
-def get_supported_pythons(package_info):
+def snapshot_main(argv):
     """
-    Returns a list of supported python versions for a specific package version
-    :param package_info: package info dictionary, retrieved from pypi.python.org
-    :return: Versions of Python supported, may be empty
+    Builds a metadata snapshot of requirements files, for checking them later in --offline mode
+    :param argv: command line arguments following `snapshot`
+    """
+    parser = argparse.ArgumentParser('checkmyreqs snapshot', description='Manages metadata snapshots for --offline mode')
+
+    parser.add_argument('action', choices=['build'], help='build a snapshot of the packages in requirements files')
+    parser.add_argument(
+        '-f', '--files', required=False,
+        help='requirements file(s) to snapshot',
+        type=argparse.FileType(), nargs="+"
+    )
+    parser.add_argument(
+        '-o', '--output', required=False,
+        help='Snapshot file, or directory for one file per package, to write (default {})'.format(DEFAULT_SNAPSHOT),
+        default=DEFAULT_SNAPSHOT
+    )
+    add_lookup_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_backend(args)
+
+    packages = plan_lookups([parse_requirements_file(filepath) for filepath in get_requirements_files(args)])
+
+    snapshot = build_snapshot(packages, args.jobs, args.batch_size)
+    write_snapshot(snapshot, args.output)
+
+    print('Wrote snapshot of {} packages to {}'.format(len(snapshot['packages']), args.output))
+
+
+def discover_requirements(root):
+    """
+    Finds requirements files under a directory, skipping hidden directories and installed packages
+    :param root: directory to search
+    :return: sorted list of paths of requirements*.txt files, and of .txt files in requirements directories
+    """
+    paths = []
+
+    for directory, directories, filenames in os.walk(root):
+        directories[:] = [name for name in directories if not name.startswith('.') and name not in SCAN_SKIPPED_DIRS]
+
+        for filename in filenames:
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in SCAN_PATTERNS) or (
+                    os.path.basename(directory) == 'requirements' and filename.endswith('.txt')):
+                paths.append(os.path.join(directory, filename))
+
+    return sorted(paths)
+
+
+def find_repository(path, root, repositories=None):
+    """
+    :param path: path of a file under root
+    :param root: directory being scanned
+    :param repositories: dict of directories already looked at to whether they are repositories, filled in
+    :return: nearest directory above path that holds a .git directory or file, or root if there is none,
+        relative to root
+    """
+    if repositories is None:
+        repositories = {}
+
+    root = os.path.abspath(root)
+    directory = os.path.dirname(os.path.abspath(path))
+
+    while directory.startswith(root + os.sep):
+        if directory not in repositories:
+            repositories[directory] = os.path.exists(os.path.join(directory, '.git'))
+        if repositories[directory]:
+            return os.path.relpath(directory, root)
+        directory = os.path.dirname(directory)
+
+    return os.curdir
+
+
+def report_path(output, repository, root):
+    """
+    :param repository: path of a repository relative to root, from find_repository
+    :return: path of the JSON report of a repository, named after its path
+    """
+    name = repository
+    if name == os.curdir:
+        name = os.path.basename(os.path.abspath(root))
+
+    return os.path.join(output, '{}.json'.format(name.replace(os.sep, '--')))
+
+
+def scan(root, python_versions, output=DEFAULT_SCAN_OUTPUT, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Checks every requirements file under root, writing a JSON report for each repository
+    Package versions pinned in several files are only looked up once for the whole tree, so a scan costs
+    about as many lookups as there are unique pins
+
+    :param root: directory holding the repositories to scan
+    :param python_versions: list of python versions to be checked for support
+    :param output: directory the reports are written to
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :return: OrderedDict of repository paths, relative to root, to lists of their Results
+    """
+    paths = discover_requirements(root)
+    file_results = check_files(paths, python_versions, jobs, batch_size)
+
+    repositories = {}
+    repository_results = OrderedDict()
+    for path, results in zip(paths, file_results):
+        repository = find_repository(path, root, repositories)
+        repository_results.setdefault(repository, []).extend(
+            result._replace(source=os.path.relpath(result.source, os.path.join(root, repository))) for result in results
+        )
+
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    for repository, results in repository_results.items():
+        report = OrderedDict([
+            ('repository', repository),
+            ('python', python_versions),
+            ('files', list(OrderedDict.fromkeys(result.source for result in results))),
+            ('results', [OrderedDict(zip(result._fields, result)) for result in results]),
+        ])
+        with open(report_path(output, repository, root), 'w') as f:
+            json.dump(report, f, indent=1)
+
+    return repository_results
+
+
+def scan_main(argv):
+    """
+    Checks every requirements file under a directory of repositories, see scan
+    :param argv: command line arguments following `scan`
+    """
+    parser = argparse.ArgumentParser(
+        'checkmyreqs scan', description='Checks the requirements files of every repository under a directory'
+    )
+
+    parser.add_argument('root', help='directory holding the repositories to scan')
+    parser.add_argument(
+        '-p', '--python', required=False,
+        help='Version(s) of Python to check against. E.g. 2.5, or 3.8,3.10,3.12 or 3.8-3.13',
+        default='.'.join(map(str, [sys.version_info.major, sys.version_info.minor]))
+    )
+    parser.add_argument(
+        '-o', '--output', required=False,
+        help='Directory to write a JSON report per repository to (default {})'.format(DEFAULT_SCAN_OUTPUT),
+        default=DEFAULT_SCAN_OUTPUT
+    )
+    parser.add_argument(
+        '-e', '--error', required=False,
+        help='Exit with an error if any repository has warnings or errors',
+        action='store_true'
+    )
+    add_lookup_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    python_versions = parse_python_versions(args.python)
+    if not python_versions:
+        sys.exit('Python argument invalid: Must be X.Y versions or X.Y-X.Z ranges separated by commas, where X is 2 or 3')
+    if not os.path.isdir(args.root):
+        sys.exit('{} is not a directory'.format(args.root))
+
+    setup_backend(args)
+
+    repository_results = scan(args.root, python_versions, args.output, args.jobs, args.batch_size)
+
+    problems = 0
+    for repository, results in repository_results.items():
+        repository_problems = len(set((result.source, result.line) for result in results if result.status not in OK_STATUSES))
+        problems += repository_problems
+        print('{}: {} problem(s) in {} file(s)'.format(
+            repository, repository_problems, len(set(result.source for result in results))
+        ))
+
+    pins = set(
+        (result.package.lower(), result.version) for results in repository_results.values() for result in results
+        if result.status != INVALID
+    )
+    print('Scanned {} repositories, {} unique pins, reports written to {}'.format(
+        len(repository_results), len(pins), args.output
+    ))
+
+    if args.error and problems:
+        sys.exit('{} requirement(s) not compatible with every Python version checked'.format(problems))
+
+
+def run_check(files, python, stop_at_error, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE, output_format='text',
+              transitive=False, platform=None, resolver=None):
+    """
+    Checks requirements files with the metadata backend, printing the results
+    :param files: list of open requirements files
+    :param python: Python version(s) to check against, as given to -p/--python
+    :param stop_at_error: exit at the first warning or error
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request
+    :param output_format: one of OUTPUT_FORMATS
+    :param transitive: also check the releases the packages depend on
+    :param platform: platform tag to check each release has a wheel for, instead of checking classifiers
+    :param resolver: RequirementsResolver following the files' includes, defaults to one reading them from disk
+    """
+    # Make sure Python versions are in X.Y format
+    python_versions = parse_python_versions(python)
+    if not python_versions:
+        sys.exit('Python argument invalid: Must be X.Y versions or X.Y-X.Z ranges separated by commas, where X is 2 or 3')
+
+    if output_format != 'text':
+        return report_records(files, python_versions, stop_at_error, jobs, batch_size, output_format, transitive,
+                              platform, resolver)
+
+    if platform:
+        print('Checking dependencies for wheels on {} for Python {}'.format(platform, ', '.join(python_versions)))
+    else:
+        print('Checking dependencies for compatibility with Python {}'.format(', '.join(python_versions)))
+
+    # Piped input is checked as it arrives, instead of waiting for it to end
+    if files == [sys.stdin] and not transitive and not platform and resolver is None:
+        print('{0}\r\n*****'.format(sys.stdin.name))
+        check_stream(sys.stdin, python_versions, stop_at_error, jobs)
+        print('\n')
+        return
+
+    # Every package version in the run is looked up once, then each file is reported on
+    try:
+        file_results = check_files(files, python_versions, jobs, batch_size, stop_at_error, transitive, platform,
+                                   resolver)
+    except RequirementError as e:
+        sys.exit(str(e))
+
+    for filepath, results in zip(files, file_results):
+        print('{0}\r\n*****'.format(filepath.name))
+        report_results(results, python_versions, stop_at_error)
+        print('\n')
+
+    if transitive:
+        print('Dependencies\r\n*****')
+        report_dependency_results(file_results[-1], python_versions, stop_at_error)
+        print('\n')
+
+
+def result_record(result, lookup_seconds, elapsed):
+    """
+    :param result: Result to print as JSON
+    :param lookup_seconds: seconds the result's lookup took
+    :param elapsed: seconds since the check started, when the result was known
+    :return: dict of the result's fields and timings, in a stable order
+    """
+    record = OrderedDict(zip(result._fields, result))
+    record['lookup_seconds'] = round(lookup_seconds, 6)
+    record['elapsed'] = round(elapsed, 6)
+
+    return record
+
+
+def report_records(files, python_versions, stop_at_error, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE,
+                   output_format='jsonl', transitive=False, platform=None, resolver=None):
+    """
+    Prints the results of a check as JSON, see result_record
+    jsonl prints one record per line as soon as its result is known, so a pipeline can ingest them as they
+    arrive, json prints a single document once every result is known. With stop_at_error every record is
+    still printed, and the check exits with an error afterwards if any requirement had a problem.
+    As json waits for every result anyway, its lookups are batched as for text output, and each record's
+    lookup_seconds is the time they all took.
+
+    :param files: list of open requirements files
+    :param python_versions: list of python versions to be checked for support
+    :param jobs: number of concurrent pypi lookups
+    :param batch_size: number of packages fetched in each multicall request, for json
+    :param output_format: 'json' or 'jsonl'
+    :param transitive: also print records of the releases the packages depend on
+    :param platform: platform tag to check each release has a wheel for, instead of checking classifiers
+    :param resolver: RequirementsResolver following the files' includes, defaults to one reading them from disk
+    """
+    started = time.time()
+    records = []
+    problems = set()
+
+    if output_format == 'json':
+        file_results = check_files(files, python_versions, jobs, batch_size, False, transitive, platform, resolver)
+        seconds = time.time() - started
+        timed_results = ((result, seconds, seconds) for results in file_results for result in results)
+    else:
+        timed_results = iter_timed_results(files, python_versions, jobs, transitive, platform, resolver)
+
+    for result, lookup_seconds, elapsed in timed_results:
+        record = result_record(result, lookup_seconds, elapsed)
+
+        if result.status not in OK_STATUSES:
+            problems.add((result.source, result.line, result.package, result.version))
+
+        if output_format == 'jsonl':
+            print(json.dumps(record))
+            sys.stdout.flush()
+        else:
+            records.append(record)
+
+    if output_format == 'json':
+        print(json.dumps(OrderedDict([
+            ('python', python_versions),
+            ('elapsed', round(time.time() - started, 6)),
+            ('results', records),
+        ]), indent=2))
+
+    if stop_at_error and problems:
+        sys.exit('{} requirement(s) not compatible with every Python version checked'.format(len(problems)))
+
+
+def parse_address(address):
+    """
+    :param address: path of a unix socket, or [host:]port for a TCP socket on localhost
+    :return: tuple of socket family and address
+    :raises ValueError: if the host isn't localhost, as the server answers anyone who can connect
+    """
+    match = re.match(r'^(?:([\w.-]+):)?([0-9]+)$', address)
+
+    if match:
+        host = match.group(1) or '127.0.0.1'
+        if not LOOPBACK_PATTERN.match(host):
+            raise ValueError('{} is not on localhost, checks are only served on loopback addresses'.format(address))
+        return socket.AF_INET, (host, int(match.group(2)))
+
+    return socket.AF_UNIX, address
+
+
+def serve_request(request, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Runs a check for a thin client, capturing what it prints
+    Nothing is read from the server's disk on behalf of the client, -r and -c includes are read from the
+    files sent with the request, and including any other file is reported as invalid
+
+    :param request: dict of `files`, a list of [name, content] pairs, `includes`, a dict of the paths of the files
+        they include to their contents, `python`, `error`, `format`, `transitive` and `platform`, as sent by
+        check_with_server
+    :return: dict of the printed `output`, and `exit`, the code or message the check exited with
+    """
+    files = []
+    for name, content in request['files']:
+        req_file = StringIO(content)
+        req_file.name = name
+        files.append(req_file)
+
+    stdout, sys.stdout = sys.stdout, StringIO()
+    exit_status = None
+    try:
+        run_check(files, request['python'], request.get('error', False), jobs, batch_size,
+                  request.get('format', 'text'), request.get('transitive', False), request.get('platform'),
+                  RequirementsResolver(files=request.get('includes') or {}))
+    except SystemExit as e:
+        exit_status = e.code
+    finally:
+        output, sys.stdout = sys.stdout.getvalue(), stdout
+
+    return {'output': output, 'exit': exit_status}
+
+
+def handle_check_request(connection, client_address, server):
+    """
+    Reads one JSON request line from a thin client and writes back one JSON response line
+    Used as the socketserver request handler, so socketserver is only imported by `checkmyreqs serve`
+    A malformed request, or a check that fails, is answered with an error for the client to exit with
+    """
+    stream = connection.makefile('rwb')
+    try:
+        try:
+            request = json.loads(stream.readline().decode('utf-8'))
+            response = server.respond(request)
+        except Exception as e:
+            response = {'output': '', 'exit': 'checkmyreqs server could not answer the check: {}'.format(e)}
+        stream.write((json.dumps(response) + '\n').encode('utf-8'))
+        stream.flush()
+    finally:
+        stream.close()
+
+
+class CheckServerMixin(object):
+    """
+    Answers check requests for `checkmyreqs serve`, keeping metadata, release lists and responses in memory
+    Requests are answered one at a time, as checks print their results to sys.stdout, and their lookups
+    still run concurrently. Everything kept expires after `ttl` seconds, as in the disk cache.
+
+    It follows the socketserver class in the bases of a server, as SocketServer's classes are old-style on
+    Python 2, and object.__init__ would otherwise come before theirs.
+    """
+
+    def setup_check(self, jobs, batch_size, ttl):
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.responses = LRUCache(RESPONSE_CACHE_SIZE)
+        self.memo_cleared_at = time.time()
+
+    def respond(self, request):
+        now = time.time()
+
+        # RELEASE_MEMO never expires on its own, which a long running process needs
+        if now - self.memo_cleared_at > self.ttl:
+            RELEASE_MEMO.clear()
+            self.memo_cleared_at = now
+
+        key = json.dumps(request, sort_keys=True)
+        entry = self.responses.get(key)
+        if entry is not None and now - entry[1] <= self.ttl:
+            return entry[0]
+
+        response = serve_request(request, self.jobs, self.batch_size)
+        self.responses.set(key, (response, now))
+
+        return response
+
+
+def make_server(address, jobs=DEFAULT_JOBS, batch_size=DEFAULT_BATCH_SIZE, ttl=DEFAULT_CACHE_TTL):
+    """
+    :param address: path of a unix socket, or [host:]port to listen on, see parse_address
+    :return: check server bound to address
+    :raises ValueError: if address isn't on localhost
+    """
+    family, address = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        # A socket left behind by a server that didn't shut down cleanly
+        if os.path.exists(address):
+            os.remove(address)
+        directory = os.path.dirname(address)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        server_class = type('UnixCheckServer', (socketserver.UnixStreamServer, CheckServerMixin), {})
+    else:
+        server_class = type('TCPCheckServer', (socketserver.TCPServer, CheckServerMixin), {'allow_reuse_address': True})
+
+    server = server_class(address, handle_check_request)
+
+    server.setup_check(jobs, batch_size, ttl)
+
+    return server
+
+
+def check_with_server(address, files, python, stop_at_error, output_format='text', transitive=False, platform=None):
+    """
+    Sends requirements files to a running `checkmyreqs serve`, printing its results and exiting as it did
+    The files their -r and -c lines include are read here and sent along, as the server doesn't read its own disk
+    :param address: path of a unix socket, or [host:]port, see parse_address
+    :param files: list of open requirements files
+    :param python: Python version(s) to check against, as given to -p/--python
+    :param stop_at_error: exit at the first warning or error
+    :param output_format: one of OUTPUT_FORMATS
+    :param transitive: also check the releases the packages depend on
+    :param platform: platform tag to check each release has a wheel for
+    """
+    try:
+        family, address = parse_address(address)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    request_files = [[getattr(f, 'name', '<stdin>'), f.read()] for f in files]
+    resolver = RequirementsResolver()
+    for name, content in request_files:
+        for _ in resolver.resolve(iter_requirement_lines(StringIO(content), name), name):
+            pass
+
+    request = {
+        'files': request_files,
+        'includes': resolver.contents,
+        'python': python,
+        'error': stop_at_error,
+        'format': output_format,
+        'transitive': transitive,
+        'platform': platform,
+    }
+
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        connection.connect(address)
+        connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        chunks = []
+        chunk = connection.recv(65536)
+        while chunk:
+            chunks.append(chunk)
+            chunk = connection.recv(65536)
+    except socket.error as e:
+        sys.exit('Could not reach checkmyreqs server at {}: {}'.format(address, e))
+    finally:
+        connection.close()
+
+    try:
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+        output, exit_status = response['output'], response['exit']
+    except (ValueError, TypeError, KeyError):
+        sys.exit('checkmyreqs server at {} sent an invalid reply'.format(address))
+
+    sys.stdout.write(output)
+
+    if exit_status is not None:
+        sys.exit(exit_status)
+
+
+def serve_main(argv):
+    """
+    Runs a server that checks requirements for thin clients, see check_with_server
+    :param argv: command line arguments following `serve`
     """
-    versions = []
-    classifiers = package_info.get('classifiers', [])
+    parser = argparse.ArgumentParser('checkmyreqs serve', description='Checks requirements sent with --server, keeping metadata in memory')
+
+    parser.add_argument(
+        '-s', '--socket', required=False,
+        help='Unix socket, or [host:]port on localhost, to listen on (default {})'.format(DEFAULT_SOCKET),
+        default=DEFAULT_SOCKET
+    )
+    add_lookup_arguments(parser)
+
+    args = parser.parse_args(argv)
+    setup_backend(args)
 
-    for c in classifiers:
-        if c.startswith('Programming Language :: Python ::'):
-            version = c.split(' ')[-1].strip()
-            versions.append(version)
+    global METADATA_BACKEND
+    METADATA_BACKEND = MemoizedBackend(METADATA_BACKEND, args.cache_ttl)
 
-    return versions
+    try:
+        server = make_server(args.socket, args.jobs, args.batch_size, args.cache_ttl)
+    except ValueError as e:
+        parser.error(str(e))
+    print('Serving checks on {}'.format(args.socket))
 
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            os.remove(args.socket)
 
-def main():
+
+def main(argv=None):
     """
     Parses user input for requirements files and python version to check compatibility for
+    :param argv: command line arguments, defaults to sys.argv
     :return:
     """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] == 'snapshot':
+        return snapshot_main(argv[1:])
+
+    if argv and argv[0] == 'serve':
+        return serve_main(argv[1:])
+
+    if argv and argv[0] == 'scan':
+        return scan_main(argv[1:])
+
     parser = argparse.ArgumentParser('Checks a requirements file for Python version compatibility')
 
     parser.add_argument(
@@ -163,7 +4162,7 @@ def main():
     )
     parser.add_argument(
         '-p', '--python', required=False,
-        help='Version of Python to check against. E.g. 2.5',
+        help='Version(s) of Python to check against. E.g. 2.5, or 3.8,3.10,3.12 or 3.8-3.13 for a matrix',
         default='.'.join(map(str, [sys.version_info.major, sys.version_info.minor]))
     )
     parser.add_argument(
@@ -171,36 +4170,57 @@ def main():
         help='Terminate the check and throw error msg when encounter warnings or errors',
         action='store_true'
     )
+    add_lookup_arguments(parser)
+    parser.add_argument(
+        '--offline', required=False,
+        help='Answer every lookup from a snapshot built with `checkmyreqs snapshot build`, without the network',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--snapshot', required=False,
+        help='Snapshot file or directory used by --offline (default {})'.format(DEFAULT_SNAPSHOT),
+        default=DEFAULT_SNAPSHOT
+    )
+    parser.add_argument(
+        '--format', required=False, choices=OUTPUT_FORMATS, default='text',
+        help='Print coloured text, a JSON document, or JSON lines streamed as each package is checked (default text)'
+    )
+    parser.add_argument(
+        '--transitive', required=False,
+        help='Also check the releases the packages depend on, reporting which pinned packages pull them in',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--platform', required=False,
+        help='Check that each release has a wheel for CPython on this platform, e.g. manylinux_2_28_x86_64, '
+             'musllinux_1_2_aarch64, macosx_11_0_arm64 or win_amd64, instead of checking classifiers'
+    )
+    parser.add_argument(
+        '--server', required=False, nargs='?', const=DEFAULT_SOCKET,
+        help='Send the check to a running `checkmyreqs serve`, at a unix socket or [host:]port '
+             '(default {})'.format(DEFAULT_SOCKET)
+    )
 
-    args = parser.parse_args()
-
-    # If a file wasn't passed in, check if pip freeze has been piped, then try to read requirements.txt
-    if args.files is None:
-        if not sys.stdin.isatty():
-            args_files = [sys.stdin]
-        else:
-            try:
-                args_files = [open('requirements.txt')]
+    args = parser.parse_args(argv)
 
-            except IOError:
-                sys.exit('Default file requirements.txt not found')
-    else:
-        args_files = args.files
+    if args.transitive and args.platform:
+        parser.error('--transitive checks classifiers, it can\'t be combined with --platform')
 
-    stop_at_error = args.error
+    if args.transitive and args.offline:
+        parser.error('snapshots don\'t hold the packages\' dependencies, --transitive can\'t be combined with --offline')
 
-    # Make sure Python version is in X.Y format
-    if re.match('^[2-3].[0-9]$', args.python) is None:
-        sys.exit('Python argument invalid: Must be in X.Y format, where X is 2 or 3 and Y is 0-9')
+    if args.server and args.offline:
+        parser.error('the server looks packages up with its own backend, --server can\'t be combined with --offline')
 
-    print('Checking dependencies for compatibility with Python {}'.format(args.python))
+    args_files = get_requirements_files(args)
 
-    for filepath in args_files:
-        print('{0}\r\n*****'.format(filepath.name))
+    if args.server:
+        return check_with_server(args.server, args_files, args.python, args.error, args.format, args.transitive,
+                                 args.platform)
 
-        packages = parse_requirements_file(filepath, stop_at_error)
-        check_packages(packages, args.python, stop_at_error)
-        print('\n')
+    setup_backend(args, args.offline)
+    run_check(args_files, args.python, args.error, args.jobs, args.batch_size, args.format, args.transitive,
+              args.platform)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+End-to-end benchmark: checks requirements sets of 10 to 10,000 pins against a local fake pypi
+
+For each size, the oldest release of each package is pinned, so most pins need an upgrade found. Wall time,
+requests sent to the index per package and peak memory are recorded for the check, with nothing cached beforehand.
+The fake pypi runs in its own process, so it doesn't compete with the check for the GIL or count towards its memory.
+
+Run it from the repository root ::
+
+    python -m tests.benchmark --sizes 10,100,1000 --latency 0.005 --output benchmark.json
+    python -m tests.benchmark --baseline benchmark.json
+
+With --baseline, it exits with an error if a size got slower, used more memory or sent more requests than in the
+baseline, by more than --tolerance.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import checkmyreqs
+
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_PYTHON = '3.12'
+DEFAULT_TOLERANCE = 0.25
+METRICS = ('wall_time', 'requests_per_package', 'peak_memory')
+
+
+class FakePyPIProcess(object):
+    """
+    Runs tests.fakepypi in a subprocess, for the length of a with block
+    """
+
+    def __init__(self, packages, latency=0.0, error_rate=0.0):
+        self.arguments = [
+            '--packages', str(packages), '--latency', str(latency), '--error-rate', str(error_rate),
+        ]
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'tests.fakepypi'] + self.arguments, cwd=BASE_PATH, stdout=subprocess.PIPE
+        )
+        self.url = self.process.stdout.readline().decode('utf-8').strip()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def requests(self):
+        """
+        :return: number of requests the fake pypi has answered so far
+        """
+        response = urlopen(self.url.rsplit('/', 1)[0] + '/stats')
+        try:
+            return json.loads(response.read().decode('utf-8'))['requests']
+        finally:
+            response.close()
+
+
+def run_size(server, size, backend='json', python=DEFAULT_PYTHON, jobs=checkmyreqs.DEFAULT_JOBS,
+             batch_size=checkmyreqs.DEFAULT_BATCH_SIZE):
+    """
+    Checks pins of the oldest release of `size` packages, timing it
+    :param server: running FakePyPIProcess, with at least `size` packages
+    :return: dict of the size, its METRICS and the number of results
+    """
+    requirements = checkmyreqs.StringIO(u''.join(u'package{}==1.0\n'.format(number) for number in range(size)))
+    requirements.name = 'requirements-{}.txt'.format(size)
+
+    pool = checkmyreqs.ConnectionPool(size=jobs, retry=checkmyreqs.RetryPolicy(backoff=0.01))
+    checkmyreqs.METADATA_BACKEND = checkmyreqs.BACKENDS[backend](server.url, pool=pool)
+    checkmyreqs.RELEASE_MEMO.clear()
+
+    requests = server.requests()
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+
+    try:
+        results = checkmyreqs.check(requirements, python, jobs, batch_size)
+        wall_time = time.time() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if tracemalloc else None
+    finally:
+        if tracemalloc:
+            tracemalloc.stop()
+        checkmyreqs.METADATA_BACKEND = None
+        pool.close()
+
+    return {
+        'size': size,
+        'wall_time': round(wall_time, 3),
+        'requests_per_package': round(float(server.requests() - requests) / size, 3),
+        'peak_memory': peak_memory,
+        'results': len(results),
+    }
+
+
+def run_benchmark(sizes, backend='json', latency=0.0, error_rate=0.0, python=DEFAULT_PYTHON,
+                  jobs=checkmyreqs.DEFAULT_JOBS, batch_size=checkmyreqs.DEFAULT_BATCH_SIZE):
+    """
+    :return: list of run_size records, one for each size
+    """
+    with FakePyPIProcess(max(sizes), latency, error_rate) as server:
+        return [run_size(server, size, backend, python, jobs, batch_size) for size in sizes]
+
+
+def regressions(records, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    :param records: run_benchmark records
+    :param baseline: records of an earlier run
+    :param tolerance: share a metric can grow by before it is a regression
+    :return: list of messages, for each metric of a size that grew by more than tolerance
+    """
+    baseline = dict((record['size'], record) for record in baseline)
+    messages = []
+
+    for record in records:
+        previous = baseline.get(record['size'])
+        if previous is None:
+            continue
+
+        for metric in METRICS:
+            if record[metric] is None or previous.get(metric) is None:
+                continue
+            if record[metric] > previous[metric] * (1 + tolerance):
+                messages.append('{} packages: {} went from {} to {}'.format(
+                    record['size'], metric, previous[metric], record[metric]
+                ))
+
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser('benchmark', description='Benchmarks checkmyreqs against a local fake pypi')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated numbers of packages to check (default 10,100,1000,10000)')
+    parser.add_argument('--backend', choices=list(checkmyreqs.BACKENDS), default='json',
+                        help='Backend to check with (default json)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request takes (default 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503 (default 0)')
+    parser.add_argument('-p', '--python', default=DEFAULT_PYTHON, help='Python version to check (default 3.12)')
+    parser.add_argument('-j', '--jobs', type=int, default=checkmyreqs.DEFAULT_JOBS, help='Concurrent lookups')
+    parser.add_argument('--batch-size', type=int, default=checkmyreqs.DEFAULT_BATCH_SIZE, help='Packages per multicall')
+    parser.add_argument('-o', '--output', help='File to write the records to, as JSON')
+    parser.add_argument('--baseline', help='Records of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Share a metric can grow by before it is a regression (default 0.25)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    records = run_benchmark(sizes, args.backend, args.latency, args.error_rate, args.python, args.jobs, args.batch_size)
+
+    print('{:>8} {:>10} {:>14} {:>14}'.format('packages', 'seconds', 'requests/pkg', 'peak memory'))
+    for record in records:
+        print('{size:>8} {wall_time:>10} {requests_per_package:>14} {0:>14}'.format(
+            record['peak_memory'] if record['peak_memory'] is not None else '-', **record
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            messages = regressions(records, json.load(f), args.tolerance)
+        for message in messages:
+            print('Regression: {}'.format(message))
+        if messages:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""
+Local stand-in for pypi, serving synthetic metadata over the JSON API and xmlrpc
+
+Packages are named package0 to package{N-1}, and every release of a package is generated from the seed, so
+nothing is kept in memory however many packages are served. Requests can be slowed down by a fixed latency,
+and a share of them answered with 503 Service Unavailable, as pypi does when it is overloaded.
+
+Run it on its own to check against it, e.g. `python -m tests.fakepypi --packages 1000 --latency 0.01`, then
+`checkmyreqs -i http://127.0.0.1:<port>/pypi ...`
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from xmlrpc.server import SimpleXMLRPCDispatcher
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from SimpleXMLRPCServer import SimpleXMLRPCDispatcher
+
+PACKAGE_PATTERN = re.compile(r'^package([0-9]+)$')
+JSON_PATH_PATTERN = re.compile(r'^/pypi/(?P<name>[^/]+)(?:/(?P<version>[^/]+))?/json$')
+
+PY2_CLASSIFIERS = ['Programming Language :: Python :: 2', 'Programming Language :: Python :: 2.7']
+PY3_CLASSIFIERS = ['Programming Language :: Python :: 3'] + [
+    'Programming Language :: Python :: 3.{}'.format(minor) for minor in range(8, 14)
+]
+
+
+class FakePyPI(object):
+    """
+    Synthetic index of `packages` packages
+
+    Each package has between 1 and `max_releases` releases, 1.0, 1.1 and so on. Releases from first_supported on
+    support Python 3, the ones before only Python 2.7, and a tenth of the packages have no Python classifiers.
+    Releases depend on up to two packages with a lower number, and have an sdist and a pure Python wheel.
+    """
+
+    def __init__(self, packages=100, latency=0.0, error_rate=0.0, seed=0, max_releases=8):
+        self.size = packages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.max_releases = max_releases
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._dispatcher = SimpleXMLRPCDispatcher(allow_none=True, encoding=None)
+        self._dispatcher.register_multicall_functions()
+        for method in (self.package_releases, self.release_data, self.release_urls):
+            self._dispatcher.register_function(method)
+
+    def package(self, name):
+        """
+        :param name: package name
+        :return: dict of the generated package, with `releases` oldest first, `first_supported`, the index of
+            the first release supporting Python 3 (len(releases) if there is none), `unspecified` and
+            `dependencies`, or None if the index has no such package
+        """
+        match = PACKAGE_PATTERN.match(name.lower())
+        if match is None or int(match.group(1)) >= self.size:
+            return None
+
+        number = int(match.group(1))
+        generator = random.Random(self.seed * 1000003 + number)
+        count = generator.randint(1, self.max_releases)
+
+        return {
+            'name': 'package{}'.format(number),
+            'releases': ['1.{}'.format(minor) for minor in range(count)],
+            'first_supported': generator.randint(0, count),
+            'unspecified': generator.random() < 0.1,
+            'requires_python': generator.random() < 0.5,
+            'dependencies': sorted(set(
+                'package{}'.format(generator.randrange(number)) for _ in range(generator.randint(0, 2)) if number
+            )),
+        }
+
+    def first_supported(self, name):
+        """
+        :return: oldest release of a package supporting Python 3, or None if no release does
+        """
+        package = self.package(name)
+        releases = package['releases']
+
+        return releases[package['first_supported']] if package['first_supported'] < len(releases) else None
+
+    def info(self, package, version):
+        """
+        :return: release metadata of a version of a generated package, as in the JSON API and xmlrpc release_data
+        """
+        supported = package['releases'].index(version) >= package['first_supported']
+        classifiers = [] if package['unspecified'] else PY3_CLASSIFIERS if supported else PY2_CLASSIFIERS
+
+        return {
+            'name': package['name'],
+            'version': version,
+            'classifiers': classifiers,
+            'requires_python': '>=3.6' if supported and package['requires_python'] and not package['unspecified'] else '',
+            'requires_dist': ['{} (>=1.0)'.format(dependency) for dependency in package['dependencies']],
+        }
+
+    @staticmethod
+    def files(package, version, supported):
+        python = 'py3' if supported else 'py2'
+        return [
+            {'filename': '{}-{}.tar.gz'.format(package['name'], version), 'packagetype': 'sdist'},
+            {'filename': '{}-{}-{}-none-any.whl'.format(package['name'], version, python), 'packagetype': 'bdist_wheel'},
+        ]
+
+    def _release(self, name, version):
+        package = self.package(name)
+        if package is None or version not in package['releases']:
+            return None, None
+
+        supported = package['releases'].index(version) >= package['first_supported']
+
+        return self.info(package, version), self.files(package, version, supported)
+
+    # xmlrpc methods, as pypi has them
+
+    def package_releases(self, name):
+        package = self.package(name)
+        return list(reversed(package['releases'])) if package else []
+
+    def release_data(self, name, version):
+        return self._release(name, version)[0] or {}
+
+    def release_urls(self, name, version):
+        return self._release(name, version)[1] or []
+
+    def json(self, path):
+        """
+        :param path: path of a JSON API request, e.g. /pypi/package1/json or /pypi/package1/1.0/json
+        :return: decoded response, or None for a 404
+        """
+        match = JSON_PATH_PATTERN.match(path)
+        package = self.package(match.group('name')) if match else None
+        if package is None:
+            return None
+
+        version = match.group('version') or package['releases'][-1]
+        info, files = self._release(package['name'], version)
+        if info is None:
+            return None
+
+        data = {'info': info, 'urls': files}
+        if not match.group('version'):
+            data['releases'] = dict(
+                (release, self._release(package['name'], release)[1]) for release in package['releases']
+            )
+
+        return data
+
+    def redirect(self, path):
+        """
+        :param path: path of a JSON API request
+        :return: path to redirect to with a 301, as pypi does for names that differ from the package's, or None
+        """
+        match = JSON_PATH_PATTERN.match(path)
+        package = self.package(match.group('name')) if match else None
+        if package is None or match.group('name') == package['name']:
+            return None
+
+        return '/pypi/{}{}/json'.format(package['name'], '/' + match.group('version') if match.group('version') else '')
+
+    def xmlrpc(self, body):
+        return self._dispatcher._marshaled_dispatch(body)
+
+    def failed(self):
+        """
+        Counts a request, deciding whether it fails
+        :return: True if the request should be answered with a 503
+        """
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+
+        return failed
+
+    def start(self, port=0):
+        """
+        Serves the index from a background thread
+        :param port: port to listen on, on localhost, or 0 for any free port
+        :return: url of the index, to give to JsonBackend or XmlRpcBackend
+        """
+        self.server = FakePyPIServer(('127.0.0.1', port), FakePyPIHandler)
+        self.server.index = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self.url
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/pypi'.format(self.server.server_address[1])
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakePyPIHandler(BaseHTTPRequestHandler):
+    """
+    Answers JSON API requests to GET /pypi/..., redirecting names in another case to the package's own, xmlrpc
+    requests to POST /pypi, and GET /stats with the number of requests and errors so far, which isn't counted itself
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which Nagle's algorithm would hold back for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        index = self.server.index
+
+        if self.path == '/stats':
+            return self._respond(200, json.dumps({'requests': index.requests, 'errors': index.errors}), 'application/json')
+
+        if self._fail():
+            return
+
+        location = index.redirect(self.path)
+        if location is not None:
+            self.send_response(301)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        data = index.json(self.path)
+        if data is None:
+            return self._respond(404, json.dumps({'message': 'Not Found'}), 'application/json')
+
+        self._respond(200, json.dumps(data), 'application/json')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self._fail():
+            return
+
+        self._respond(200, self.server.index.xmlrpc(body), 'text/xml')
+
+    def _fail(self):
+        index = self.server.index
+
+        if index.latency:
+            time.sleep(index.latency)
+
+        if not index.failed():
+            return False
+
+        self.send_response(503)
+        self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+        return True
+
+    def _respond(self, status, body, content_type):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePyPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # Benchmarks open a connection per worker thread at once
+    request_queue_size = 128
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser('fakepypi', description='Serves synthetic pypi metadata on localhost')
+    parser.add_argument('--packages', type=int, default=100, help='Number of packages (default 100)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request takes (default 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503 (default 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed the packages are generated from (default 0)')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (default any free port)')
+    args = parser.parse_args(argv)
+
+    index = FakePyPI(args.packages, args.latency, args.error_rate, args.seed)
+    index.start(args.port)
+    print(index.url)
+    sys.stdout.flush()
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        index.stop()
+
+
+if __name__ == '__main__':
+    main()
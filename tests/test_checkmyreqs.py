@@ -4,10 +4,32 @@
 """
 Tests for the checkmyreqs package
 """
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 
 import unittest
-from checkmyreqs import parse_requirements_file
+
+import checkmyreqs
+from checkmyreqs import parse_requirements_file, check_packages, fetch_packages
+from tests import benchmark
+from tests.fakepypi import FakePyPI
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
 
@@ -55,12 +77,1413 @@ class TestRequirementFileParserTestCases(unittest.TestCase):
 
         self.assertEqual(len(packages), 0)
 
+    def test_requirement_grammar(self):
+        """
+        Specifiers, extras, markers, hashes, inline comments and continued lines are parsed into requirements
+        """
+        requirements = StringIO(
+            'Django==1.4.5  # pinned\n'
+            'requests[security, socks] >=2.0,<3 ; python_version < "3.8"\n'
+            'attrs===19.1.0 \\\n'
+            '    --hash=sha256:abc123 \\\n'
+            '    --hash sha256:def456\n'
+            'six @ https://example.com/six.whl\n'
+            '-i https://example.com/simple\n'
+            'zope.interface (==4.1)\n'
+        )
+        items = list(checkmyreqs.iter_requirement_lines(requirements, 'requirements.txt'))
+
+        self.assertEqual([(item.name, item.version, item.line) for item in items], [
+            ('Django', '1.4.5', 1), ('requests', None, 2), ('attrs', '19.1.0', 3), ('zope.interface', '4.1', 8),
+        ])
+        self.assertEqual(items[1].extras, ('security', 'socks'))
+        self.assertEqual(items[1].specifiers, (('>=', '2.0'), ('<', '3')))
+        self.assertEqual(items[1].marker, 'python_version < "3.8"')
+        self.assertEqual(items[2].hashes, ('sha256:abc123', 'sha256:def456'))
+        self.assertEqual(items[0].text, 'Django==1.4.5')
+
+    def test_rejected_lines_have_line_numbers(self):
+        """
+        Invalid lines are rejected with the file and line they were read from, and parsing carries on
+        """
+        requirements = StringIO('alpha==1==2\n\nbeta==1.0 --frobnicate\n--no-such-option\ngamma==0.1\n')
+        items = list(checkmyreqs.iter_requirement_lines(requirements, 'requirements.txt'))
+
+        self.assertEqual([str(item) for item in items[:3]], [
+            'requirements.txt:1: alpha==1==2 has an invalid version specifier ==1==2',
+            'requirements.txt:3: beta==1.0 has an unknown option --frobnicate',
+            'requirements.txt:4: --no-such-option is not a known option',
+        ])
+        self.assertEqual((items[3].name, items[3].version, items[3].line), ('gamma', '0.1', 5))
+
+    def test_includes_and_constraints(self):
+        """
+        -r and -c lines are followed relative to the including file, each file is parsed once and cycles are reported
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            files = {
+                'base.txt': 'alpha==1.0\n-c constraints/pins.txt\nbeta\n',
+                'dev.txt': '-r base.txt\nAlpha==1.0\ngamma==0.1\n',
+                'prod.txt': '--requirement=base.txt\nalpha==2.0\n',
+                'cycle.txt': '-r cycle.txt\n',
+                os.path.join('constraints', 'pins.txt'): 'beta==1.0\n',
+            }
+            os.mkdir(os.path.join(directory, 'constraints'))
+            for path, content in files.items():
+                with open(os.path.join(directory, path), 'w') as f:
+                    f.write(content)
+
+            resolver = checkmyreqs.RequirementsResolver()
+            _, dev = checkmyreqs.read_requirements(os.path.join(directory, 'dev.txt'), resolver=resolver)
+            _, prod = checkmyreqs.read_requirements(os.path.join(directory, 'prod.txt'), resolver=resolver)
+            _, cycle = checkmyreqs.read_requirements(os.path.join(directory, 'cycle.txt'), resolver=resolver)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual([(item.name, item.version) for item in dev], [('alpha', '1.0'), ('beta', '1.0'), ('gamma', '0.1')])
+        self.assertEqual(dev[0].source, os.path.join(directory, 'base.txt'))
+        self.assertIsInstance(prod[2], checkmyreqs.RequirementError)
+        self.assertIn('alpha==2.0 conflicts with alpha==1.0 at', str(prod[2]))
+        self.assertIn('is an include cycle', str(cycle[0]))
+        self.assertEqual(len(resolver._parsed), 5)
+
+    def test_large_file(self):
+        """
+        A 10k line lock file is parsed quickly
+        """
+        requirements = StringIO(''.join('package{0}[extra]=={0}.0 --hash=sha256:{0:064x}\n'.format(i) for i in range(10000)))
+        started = checkmyreqs.time.time()
+        packages = parse_requirements_file(requirements)
+
+        self.assertEqual(len(packages), 10000)
+        self.assertLess(checkmyreqs.time.time() - started, 2)
+
+
+class FakeBackend(checkmyreqs.MetadataBackend):
+    """
+    Stands in for pypi, serving metadata from a dictionary
+    Batches of calls are counted as one request
+    """
+
+    batched = True
+
+    def __init__(self, releases):
+        super(FakeBackend, self).__init__('index')
+        # releases maps package name to a list of (version, classifiers), newest first
+        self.releases = releases
+        # files maps (package name, version) to the file names of the release
+        self.files = {}
+        self.calls = []
+        self.requests = 0
+
+    def call_many(self, calls):
+        self.requests += 1
+        return [getattr(self, method)(*args) for method, args in calls]
+
+    def release_data(self, package_name, version):
+        self.calls.append(('release_data', package_name, version))
+        # A release can also list its requires_dist and requires_python, after its classifiers
+        for release in self.releases.get(package_name, []):
+            if release[0] == version:
+                return dict(zip(['classifiers', 'requires_dist', 'requires_python'], release[1:]))
+        return {}
+
+    def package_releases(self, package_name):
+        self.calls.append(('package_releases', package_name))
+        return [release[0] for release in self.releases.get(package_name, [])]
+
+    def release_files(self, package_name, version):
+        self.calls.append(('release_files', package_name, version))
+        return self.files.get((package_name, version), [])
+
+
+PY3_CLASSIFIERS = ['Programming Language :: Python :: 3', 'Programming Language :: Python :: 3.4']
+PY2_CLASSIFIERS = ['Programming Language :: Python :: 2', 'Programming Language :: Python :: 2.7']
+
 
 class TestCheckPackageTestCases(unittest.TestCase):
     """
     Test cases for checking a package
     """
-    #TODO: write test cases for the package lookup
+
+    def setUp(self):
+        self.client = FakeBackend({
+            'alpha': [('2.0', PY3_CLASSIFIERS), ('1.0', PY2_CLASSIFIERS)],
+            'beta': [('1.0', PY3_CLASSIFIERS)],
+            'gamma': [('0.2', PY3_CLASSIFIERS), ('0.1', [])],
+        })
+        self._get_backend = checkmyreqs.get_backend
+        checkmyreqs.get_backend = lambda: self.client
+        checkmyreqs.RELEASE_MEMO.clear()
+
+        self._stdout = sys.stdout
+        sys.stdout = self.output = StringIO()
+
+    def tearDown(self):
+        checkmyreqs.get_backend = self._get_backend
+        sys.stdout = self._stdout
+
+    def test_fetch_keeps_order(self):
+        """
+        Concurrent lookups return results in the order packages were given
+        """
+        packages = [('gamma', '0.1'), ('alpha', '1.0'), ('beta', '1.0')]
+        lookups = fetch_packages(packages, ['3.4'], jobs=3)
+
+        self.assertEqual([lookup[1] for lookup in lookups], [['0.2', '0.1'], ['2.0', '1.0'], ['1.0']])
+
+    def test_latest_only_fetched_when_unsupported(self):
+        """
+        The latest release is only looked up for packages that are not supported
+        """
+        fetch_packages([('beta', '1.0')], ['3.4'], jobs=1)
+
+        self.assertEqual(len(self.client.calls), 2)
+
+    def test_lookups_are_batched(self):
+        """
+        Each batch of packages costs one request, plus one for the latest releases it needs
+        """
+        packages = [('alpha', '1.0'), ('beta', '1.0'), ('gamma', '0.1'), ('delta', '1.0'), ('epsilon', '1.0')]
+        lookups = fetch_packages(packages, ['3.4'], jobs=2, batch_size=2)
+
+        self.assertEqual(len(lookups), 5)
+        self.assertEqual(lookups[0][2], {'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(lookups[2][2], {'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(self.client.requests, 5)
+
+    def test_versions_share_lookups(self):
+        """
+        Versions of the same package share their batch, release list and latest release lookups
+        """
+        packages = [('alpha', '1.0'), ('beta', '1.0'), ('alpha', '2.0'), ('alpha', '1.0')]
+        lookups = fetch_packages(packages, ['3.4'], jobs=2, batch_size=1)
+
+        self.assertEqual(lookups[0], lookups[3])
+        self.assertEqual(lookups[2], ({'classifiers': PY3_CLASSIFIERS}, ['2.0', '1.0'], None, {}))
+        self.assertEqual(sorted(self.client.calls), [
+            ('package_releases', 'alpha'), ('package_releases', 'beta'),
+            ('release_data', 'alpha', '1.0'), ('release_data', 'alpha', '2.0'), ('release_data', 'beta', '1.0'),
+        ])
+
+    def test_minimal_upgrade(self):
+        """
+        The oldest release that adds support is suggested, found by bisecting the releases newer than the pin
+        """
+        self.client.releases['delta'] = [('3.0rc1', PY3_CLASSIFIERS)] + [
+            ('2.{}'.format(minor), PY3_CLASSIFIERS if minor >= 11 else PY2_CLASSIFIERS) for minor in range(15, -1, -1)
+        ]
+        lookups = fetch_packages([('delta', '2.0'), ('alpha', '1.0')], ['2.7', '3.4'], jobs=1)
+
+        self.assertEqual(checkmyreqs.check_package(lookups[0], '3.4'), ('incompatible', '2.11'))
+        self.assertEqual(checkmyreqs.check_package(lookups[1], '3.4'), ('incompatible', '2.0'))
+        self.assertEqual(checkmyreqs.check_package(lookups[0], '2.7'), ('compatible', None))
+        # The pin, the release list, the latest release and 4 bisection steps over 15 newer releases
+        self.assertEqual(len([call for call in self.client.calls if call[1] == 'delta']), 7)
+        self.assertEqual(self.client.requests, 6)
+
+    def test_upgrade_candidates(self):
+        """
+        Candidate upgrades are the releases newer than the pin, oldest first, without pre-releases
+        """
+        releases = ['3.0rc1', '2.10', '2.9b1', '2.9', '2.0', '1.0']
+
+        self.assertEqual(checkmyreqs.upgrade_candidates('2.0', releases), ['2.9', '2.10', '3.0rc1'])
+        self.assertEqual(checkmyreqs.upgrade_candidates('3.0rc1', releases), [])
+        self.assertEqual(checkmyreqs.upgrade_candidates('1.0', []), [])
+
+    def test_plan_merges_files(self):
+        """
+        Packages pinned in several files are only looked up once
+        """
+        package_lists = [
+            checkmyreqs.OrderedDict([('alpha', '1.0'), ('beta', '1.0')]),
+            checkmyreqs.OrderedDict([('beta', '1.0'), ('alpha', '2.0')]),
+        ]
+
+        self.assertEqual(
+            checkmyreqs.plan_lookups(package_lists), [('alpha', '1.0'), ('beta', '1.0'), ('alpha', '2.0')]
+        )
+
+    def test_latest_release_is_memoized(self):
+        """
+        The release list and latest release of a package are only fetched once per process
+        """
+        fetch_packages([('alpha', '1.0')], ['3.4'], jobs=1)
+        lookups = fetch_packages([('alpha', '0.9'), ('alpha', '1.0')], ['3.4'], jobs=1)
+
+        self.assertEqual(lookups[1][2], {'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(self.client.calls, [
+            ('release_data', 'alpha', '1.0'), ('package_releases', 'alpha'), ('release_data', 'alpha', '2.0'),
+            ('release_data', 'alpha', '0.9'), ('release_data', 'alpha', '1.0'),
+        ])
+
+    def test_lru_cache(self):
+        """
+        The least recently used entry is dropped once the cache is full
+        """
+        cache = checkmyreqs.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_check_output(self):
+        """
+        Unsupported, unspecified and missing packages are reported in file order
+        """
+        packages = checkmyreqs.OrderedDict([('alpha', '1.0'), ('beta', '1.0'), ('gamma', '0.1'), ('delta', '1.0')])
+        check_packages(packages, '3.4', False, jobs=4)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('alpha=1.0 not compatible with Python 3.4 - update to v2.0 for support', lines[0])
+        self.assertIn('gamma=0.1 version not specified - update to v0.2 for explicit support', lines[1])
+        self.assertIn('delta=1.0 not available on pip', lines[2])
+
+    def test_check_matrix(self):
+        """
+        A matrix shows each package against every Python version, from a single lookup per package
+        """
+        self.client.releases['alpha'][0] = ('2.0', PY3_CLASSIFIERS + ['Programming Language :: Python :: 2.7'])
+        packages = checkmyreqs.OrderedDict([('alpha', '1.0'), ('beta', '1.0'), ('delta', '1.0')])
+        checkmyreqs.check_matrix(packages, ['2.7', '3.4'], False, jobs=1)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['package', '2.7', '3.4'])
+        self.assertEqual(lines[1].split(), ['alpha=1.0', 'yes', 'no', '-', 'update', 'to', 'v2.0', 'for', '3.4'])
+        self.assertEqual(lines[2].split(), ['beta=1.0', 'no', 'yes'])
+        self.assertEqual(lines[3].split(), ['delta=1.0', '-', '-'])
+        self.assertEqual(len(self.client.calls), 7)
+
+    def test_transitive_dependencies(self):
+        """
+        Releases pulled in by requires_dist are fetched once each and reported with the pins that need them
+        """
+        self.client.releases.update({
+            'app': [('1.0', PY3_CLASSIFIERS + PY2_CLASSIFIERS,
+                     ['lib (>=1.0)', 'legacy; python_version < "3"', 'fancy; extra == "fancy"', 'Shared'])],
+            'lib': [('2.0', PY3_CLASSIFIERS, ['shared>=1', 'app']), ('1.5', PY3_CLASSIFIERS + PY2_CLASSIFIERS)],
+            'legacy': [('1.0', PY2_CLASSIFIERS)],
+            'shared': [('1.0', PY2_CLASSIFIERS)],
+        })
+        results = checkmyreqs.check(StringIO('app==1.0\n'), ['2.7', '3.4'], jobs=2, transitive=True)
+        dependencies = [result for result in results if isinstance(result, checkmyreqs.DependencyResult)]
+
+        self.assertEqual(len(results) - len(dependencies), 2)
+        self.assertEqual([(result.package, result.version, result.python, result.status) for result in dependencies], [
+            ('lib', '2.0', '2.7', 'incompatible'), ('lib', '2.0', '3.4', 'compatible'),
+            ('legacy', '1.0', '2.7', 'compatible'),
+            ('shared', '1.0', '2.7', 'compatible'), ('shared', '1.0', '3.4', 'incompatible'),
+        ])
+        self.assertEqual(dependencies[-1].required_by, ['app==1.0'])
+        self.assertEqual(self.client.calls.count(('release_data', 'shared', '1.0')), 1)
+        self.assertNotIn(('package_releases', 'fancy'), self.client.calls)
+
+    def test_transitive_dependencies_per_python(self):
+        """
+        Dependencies are resolved on each Python version, following pins and dependencies only where their markers
+        allow, and skipping releases whose requires_python excludes the version
+        """
+        self.client.releases.update({
+            'app': [('1.0', PY3_CLASSIFIERS, ['lib>=1.0', 'modern'])],
+            'old': [('1.0', PY2_CLASSIFIERS, ['legacy'])],
+            'lib': [('2.0', PY3_CLASSIFIERS, [], '>=3.10'), ('1.5', PY3_CLASSIFIERS, [], '>=3.6'), ('1.0', PY3_CLASSIFIERS)],
+            'modern': [('1.0', PY3_CLASSIFIERS, [], '>=3.10')],
+            'legacy': [('1.0', PY2_CLASSIFIERS)],
+        })
+        requirements = StringIO('app==1.0\nold==1.0 ; python_version < "3"\n')
+        results = checkmyreqs.check(requirements, ['3.8', '3.12'], jobs=2, transitive=True)
+        dependencies = [result for result in results if isinstance(result, checkmyreqs.DependencyResult)]
+
+        self.assertEqual([(result.package, result.version, result.python, result.status) for result in dependencies], [
+            ('lib', '1.5', '3.8', 'compatible'), ('lib', '2.0', '3.12', 'compatible'),
+            ('modern', '1.0', '3.8', 'incompatible'), ('modern', '1.0', '3.12', 'compatible'),
+        ])
+        self.assertNotIn(('package_releases', 'legacy'), self.client.calls)
+        self.assertNotIn(('release_data', 'lib', '1.0'), self.client.calls)
+
+    def test_transitive_output(self):
+        """
+        Incompatible dependencies are reported after the files, with the pins that pull them in
+        """
+        self.client.releases.update({
+            'app': [('1.0', PY3_CLASSIFIERS, ['shared', 'missing'])],
+            'shared': [('1.0', PY2_CLASSIFIERS)],
+        })
+        requirements = StringIO('app==1.0\nalpha==1.0\n')
+        requirements.name = 'requirements.txt'
+        checkmyreqs.run_check([requirements], '3.4', False, jobs=1, transitive=True)
+
+        lines = self.output.getvalue().splitlines()
+        dependencies = lines.index('Dependencies')
+        self.assertIn('alpha=1.0', '\n'.join(lines[:dependencies]))
+        self.assertIn('shared=1.0 not compatible with Python 3.4 - required by app==1.0', lines[dependencies + 2])
+        self.assertIn('missing=* not available on pip - required by app==1.0', lines[dependencies + 3])
+
+    def test_markers_and_release_selection(self):
+        """
+        Environment markers are evaluated for extras and Python versions, and dependencies get the newest allowed release
+        """
+        evaluate_marker = checkmyreqs.evaluate_marker
+
+        self.assertFalse(evaluate_marker('python_version < "3"', python_version='3.4'))
+        self.assertTrue(evaluate_marker('python_version < "3"', python_version='2.7'))
+        self.assertTrue(evaluate_marker('python_version < "3"', ['socks']))
+        self.assertTrue(evaluate_marker("extra == 'Socks'", ['socks']))
+        self.assertFalse(evaluate_marker("extra == 'socks'", []))
+        self.assertFalse(evaluate_marker('platform_system == "Windows" and python_version >= "3.6"', [], '3.4'))
+        self.assertTrue(evaluate_marker('python_version >= "3.6" or sys_platform == "win32"', [], '3.4'))
+        self.assertFalse(evaluate_marker('python_version > "3.7"', python_version='3.7'))
+        self.assertTrue(evaluate_marker('python_version > "3.7"', python_version='3.10'))
+        self.assertFalse(evaluate_marker('python_version != "3.4"', python_version='3.4'))
+        self.assertTrue(evaluate_marker('python_version != "3.4"', python_version='3.5'))
+        self.assertTrue(evaluate_marker('python_full_version > "3.7.0"', python_version='3.7'))
+        self.assertFalse(evaluate_marker('python_full_version < "3.7"', python_version='3.7'))
+        self.assertTrue(evaluate_marker('"3" > python_version', python_version='2.7'))
+        self.assertTrue(evaluate_marker('python_version < "3.8" and (', python_version='3.12'))
+
+        # Parentheses group expressions, and `and` binds tighter than `or`
+        either = 'python_version < "3.8" and (extra == "a" or extra == "b")'
+        self.assertFalse(evaluate_marker(either, ['b'], '3.12'))
+        self.assertTrue(evaluate_marker(either, ['b'], '3.7'))
+        self.assertTrue(evaluate_marker('python_version < "3.8" and extra == "a" or extra == "b"', ['b'], '3.12'))
+        self.assertFalse(evaluate_marker('extra == "b" or extra == "a" and python_version < "3.8"', ['a'], '3.12'))
+        self.assertFalse(evaluate_marker('((extra == "a") or python_version<"3")and extra=="b"', ['a'], '3.12'))
+
+        select_release = checkmyreqs.select_release
+        releases = ['2.1rc1', '2.0', '1.5', '1.0']
+
+        self.assertEqual(select_release((('>=', '1.0'), ('<', '2')), releases), '1.5')
+        self.assertEqual(select_release((), releases), '2.0')
+        self.assertEqual(select_release((('>', '2.0'),), releases), '2.1rc1')
+        self.assertEqual(select_release((('~=', '1.4'),), releases), '1.5')
+        self.assertIsNone(select_release((('>=', '3'),), releases))
+
+        infos = {'2.1rc1': {'requires_python': '>=3.10'}, '2.0': {'requires_python': '>=3.10'},
+                 '1.5': {'requires_python': '>=3.6'}}
+        self.assertEqual(select_release((), releases, '3.8', infos), '1.5')
+        self.assertEqual(select_release((), releases, '3.12', infos), '2.0')
+        self.assertIsNone(select_release((('>=', '1.5'),), releases, '2.7', infos))
+
+    def test_wheel_availability(self):
+        """
+        Each pin is checked for a wheel that installs on the platform, falling back to its sdist
+        """
+        self.client.files.update({
+            ('alpha', '1.0'): ['alpha-1.0-cp34-cp34m-manylinux1_x86_64.whl', 'alpha-1.0.tar.gz'],
+            ('beta', '1.0'): ['beta-1.0-py2.py3-none-any.whl'],
+            ('gamma', '0.1'): ['gamma-0.1.zip', 'gamma-0.1-cp27-cp27mu-manylinux1_x86_64.whl'],
+            ('delta', '1.0'): ['delta-1.0-cp27-cp27m-win_amd64.whl'],
+        })
+        requirements = StringIO('alpha==1.0\nbeta==1.0\ngamma==0.1\ndelta==1.0\nepsilon==1.0\n')
+        results = checkmyreqs.check(requirements, ['2.7', '3.4'], jobs=2, platform='manylinux_2_28_x86_64')
+
+        self.assertEqual([(result.package, result.python, result.status) for result in results], [
+            ('alpha', '2.7', 'sdist-only'), ('alpha', '3.4', 'wheel-available'),
+            ('beta', '2.7', 'wheel-available'), ('beta', '3.4', 'wheel-available'),
+            ('gamma', '2.7', 'wheel-available'), ('gamma', '3.4', 'sdist-only'),
+            ('delta', '2.7', 'unavailable'), ('delta', '3.4', 'unavailable'),
+            ('epsilon', '2.7', 'unavailable'), ('epsilon', '3.4', 'unavailable'),
+        ])
+        self.assertEqual(results[-3].error, 'no sdist, and no wheel for manylinux_2_28_x86_64')
+        self.assertIsNone(results[-1].error)
+        self.assertEqual([call[0] for call in self.client.calls], ['release_files'] * 5)
+
+    def test_wheel_tags(self):
+        """
+        A platform accepts the wheels of older platform versions, and CPython accepts abi3 and pure Python wheels
+        """
+        self.assertEqual(checkmyreqs.platform_tags('manylinux2014_aarch64')[-3:],
+                         ['manylinux_2_0_aarch64', 'manylinux2014_aarch64', 'linux_aarch64'])
+        self.assertIn('manylinux2010_x86_64', checkmyreqs.platform_tags('manylinux_2_28_x86_64'))
+        self.assertNotIn('manylinux_2_29_x86_64', checkmyreqs.platform_tags('manylinux_2_28_x86_64'))
+        self.assertIn('macosx_10_9_universal2', checkmyreqs.platform_tags('macosx_12_0_arm64'))
+        self.assertEqual(checkmyreqs.platform_tags('win_amd64'), ['win_amd64'])
+
+        tags = checkmyreqs.supported_tags('3.12', 'macosx_12_0_arm64')
+        self.assertIn(('cp38', 'abi3', 'macosx_11_0_arm64'), tags)
+        self.assertIn(('py3', 'none', 'any'), tags)
+        self.assertNotIn(('cp311', 'cp311', 'macosx_11_0_arm64'), tags)
+        self.assertNotIn(('cp312', 'cp312', 'macosx_13_0_arm64'), tags)
+
+        index = checkmyreqs.WheelIndex(['pkg-1.0-2-cp38.cp39-abi3-macosx_11_0_arm64.macosx_10_9_x86_64.whl'])
+        self.assertEqual(index.support(tags), 'wheel-available')
+        self.assertEqual(index.support(checkmyreqs.supported_tags('3.7', 'macosx_12_0_arm64')), 'unavailable')
+
+    def test_stream_reports_before_input_ends(self):
+        """
+        Piped packages are reported while the rest of the input is still being read
+        """
+        output = self.output
+
+        class SlowPipe(object):
+            lines = ['alpha==1.0\n', 'delta==1.0\n', '']
+            reported = []
+
+            def readline(self):
+                self.reported.append(len(output.getvalue().splitlines()))
+                return self.lines.pop(0)
+
+        pipe = SlowPipe()
+        checkmyreqs.check_stream(pipe, ['3.4'], False, jobs=1)
+
+        self.assertEqual(pipe.reported, [0, 1, 2])
+
+    def test_stream_stops_at_error(self):
+        """
+        An invalid line stops a streamed check when stopping at errors
+        """
+        with self.assertRaises(SystemExit):
+            checkmyreqs.check_stream(StringIO('beta==1.0\nalpha\n'), ['3.4'], True, jobs=2)
+
+    def test_stream_warnings_keep_order(self):
+        """
+        Warnings for lines that can't be checked are printed between the results of the lines around them
+        """
+        checkmyreqs.check_stream(StringIO('alpha==1.0\ngamma\ngamma==0.1\n'), ['3.4'], False, jobs=4)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('alpha=1.0'))
+        self.assertIn('gamma does not have a valid version number', lines[1])
+        self.assertTrue(lines[2].startswith('gamma=0.1'))
+
+    def test_stream_skips_duplicates(self):
+        """
+        A package piped twice is only looked up once
+        """
+        checkmyreqs.check_stream(StringIO('beta==1.0\nbeta==1.0\n'), ['3.4', '3.5'], False, jobs=2)
+
+        self.assertEqual(self.client.calls, [('release_data', 'beta', '1.0'), ('package_releases', 'beta')])
+        self.assertEqual(len(self.output.getvalue().splitlines()), 4)
+
+    def test_python_versions(self):
+        """
+        Python versions can be given as a list and as ranges
+        """
+        parse = checkmyreqs.parse_python_versions
+
+        self.assertEqual(parse('3.4'), ['3.4'])
+        self.assertEqual(parse('3.8,3.10,3.12'), ['3.8', '3.10', '3.12'])
+        self.assertEqual(parse('2.7,3.8-3.11'), ['2.7', '3.8', '3.9', '3.10', '3.11'])
+        self.assertIsNone(parse('3.8-2.7'))
+        self.assertIsNone(parse('3.9-3.8'))
+        self.assertIsNone(parse('3'))
+        self.assertIsNone(parse('3.8,'))
+
+    def test_failed_lookup_is_reported(self):
+        """
+        A lookup that fails is reported for its packages, without stopping the run
+        """
+        release_data = self.client.release_data
+
+        def failing_release_data(package_name, version):
+            if package_name == 'alpha':
+                raise checkmyreqs.ProtocolError('index', 503, 'Service Unavailable', {})
+            return release_data(package_name, version)
+
+        self.client.release_data = failing_release_data
+        packages = checkmyreqs.OrderedDict([('alpha', '1.0'), ('delta', '1.0')])
+        check_packages(packages, '3.4', False, jobs=2, batch_size=1)
+
+        lines = self.output.getvalue().splitlines()
+        self.assertIn('alpha=1.0 could not be looked up: <ProtocolError for index: 503 Service Unavailable>', lines[0])
+        self.assertIn('delta=1.0 not available on pip', lines[1])
+
+    def test_check_stop_at_error(self):
+        """
+        With stop_at_error the check exits on the first problem
+        """
+        packages = checkmyreqs.OrderedDict([('beta', '1.0'), ('alpha', '1.0')])
+
+        with self.assertRaises(SystemExit):
+            check_packages(packages, '3.4', True, jobs=2)
+
+    def test_check_returns_results(self):
+        """
+        check returns a result for every requirement and Python version, with where it was read
+        """
+        requirements = StringIO('alpha==1.0\n# comment\nbeta==1.0\ngamma\n')
+        requirements.name = 'requirements.txt'
+        results = checkmyreqs.check(requirements, ['2.7', '3.4'])
+
+        self.assertEqual(self.output.getvalue(), '')
+        self.assertEqual(results, [
+            checkmyreqs.Result('compatible', 'alpha', '1.0', '2.7', None, 'requirements.txt', 1, None),
+            checkmyreqs.Result('incompatible', 'alpha', '1.0', '3.4', '2.0', 'requirements.txt', 1, None),
+            checkmyreqs.Result('incompatible', 'beta', '1.0', '2.7', None, 'requirements.txt', 3, None),
+            checkmyreqs.Result('compatible', 'beta', '1.0', '3.4', None, 'requirements.txt', 3, None),
+            checkmyreqs.Result('invalid', 'gamma', None, None, None, 'requirements.txt', 4,
+                               'does not have a valid version number'),
+        ])
+
+    def test_markers_exclude_python_versions(self):
+        """
+        A pin is only checked on the Python versions its marker applies to, by check and by the streamed records
+        """
+        requirements = StringIO('alpha==1.0 ; python_version < "3"\nbeta==1.0 ; python_version >= "3"\n')
+        requirements.name = 'requirements.txt'
+        results = checkmyreqs.check(requirements, ['2.7', '3.4'])
+
+        self.assertEqual([(result.package, result.python, result.status) for result in results], [
+            ('alpha', '2.7', 'compatible'), ('beta', '3.4', 'compatible'),
+        ])
+
+        requirements.seek(0)
+        timed = checkmyreqs.iter_timed_results([requirements], ['2.7', '3.4'], jobs=2)
+        self.assertEqual([(result.package, result.python) for result, _, _ in timed], [
+            ('alpha', '2.7'), ('beta', '3.4'),
+        ])
+
+    def test_check_rejects_invalid_input(self):
+        """
+        check raises, instead of exiting, for invalid Python versions and, when strict, invalid lines
+        """
+        with self.assertRaises(ValueError):
+            checkmyreqs.check(StringIO('alpha==1.0\n'), '3')
+
+        with self.assertRaises(checkmyreqs.RequirementError):
+            checkmyreqs.check([StringIO('alpha==1.0\n'), StringIO('beta\n')], '3.4', strict=True)
+
+        self.assertEqual(self.client.calls, [])
+
+    def test_jsonl_records(self):
+        """
+        jsonl prints one record per package and Python version, with timings and no other output
+        """
+        requirements = StringIO('alpha==1.0\ndelta==1.0\n')
+        requirements.name = 'requirements.txt'
+        checkmyreqs.run_check([requirements], '2.7,3.4', False, jobs=2, output_format='jsonl')
+
+        records = [json.loads(line) for line in self.output.getvalue().splitlines()]
+        self.assertEqual(
+            [(record['package'], record['python'], record['status'], record['line']) for record in records],
+            [('alpha', '2.7', 'compatible', 1), ('alpha', '3.4', 'incompatible', 1),
+             ('delta', '2.7', 'unavailable', 2), ('delta', '3.4', 'unavailable', 2)]
+        )
+        self.assertEqual(records[1]['upgrade'], '2.0')
+        self.assertEqual(records[1]['source'], 'requirements.txt')
+        self.assertGreaterEqual(records[3]['elapsed'], records[0]['elapsed'])
+        self.assertGreaterEqual(records[0]['lookup_seconds'], 0)
+
+    def test_json_document(self):
+        """
+        json prints a single document, and stopping at errors exits only after every result is printed
+        """
+        with self.assertRaises(SystemExit) as raised:
+            checkmyreqs.run_check([StringIO('alpha==1.0\nbeta==1.0\ngamma\n')], '3.4', True, output_format='json')
+
+        document = json.loads(self.output.getvalue())
+        self.assertEqual(document['python'], ['3.4'])
+        self.assertEqual([record['status'] for record in document['results']], ['incompatible', 'compatible', 'invalid'])
+        self.assertIn('2 requirement(s)', raised.exception.code)
+
+    def test_records_share_lookups(self):
+        """
+        Package versions pinned in several files are looked up once, in batches for json as for text output
+        """
+        requests = {}
+
+        for output_format in ('text', 'json', 'jsonl'):
+            self.client.calls = []
+            self.client.requests = 0
+            checkmyreqs.RELEASE_MEMO.clear()
+            files = [StringIO('alpha==1.0\nbeta==1.0\n'), StringIO('beta==1.0\nalpha==1.0\n')]
+            for number, req_file in enumerate(files):
+                req_file.name = 'requirements{}.txt'.format(number)
+
+            checkmyreqs.run_check(files, '3.4', False, jobs=2, output_format=output_format)
+
+            requests[output_format] = self.client.requests
+            pinned = [call for call in self.client.calls if call[0] == 'release_data' and call[2] == '1.0']
+            self.assertEqual(sorted(pinned), [('release_data', 'alpha', '1.0'), ('release_data', 'beta', '1.0')])
+
+        self.assertEqual(requests['json'], requests['text'])
+
+        records = [json.loads(line) for line in self.output.getvalue().splitlines()[-4:]]
+        self.assertEqual([record['upgrade'] for record in records], ['2.0', None, None, '2.0'])
+        self.assertEqual([record['lookup_seconds'] for record in records[2:]], [0, 0])
+
+    def test_scan_looks_up_unique_pins(self):
+        """
+        A scan finds requirements files in every repository, looks each pin up once and writes a report per repository
+        """
+        root = tempfile.mkdtemp()
+        try:
+            files = {
+                os.path.join('one', 'requirements.txt'): 'alpha==1.0\nbeta==1.0\n',
+                os.path.join('one', 'requirements', 'dev.txt'): 'beta==1.0\n',
+                os.path.join('two', 'service', 'requirements-prod.txt'): 'alpha==1.0\n',
+                os.path.join('two', 'node_modules', 'requirements.txt'): 'gamma==0.1\n',
+                os.path.join('two', 'setup.txt'): 'gamma==0.1\n',
+            }
+            for path, content in files.items():
+                directory = os.path.join(root, os.path.dirname(path))
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                with open(os.path.join(root, path), 'w') as f:
+                    f.write(content)
+            os.mkdir(os.path.join(root, 'one', '.git'))
+            os.mkdir(os.path.join(root, 'two', '.git'))
+
+            output = os.path.join(root, 'reports')
+            repositories = checkmyreqs.scan(root, ['3.4'], output, jobs=1)
+
+            self.assertEqual(list(repositories), ['one', 'two'])
+            self.assertEqual(
+                sorted(call for call in self.client.calls if call[0] == 'release_data' and call[2] == '1.0'),
+                [('release_data', 'alpha', '1.0'), ('release_data', 'beta', '1.0')]
+            )
+
+            with open(os.path.join(output, 'two.json')) as f:
+                report = json.load(f)
+            self.assertEqual(report['files'], [os.path.join('service', 'requirements-prod.txt')])
+            self.assertEqual([result['status'] for result in report['results']], ['incompatible'])
+        finally:
+            shutil.rmtree(root)
+
+
+class TestSupportedPythonsTestCases(unittest.TestCase):
+    """
+    Test cases for reading supported Python versions from classifiers
+    """
+
+    def test_classifiers(self):
+        """
+        Versions, major versions and implementations are read from classifiers
+        """
+        support = checkmyreqs.get_supported_pythons({'classifiers': [
+            'Programming Language :: Python',
+            'Programming Language :: Python :: 2.7',
+            'Programming Language :: Python :: 3',
+            'Programming Language :: Python :: 3 :: Only',
+            'Programming Language :: Python :: 3.10',
+            'Programming Language :: Python :: Implementation :: PyPy',
+            'License :: OSI Approved :: MIT License',
+        ]})
+
+        self.assertEqual(support, checkmyreqs.PythonSupport(['2.7', '3.10'], ['3'], ['PyPy']))
+        self.assertIn('3.10', support)
+        self.assertNotIn('3.1', support)
+        self.assertTrue(checkmyreqs.is_supported('3.4', support))
+        self.assertFalse(checkmyreqs.is_supported('2.6', support))
+
+    def test_no_classifiers(self):
+        """
+        Releases without Python classifiers, or missing releases, support nothing
+        """
+        self.assertFalse(checkmyreqs.get_supported_pythons({'classifiers': ['License :: OSI Approved']}))
+        self.assertFalse(checkmyreqs.get_supported_pythons({}))
+        self.assertFalse(checkmyreqs.get_supported_pythons(None))
+
+    def test_implementation_classifiers(self):
+        """
+        Implementation classifiers alone don't list supported versions, so requires_python decides
+        """
+        cpython = ['Programming Language :: Python :: Implementation :: CPython']
+
+        self.assertFalse(checkmyreqs.get_supported_pythons({'classifiers': cpython}))
+        self.assertEqual(
+            checkmyreqs.release_support({'classifiers': cpython, 'requires_python': '>=3.8'}, '3.12'),
+            checkmyreqs.COMPATIBLE
+        )
+        self.assertEqual(checkmyreqs.release_support({'classifiers': cpython}, '3.12'), checkmyreqs.UNSPECIFIED)
+
+    def test_support_is_shared(self):
+        """
+        Releases with the same classifiers share one PythonSupport
+        """
+        first = checkmyreqs.get_supported_pythons({'classifiers': PY3_CLASSIFIERS})
+        second = checkmyreqs.get_supported_pythons({'classifiers': list(PY3_CLASSIFIERS)})
+
+        self.assertIs(first, second)
+
+    def test_requires_python(self):
+        """
+        requires_python specifiers are evaluated against X.Y versions, and compiled once per distinct string
+        """
+        requires_python = checkmyreqs.get_requires_python({'requires_python': '>=2.7, !=3.0.*, !=3.1.*, <3.12.2'})
+
+        self.assertEqual([version in requires_python for version in ['2.6', '2.7', '3.0', '3.4', '3.12', '3.13']],
+                         [False, True, False, True, True, False])
+        self.assertIn('3.8', checkmyreqs.get_requires_python({'requires_python': '~=3.7'}))
+        self.assertNotIn('4.0', checkmyreqs.get_requires_python({'requires_python': '~=3.7'}))
+        self.assertIs(checkmyreqs.get_requires_python({'requires_python': ' ~=3.7'}),
+                      checkmyreqs.get_requires_python({'requires_python': '~=3.7 '}))
+        self.assertIsNone(checkmyreqs.get_requires_python({'requires_python': '>=3.*'}))
+        self.assertIsNone(checkmyreqs.get_requires_python({'requires_python': None}))
+
+    def test_requires_python_verdict(self):
+        """
+        requires_python excluding a version makes a release incompatible, and stands in for missing classifiers
+        """
+        modern = {'classifiers': [], 'requires_python': '>=3.8'}
+        legacy = {'classifiers': PY2_CLASSIFIERS + PY3_CLASSIFIERS, 'requires_python': '<3.6'}
+
+        self.assertEqual(checkmyreqs.check_package((modern, ['2.0'], None, {}), '3.9'), ('compatible', None))
+        self.assertEqual(checkmyreqs.check_package((legacy, ['2.0', '1.0'], modern, {}), '3.4'), ('compatible', None))
+        self.assertEqual(checkmyreqs.check_package((legacy, ['2.0', '1.0'], modern, {}), '3.9'), ('incompatible', '2.0'))
+        self.assertEqual(checkmyreqs.check_package((modern, ['2.0'], None, {}), '2.7'), ('incompatible', None))
+
+
+class TestMetadataCacheTestCases(unittest.TestCase):
+    """
+    Test cases for the on-disk metadata cache
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metadata.sqlite')
+        self.client = FakeBackend({'alpha': [('2.0', PY3_CLASSIFIERS), ('1.0', PY2_CLASSIFIERS)]})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_second_run_is_cached(self):
+        """
+        A second run against a fresh cache on the same file makes no calls
+        """
+        for _ in range(2):
+            cache = checkmyreqs.MetadataCache(self.path)
+            client = checkmyreqs.CachedBackend(self.client, cache)
+            client.release_data('alpha', '1.0')
+            client.release_data('beta', '1.0')
+            client.package_releases('alpha')
+            cache.close()
+
+        self.assertEqual(len(self.client.calls), 3)
+
+    def test_release_list_expires(self):
+        """
+        Release lists and missing versions are fetched again once the ttl has passed
+        """
+        cache = checkmyreqs.MetadataCache(self.path, ttl=-1)
+        client = checkmyreqs.CachedBackend(self.client, cache)
+
+        for _ in range(2):
+            client.release_data('alpha', '1.0')
+            client.release_data('beta', '1.0')
+            client.package_releases('alpha')
+        cache.close()
+
+        self.assertEqual(len(self.client.calls), 5)
+
+    def test_batch_only_sends_misses(self):
+        """
+        Batched calls answer from the cache and only send uncached calls on
+        """
+        cache = checkmyreqs.MetadataCache(self.path)
+        client = checkmyreqs.CachedBackend(self.client, cache)
+        client.release_data('alpha', '1.0')
+
+        results = client.call_many([('release_data', ('alpha', '1.0')), ('package_releases', ('alpha',))])
+        cache.close()
+
+        self.assertEqual(results, [{'classifiers': PY2_CLASSIFIERS}, ['2.0', '1.0']])
+        self.assertEqual(self.client.calls[1:], [('package_releases', 'alpha')])
+
+
+class TestSnapshotTestCases(unittest.TestCase):
+    """
+    Test cases for building snapshots and checking packages offline
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeBackend({
+            'alpha': [('2.0', PY3_CLASSIFIERS), ('1.0', PY2_CLASSIFIERS)],
+            'beta': [('1.0', PY3_CLASSIFIERS)],
+        })
+        self._get_backend = checkmyreqs.get_backend
+        checkmyreqs.get_backend = lambda: self.client
+        checkmyreqs.RELEASE_MEMO.clear()
+
+    def tearDown(self):
+        checkmyreqs.get_backend = self._get_backend
+        shutil.rmtree(self.directory)
+
+    def assertSnapshotMatches(self, path):
+        snapshot = checkmyreqs.SnapshotBackend(path)
+
+        self.assertEqual(snapshot.index_url, 'index')
+        self.assertEqual(snapshot.package_releases('Alpha'), ['2.0', '1.0'])
+        self.assertEqual(snapshot.release_data('alpha', '1.0'), {'classifiers': PY2_CLASSIFIERS})
+        self.assertEqual(snapshot.release_data('alpha', '2.0'), {'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(snapshot.release_data('beta', '1.0'), {'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(snapshot.release_data('gamma', '1.0'), {})
+        self.assertEqual(snapshot.package_releases('gamma'), [])
+
+    def test_snapshot_file(self):
+        """
+        A snapshot file holds the pinned and latest releases of every package
+        """
+        path = os.path.join(self.directory, 'snapshot.json')
+        snapshot = checkmyreqs.build_snapshot([('alpha', '1.0'), ('beta', '1.0'), ('gamma', '1.0')], jobs=1)
+        checkmyreqs.write_snapshot(snapshot, path)
+
+        self.assertSnapshotMatches(path)
+
+    def test_snapshot_directory(self):
+        """
+        A snapshot directory holds one file per package
+        """
+        snapshot = checkmyreqs.build_snapshot([('alpha', '1.0'), ('beta', '1.0'), ('gamma', '1.0')], jobs=1)
+        checkmyreqs.write_snapshot(snapshot, self.directory)
+
+        self.assertEqual(sorted(os.listdir(self.directory)), ['alpha.json', 'beta.json', 'gamma.json'])
+        self.assertSnapshotMatches(self.directory)
+
+    def test_offline_upgrade(self):
+        """
+        A snapshot holds the releases between the pin and the latest one, so offline checks suggest the same upgrade
+        """
+        self.client.releases['alpha'] = [
+            ('4.0', PY3_CLASSIFIERS), ('3.0', PY3_CLASSIFIERS), ('2.0', PY3_CLASSIFIERS), ('1.0', PY2_CLASSIFIERS),
+        ]
+        path = os.path.join(self.directory, 'snapshot.json')
+        checkmyreqs.write_snapshot(checkmyreqs.build_snapshot([('alpha', '1.0')], jobs=1), path)
+
+        online = checkmyreqs.check(StringIO('alpha==1.0\n'), '3.4,2.7')
+        snapshot = checkmyreqs.SnapshotBackend(path)
+        checkmyreqs.get_backend = lambda: snapshot
+        checkmyreqs.RELEASE_MEMO.clear()
+        offline = checkmyreqs.check(StringIO('alpha==1.0\n'), '3.4,2.7')
+
+        self.assertEqual([result.upgrade for result in online], ['2.0', None])
+        self.assertEqual(offline, online)
+
+
+class StaticJsonBackend(checkmyreqs.JsonBackend):
+    """
+    JsonBackend answering from a dictionary of paths to responses
+    """
+
+    def __init__(self, responses):
+        super(StaticJsonBackend, self).__init__()
+        self.responses = responses
+        self.paths = []
+
+    def _request(self, path, headers=None):
+        self.paths.append(path)
+        data = self.responses.get(path)
+        return (200 if data else 404), {}, data
+
+
+class TestJsonBackendTestCases(unittest.TestCase):
+    """
+    Test cases for looking packages up with the pypi JSON API
+    """
+
+    def test_version_order(self):
+        """
+        Versions sort as pip sorts them
+        """
+        versions = ['1.0', '1.0.post1', '1.0rc1', '1.0.dev0', '0.9', '1.0a2', '1.10', '1!0.1', '1.2']
+        self.assertEqual(
+            sorted(versions, key=checkmyreqs.version_key),
+            ['0.9', '1.0.dev0', '1.0a2', '1.0rc1', '1.0', '1.0.post1', '1.2', '1.10', '1!0.1']
+        )
+
+    def test_latest_release_from_release_list(self):
+        """
+        The release list response answers the latest release lookup, pre-releases are left out
+        """
+        backend = StaticJsonBackend({
+            'alpha': {'info': {'version': '2.0', 'classifiers': PY3_CLASSIFIERS},
+                      'releases': {'1.0': [], '2.0': [], '10.0b1': [], '1.5': []}},
+            'alpha/1.0': {'info': {'version': '1.0', 'classifiers': PY2_CLASSIFIERS}},
+        })
+
+        self.assertEqual(backend.package_releases('alpha'), ['2.0', '1.5', '1.0'])
+        self.assertEqual(backend.release_data('alpha', '2.0'), {'version': '2.0', 'classifiers': PY3_CLASSIFIERS})
+        self.assertEqual(backend.release_data('alpha', '1.0')['classifiers'], PY2_CLASSIFIERS)
+        self.assertEqual(backend.release_data('beta', '1.0'), {})
+        self.assertEqual(backend.package_releases('beta'), [])
+        self.assertEqual(backend.paths, ['alpha', 'alpha/1.0', 'beta/1.0', 'beta'])
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """
+    Serves {"path": ...} for every GET, keeping connections alive, and records the connections it is sent
+    Paths are served with an ETag, and 304 when the client already has it
+    """
+
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    bodies = 0
+    # Number of requests to answer with 429 Too Many Requests first
+    throttled = 0
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connections.add(self.client_address)
+
+    def do_GET(self):
+        etag = '"{}"'.format(self.path)
+
+        if JsonHandler.throttled:
+            JsonHandler.throttled -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = json.dumps({'path': self.path, 'info': {'version': '1.0'}, 'releases': {'1.0': []}}).encode('utf-8')
+        self.send_response(404 if 'missing' in self.path else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        JsonHandler.bodies += 1
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestConnectionPoolTestCases(unittest.TestCase):
+    """
+    Test cases for the pool of persistent connections
+    """
+
+    def setUp(self):
+        JsonHandler.connections = set()
+        JsonHandler.bodies = 0
+        JsonHandler.throttled = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JsonHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        """
+        Requests from several threads share at most `size` connections
+        """
+        pool = checkmyreqs.ConnectionPool(size=2)
+        backend = checkmyreqs.JsonBackend(self.url + '/pypi', pool)
+
+        threads = [threading.Thread(target=backend._get, args=('package{}'.format(i),)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(backend._get('alpha')['path'], '/pypi/alpha/json')
+        self.assertIsNone(backend._get('missing'))
+        self.assertLessEqual(len(JsonHandler.connections), 2)
+        pool.close()
+
+    def test_idle_connections_expire(self):
+        """
+        Connections idle for longer than the idle timeout are not reused
+        """
+        pool = checkmyreqs.ConnectionPool(size=2, idle_timeout=-1)
+
+        for _ in range(3):
+            status, _, _, body = pool.request('GET', self.url + '/alpha')
+            self.assertEqual(status, 200)
+
+        self.assertEqual(len(JsonHandler.connections), 3)
+
+    def test_throttled_requests_are_retried(self):
+        """
+        429 responses are retried after Retry-After, until retries run out
+        """
+        pool = checkmyreqs.ConnectionPool(retry=checkmyreqs.RetryPolicy(retries=2))
+
+        JsonHandler.throttled = 2
+        self.assertEqual(pool.request('GET', self.url + '/alpha')[0], 200)
+
+        JsonHandler.throttled = 3
+        self.assertEqual(pool.request('GET', self.url + '/alpha')[0], 429)
+        self.assertEqual(JsonHandler.bodies, 1)
+
+    def test_retry_delays(self):
+        """
+        Retries back off exponentially with jitter, or wait as long as Retry-After asks
+        """
+        policy = checkmyreqs.RetryPolicy(backoff=1, max_backoff=5)
+
+        self.assertTrue(all(0 <= policy.delay(attempt) <= min(5, 2 ** attempt) for attempt in range(6)))
+        self.assertEqual(policy.delay(0, '7'), 7)
+        self.assertEqual(policy.delay(0, 'Thu, 01 Jan 1970 00:00:00 GMT'), 0)
+        self.assertEqual(policy.delay(0, '100000'), checkmyreqs.MAX_RETRY_AFTER)
+
+    def test_rate_limit(self):
+        """
+        The token bucket spaces requests out once its burst is used up
+        """
+        bucket = checkmyreqs.TokenBucket(rate=50, burst=1)
+        started = checkmyreqs.time.time()
+        for _ in range(6):
+            bucket.acquire()
+
+        self.assertGreaterEqual(checkmyreqs.time.time() - started, 0.09)
+
+    def test_expired_release_list_is_revalidated(self):
+        """
+        An expired release list is revalidated with its ETag, and a 304 keeps the cached list
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            cache = checkmyreqs.MetadataCache(os.path.join(directory, 'metadata.sqlite'), ttl=-1)
+            backend = checkmyreqs.CachedBackend(checkmyreqs.JsonBackend(self.url + '/pypi'), cache)
+
+            for _ in range(3):
+                self.assertEqual(backend.call_many([('package_releases', ('alpha',))]), [['1.0']])
+
+            self.assertEqual(cache.get_release_list('index', 'alpha'), None)
+            self.assertEqual(cache.get_release_list(self.url + '/pypi', 'alpha')[1]['etag'], '"/pypi/alpha/json"')
+            cache.close()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(JsonHandler.bodies, 1)
+
+
+class TestServeTestCases(unittest.TestCase):
+    """
+    Test cases for `checkmyreqs serve` and its thin client
+    """
+
+    def setUp(self):
+        self.client = FakeBackend({
+            'alpha': [('2.0', PY3_CLASSIFIERS), ('1.0', PY2_CLASSIFIERS)],
+            'beta': [('1.0', PY3_CLASSIFIERS)],
+        })
+        self._get_backend = checkmyreqs.get_backend
+        backend = checkmyreqs.MemoizedBackend(self.client)
+        checkmyreqs.get_backend = lambda: backend
+        checkmyreqs.RELEASE_MEMO.clear()
+
+        self.directory = tempfile.mkdtemp()
+        self.address = os.path.join(self.directory, 'serve.sock')
+        self.server = checkmyreqs.make_server(self.address)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self._stdout = sys.stdout
+        sys.stdout = self.output = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+        checkmyreqs.get_backend = self._get_backend
+
+    def check(self, content, python='3.4', stop_at_error=False):
+        req_file = StringIO(content)
+        req_file.name = 'requirements.txt'
+        checkmyreqs.check_with_server(self.address, [req_file], python, stop_at_error)
+
+    def test_server_answers_check(self):
+        """
+        The thin client prints what the server's check printed
+        """
+        self.check('alpha==1.0\nbeta==1.0\n')
+
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'Checking dependencies for compatibility with Python 3.4')
+        self.assertIn('requirements.txt', lines[1])
+        self.assertIn('alpha=1.0 not compatible with Python 3.4 - update to v2.0 for support', lines[3])
+
+    def test_server_exits_like_check(self):
+        """
+        A check stopping at an error exits the thin client with its message
+        """
+        with self.assertRaises(SystemExit) as raised:
+            self.check('alpha==1.0\n', stop_at_error=True)
+
+        self.assertIn('alpha=1.0 not compatible with Python 3.4', raised.exception.code)
+
+    def test_metadata_stays_warm(self):
+        """
+        Repeated requests are answered from memory, without new lookups
+        """
+        self.check('alpha==1.0\nbeta==1.0\n')
+        requests = self.client.requests
+
+        self.check('alpha==1.0\nbeta==1.0\n')
+        self.check('beta==1.0\n', python='3.4,3.5')
+
+        self.assertEqual(self.client.requests, requests)
+
+    def test_parse_address(self):
+        """
+        Ports and host:port pairs are TCP addresses, anything else is a unix socket
+        """
+        self.assertEqual(checkmyreqs.parse_address('8080'), (checkmyreqs.socket.AF_INET, ('127.0.0.1', 8080)))
+        self.assertEqual(checkmyreqs.parse_address('localhost:80'), (checkmyreqs.socket.AF_INET, ('localhost', 80)))
+        self.assertEqual(checkmyreqs.parse_address('/tmp/serve.sock'), (checkmyreqs.socket.AF_UNIX, '/tmp/serve.sock'))
+
+        for address in ('0.0.0.0:9000', 'example.com:80', '10.0.0.1:8080'):
+            with self.assertRaises(ValueError):
+                checkmyreqs.parse_address(address)
+
+    def test_client_sends_includes(self):
+        """
+        Files included with -r and -c are read by the client and sent along, so a changed include is checked again
+        """
+        paths = dict((name, os.path.join(self.directory, name)) for name in ('requirements.txt', 'base.txt', 'pins.txt'))
+        with open(paths['requirements.txt'], 'w') as f:
+            f.write('-r base.txt\n-c pins.txt\nbeta\n')
+        with open(paths['pins.txt'], 'w') as f:
+            f.write('beta==1.0\n')
+
+        results = []
+        for base in ('alpha==1.0\n', 'alpha==2.0\n'):
+            with open(paths['base.txt'], 'w') as f:
+                f.write(base)
+            self.output.seek(0)
+            self.output.truncate()
+            with open(paths['requirements.txt']) as req_file:
+                checkmyreqs.check_with_server(self.address, [req_file], '3.4', False, output_format='json')
+            results.append(json.loads(self.output.getvalue())['results'])
+
+        self.assertEqual(
+            [[(result['package'], result['version'], result['status']) for result in document] for document in results],
+            [[('alpha', '1.0', 'incompatible'), ('beta', '1.0', 'compatible')],
+             [('alpha', '2.0', 'compatible'), ('beta', '1.0', 'compatible')]]
+        )
+        self.assertEqual(results[0][0]['source'], paths['base.txt'])
+
+    def test_includes_are_not_read(self):
+        """
+        The server doesn't read files from its own disk for a client, includes are reported as invalid instead
+        """
+        response = checkmyreqs.serve_request({
+            'files': [['req.txt', '-r /etc/passwd\n-c /etc/hosts\nalpha==1.0\n']], 'python': '3.4', 'format': 'json',
+        })
+        results = json.loads(response['output'])['results']
+
+        self.assertEqual([result['status'] for result in results], [checkmyreqs.INVALID] * 2 + [checkmyreqs.INCOMPATIBLE])
+        self.assertEqual([result['package'] for result in results[:2]], ['-r /etc/passwd', '-c /etc/hosts'])
+        self.assertIn('not sent with the check', results[0]['error'])
+
+    def test_malformed_request_is_answered(self):
+        """
+        A request the server can't check is answered with an error, and the server keeps serving
+        """
+        for line in (b'not json\n', b'["files"]\n', b'{"python": "3.4"}\n'):
+            connection = checkmyreqs.socket.socket(checkmyreqs.socket.AF_UNIX, checkmyreqs.socket.SOCK_STREAM)
+            try:
+                connection.connect(self.address)
+                connection.sendall(line)
+                response = json.loads(connection.makefile('rb').readline().decode('utf-8'))
+            finally:
+                connection.close()
+
+            self.assertEqual(response['output'], '')
+            self.assertIn('could not answer the check', response['exit'])
+
+        self.check('beta==1.0\n')
+        self.assertIn('Checking dependencies', self.output.getvalue())
+
+    def test_invalid_reply(self):
+        """
+        A server closing the connection without a reply makes the client exit with an error
+        """
+        address = os.path.join(self.directory, 'silent.sock')
+        listener = checkmyreqs.socket.socket(checkmyreqs.socket.AF_UNIX, checkmyreqs.socket.SOCK_STREAM)
+        listener.bind(address)
+        listener.listen(1)
+
+        def close_connection():
+            connection = listener.accept()[0]
+            connection.makefile('rb').readline()
+            connection.close()
+
+        thread = threading.Thread(target=close_connection)
+        thread.start()
+        try:
+            req_file = StringIO('beta==1.0\n')
+            req_file.name = 'requirements.txt'
+            with self.assertRaises(SystemExit) as raised:
+                checkmyreqs.check_with_server(address, [req_file], '3.4', False)
+        finally:
+            thread.join()
+            listener.close()
+
+        self.assertIn('sent an invalid reply', raised.exception.code)
+
+    def test_server_rejects_offline(self):
+        """
+        --server can't be combined with --offline, as the server checks with its own backend
+        """
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            with self.assertRaises(SystemExit):
+                checkmyreqs.main(['--server', self.address, '--offline'])
+        finally:
+            error, sys.stderr = sys.stderr.getvalue(), stderr
+
+        self.assertIn("--server can't be combined with --offline", error)
+
+
+class TestFakePyPITestCases(unittest.TestCase):
+    """
+    End-to-end checks against the local fake pypi, through the real backends and connection pool
+    """
+
+    PACKAGES = 40
+
+    def setUp(self):
+        self.index = FakePyPI(packages=self.PACKAGES, error_rate=0.2, seed=1)
+        self.url = self.index.start()
+        self.pool = checkmyreqs.ConnectionPool(retry=checkmyreqs.RetryPolicy(retries=10, backoff=0))
+        checkmyreqs.RELEASE_MEMO.clear()
+
+    def tearDown(self):
+        checkmyreqs.METADATA_BACKEND = None
+        checkmyreqs.RELEASE_MEMO.clear()
+        self.pool.close()
+        self.index.stop()
+
+    def expected(self, name):
+        """
+        :return: (status, upgrade) a pin of the oldest release of a package should get on Python 3.12
+        """
+        upgrade = self.index.first_supported(name)
+
+        if self.index.package(name)['unspecified']:
+            return checkmyreqs.UNSPECIFIED, None
+        if upgrade == '1.0':
+            return checkmyreqs.COMPATIBLE, None
+
+        return checkmyreqs.INCOMPATIBLE, upgrade
+
+    def check_backend(self, backend):
+        checkmyreqs.METADATA_BACKEND = checkmyreqs.BACKENDS[backend](self.url, pool=self.pool)
+        requirements = StringIO(u''.join(u'package{}==1.0\n'.format(number) for number in range(self.PACKAGES)))
+        requirements.name = 'requirements.txt'
+
+        results = checkmyreqs.check(requirements, '3.12', jobs=4)
+
+        self.assertEqual(len(results), self.PACKAGES)
+        self.assertEqual(
+            [(result.status, result.upgrade) for result in results],
+            [self.expected(result.package) for result in results]
+        )
+        self.assertGreater(self.index.errors, 0)
+
+    def test_json_backend(self):
+        """
+        Pins checked over the JSON API get the status and oldest upgrade of the synthetic metadata, despite 503s
+        """
+        self.check_backend('json')
+
+    def test_xmlrpc_backend(self):
+        """
+        Pins checked over xmlrpc multicalls get the same results, despite 503s
+        """
+        self.check_backend('xmlrpc')
+
+    def test_release_files(self):
+        """
+        Both backends list the files of a release, and nothing for unknown packages
+        """
+        expected = sorted(release['filename'] for release in self.index.release_urls('package3', '1.0'))
+        self.assertEqual(len(expected), 2)
+
+        for backend in checkmyreqs.BACKENDS.values():
+            backend = backend(self.url, pool=self.pool)
+            self.assertEqual(sorted(backend.release_files('package3', '1.0')), expected)
+            self.assertEqual(backend.package_releases('missing'), [])
+
+    def test_json_backend_follows_redirects(self):
+        """
+        Names in another case are redirected to the package's own, as on pypi, and the redirect is followed
+        """
+        backend = checkmyreqs.JsonBackend(self.url, pool=self.pool)
+        releases = self.index.package_releases('package3')
+
+        self.assertEqual(backend.package_releases('Package3'), releases)
+        self.assertEqual(backend.release_data('PACKAGE3', '1.0')['name'], 'package3')
+
+    def test_benchmark(self):
+        """
+        The benchmark records every metric for each size, and flags the ones that grew past the tolerance
+        """
+        records = benchmark.run_benchmark([5, 10], jobs=2)
+
+        self.assertEqual([(record['size'], record['results']) for record in records], [(5, 5), (10, 10)])
+        for record in records:
+            self.assertGreater(record['wall_time'], 0)
+            self.assertGreaterEqual(record['requests_per_package'], 1)
+
+        baseline = [dict(record, wall_time=record['wall_time'] / 2) for record in records]
+        self.assertEqual(benchmark.regressions(records, records), [])
+        self.assertEqual(len(benchmark.regressions(records, baseline)), 2)
+
+
+class TestStartupTestCases(unittest.TestCase):
+    """
+    Startup gate: importing checkmyreqs, or asking for --help, doesn't import the network, database or terminal modules
+    """
+
+    HEAVY_MODULES = set([
+        'blessings', 'curses', 'sqlite3', 'http.client', 'xmlrpc.client', 'multiprocessing.pool',
+        'email.utils', 'socketserver', 'ssl',
+    ])
+
+    def imported_modules(self, code):
+        """
+        :return: set of modules imported by running code, as reported by python -X importtime
+        """
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=os.path.dirname(BASE_PATH), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        _, importtime = process.communicate()
+
+        return set(
+            line.split('|')[-1].strip() for line in importtime.decode('utf-8').splitlines()
+            if line.startswith('import time:')
+        )
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'python -X importtime needs Python 3.7')
+    def test_import_is_lightweight(self):
+        """
+        import checkmyreqs only imports what parsing requirements needs
+        """
+        modules = self.imported_modules('import checkmyreqs')
+
+        self.assertIn('checkmyreqs', modules)
+        self.assertEqual(modules & self.HEAVY_MODULES, set())
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'python -X importtime needs Python 3.7')
+    def test_help_is_lightweight(self):
+        """
+        --help doesn't import more than argument parsing needs
+        """
+        modules = self.imported_modules('import checkmyreqs; checkmyreqs.main(["--help"])')
+
+        self.assertIn('checkmyreqs', modules)
+        self.assertEqual(modules & self.HEAVY_MODULES, set())
+
 
 if __name__ == '__main__':
     unittest.main()